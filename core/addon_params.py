@@ -3,6 +3,7 @@ import os
 import platform
 import urllib.parse
 
+from core.format_ranking import parse_decode_profile
 
 DEFAULT_MEDIA_DOWNLOAD_PATH = 'special://profile/addon_data/plugin.video.sendtokodi/downloads'
 DEFAULT_YTDLP_VERSION = 'latest'
@@ -11,8 +12,12 @@ DEFAULT_JS_RUNTIME_MODE = 'auto'
 DEFAULT_DASH_HTTPD_IDLE_TIMEOUT_SECONDS = 120
 MIN_DASH_HTTPD_IDLE_TIMEOUT_SECONDS = 10
 MAX_DASH_HTTPD_IDLE_TIMEOUT_SECONDS = 600
+DEFAULT_PLAYLIST_PREFETCH_COUNT = 2
+MAX_PLAYLIST_PREFETCH_COUNT = 10
+PREFERRED_CODECS = ('avc1', 'vp9', 'av01')
 YT_DLP_OPTIONS_QUERY_PARAM = 'yt-dlp-options'
 LEGACY_YDL_OPTS_QUERY_PARAM = 'ydlOpts'
+DECODE_PROFILE_QUERY_PARAM = 'decode-profile'
 
 
 def _parse_ydl_opts_json(raw_value):
@@ -91,6 +96,10 @@ def build_flat_playlist_item_url(plugin_url, video_url, paramstring):
         if ydl_options_raw is not None:
             query_items.append((ydl_options_param, ydl_options_raw))
 
+        decode_profile_raw = parsed_query.get(DECODE_PROFILE_QUERY_PARAM, [None])[0]
+        if decode_profile_raw is not None:
+            query_items.append((DECODE_PROFILE_QUERY_PARAM, decode_profile_raw))
+
         return plugin_url + '?' + urllib.parse.urlencode(query_items)
 
     list_item_url = plugin_url + "?" + video_url
@@ -219,6 +228,7 @@ def resolve_ytdlp_settings(handle, get_setting):
     return {
         'auto_update': auto_update,
         'version': DEFAULT_YTDLP_VERSION,
+        'zip_runtime': get_setting(handle, "ytdlp_zip_runtime") == 'true',
     }
 
 
@@ -237,3 +247,45 @@ def resolve_dash_httpd_idle_timeout(handle, get_setting):
     if timeout_seconds > MAX_DASH_HTTPD_IDLE_TIMEOUT_SECONDS:
         return MAX_DASH_HTTPD_IDLE_TIMEOUT_SECONDS
     return timeout_seconds
+
+
+def resolve_playlist_prefetch_count(handle, get_setting):
+    raw_value = (get_setting(handle, "playlist_prefetch_count") or '').strip()
+    if not raw_value:
+        return DEFAULT_PLAYLIST_PREFETCH_COUNT
+
+    try:
+        prefetch_count = int(raw_value)
+    except (TypeError, ValueError):
+        return DEFAULT_PLAYLIST_PREFETCH_COUNT
+
+    if prefetch_count < 0:
+        return 0
+    if prefetch_count > MAX_PLAYLIST_PREFETCH_COUNT:
+        return MAX_PLAYLIST_PREFETCH_COUNT
+    return prefetch_count
+
+
+def resolve_format_ranking(handle, get_setting):
+    preferred_codec = (get_setting(handle, "preferred_codec") or '').strip().lower()
+    codec_preference = (preferred_codec,) if preferred_codec in PREFERRED_CODECS else ()
+
+    try:
+        max_bitrate = int((get_setting(handle, "max_bitrate") or '').strip())
+    except (TypeError, ValueError):
+        max_bitrate = 0
+
+    return {
+        'codec_preference': codec_preference,
+        'max_bitrate': max_bitrate if max_bitrate > 0 else None,
+    }
+
+
+def resolve_decode_profile(handle, get_setting, paramstring=None):
+    decode_profile = parse_decode_profile(get_setting(handle, "decode_profile"))
+
+    # Per-request overrides replace the configured limits codec by codec
+    parsed_query = parse_query_params(paramstring)
+    if parsed_query.get('url', [None])[0]:
+        decode_profile.update(parse_decode_profile(parsed_query.get(DECODE_PROFILE_QUERY_PARAM, [None])[0]))
+    return decode_profile
@@ -1,108 +1,317 @@
+import gzip
+import hashlib
+import re
 import requests
-import struct
+from requests.adapters import HTTPAdapter, Retry
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
 from io import BytesIO
+from queue import Full, Queue
 from xml.etree.ElementTree import ElementTree, Element, SubElement
-from threading import Thread, Lock
+from threading import BoundedSemaphore, Condition, Event, Thread, Lock, current_thread
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from time import monotonic
+from socketserver import ThreadingMixIn
+from time import monotonic, time
+from urllib.parse import parse_qs, quote, urlparse
+from xml.sax.saxutils import escape as xml_escape, unescape as xml_unescape
 from uuid import uuid4
 
+from core import media_boxes
+from core.persistent_cache import PersistentLRUCache, addon_data_path
+
 
 DASH_HTTPD_IDLE_TIMEOUT_SECONDS = 120
+# Upper bound for requests processed at the same time; a connection only holds
+# a worker while it processes a request, not while it idles between requests.
+DASH_HTTPD_MAX_WORKERS = 8
+# Upper bound for open connections, idle keep-alive ones included; further
+# connections wait in the listen backlog until one is closed.
+DASH_HTTPD_MAX_CONNECTIONS = 32
+# Idle keep-alive connections are closed after this many seconds so they do
+# not hold on to a connection slot forever.
+DASH_HTTPD_KEEPALIVE_TIMEOUT_SECONDS = 30
 
 _HTTPD_STATE_LOCK = Lock()
 _HTTPD = None
 _HTTPD_THREAD = None
 _MANIFESTS = {}
+# manifest id -> Event set once the in-flight refresh of that manifest is done
+_MANIFEST_REFRESHES = {}
+
+# Manifests whose BaseURLs carry an ``expire=`` timestamp are rebuilt in the
+# background this many seconds before the earliest expiry.
+DASH_MANIFEST_REFRESH_MARGIN_SECONDS = 10 * 60
+# Minimum delay before re-attempting a failed (or still near-expiry) refresh.
+DASH_MANIFEST_REFRESH_RETRY_SECONDS = 60
+# Manifests not requested for this long are no longer refreshed proactively;
+# they are refreshed again on their next request.
+DASH_MANIFEST_PROACTIVE_REFRESH_WINDOW_SECONDS = 6 * 60 * 60
+# How long a request for an already expired manifest waits for its refresh
+DASH_MANIFEST_EXPIRED_REFRESH_WAIT_SECONDS = 30
+# Upper bound for a scheduler sleep, so wall-clock jumps are picked up.
+_REFRESH_SCHEDULER_MAX_SLEEP_SECONDS = 60
+_REFRESH_SCHEDULER_WAKEUP = Condition(_HTTPD_STATE_LOCK)
+_REFRESH_SCHEDULER_THREAD = None
+_EXPIRE_PARAM_RE = re.compile(rb'[?&;/]expire[=/](\d+)')
 _LATEST_MANIFEST_ID = None
+
+# Registered manifests hold the MPD bytes plus a refresh closure over the whole
+# yt-dlp result, so the registry is bounded. Least recently requested entries
+# are evicted first; the most recently registered manifest is always kept.
+DASH_MANIFEST_REGISTRY_MAX_ENTRIES = 32
+DASH_MANIFEST_REGISTRY_MAX_BYTES = 8 * 1024 * 1024
+DASH_MANIFEST_REGISTRY_TTL_SECONDS = 24 * 60 * 60
+_MANIFEST_EVICTIONS = 0
+
+# Segment proxy mode: BaseURLs point at /segment/<manifest id>/<representation>
+# on the local server, which streams the current upstream URL through and
+# re-resolves it via refresh_manifest() once the CDN rejects it.
+DASH_SEGMENT_PROXY_ENABLED = False
+DASH_SEGMENT_PROXY_CHUNK_BYTES = 64 * 1024
+# Chunks read from upstream ahead of the player (1 MiB with the default chunk size)
+DASH_SEGMENT_PROXY_READ_AHEAD_CHUNKS = 16
+_SEGMENT_PROXY_TIMEOUT_SECONDS = 20
+_SEGMENT_PROXY_REQUEST_HEADERS = ('Range', 'If-Range', 'User-Agent', 'Referer', 'Origin', 'Cookie', 'Accept')
+_SEGMENT_PROXY_RESPONSE_HEADERS = (
+    'Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'Last-Modified', 'ETag',
+)
+# Statuses a CDN answers with once a signed URL has expired
+_SEGMENT_PROXY_RERESOLVE_STATUSES = (403, 404, 410)
+_REPRESENTATION_BASE_URL_RE = re.compile(
+    rb'(<Representation\b[^>]*?\bid="([^"]*)"(?:(?!<Representation\b).)*?<BaseURL>)([^<]*)(</BaseURL>)',
+    re.DOTALL,
+)
+
+# All upstream requests (range probes and proxied segments) share one pooled
+# session, so representations served from the same CDN host reuse their TCP
+# and TLS connections instead of handshaking per representation.
+DASH_HTTP_POOL_HOSTS = 4
+DASH_HTTP_POOL_CONNECTIONS_PER_HOST = 8
+# Retries for connection errors and transient 429/5xx answers
+DASH_HTTP_RETRIES = 2
+_HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+_HTTP_SESSION_LOCK = Lock()
+_HTTP_SESSION = None
+
 _RANGE_REQUEST_TIMEOUT_SECONDS = 20
+_RANGE_PROBE_MAX_WORKERS = 4
+_RANGE_PROBE_INITIAL_BYTES = 1024
+_RANGE_PROBE_MAX_BYTES = 1024 * 1024
 
-def _webm_decode_int(byte):
-    # Returns size and value
-    if byte >= 128:
-        return 1, byte & 0b1111111
-    elif byte >= 64:
-        return 2, byte & 0b111111
-    elif byte >= 32:
-        return 3, byte & 0b11111
-    elif byte >= 16:
-        return 4, byte & 0b1111
-    elif byte >= 8:
-        return 5, byte & 0b111
-    elif byte >= 4:
-        return 6, byte & 0b11
-    elif byte >= 2:
-        return 7, byte & 0b1
-    return 8, 0
+# Init/index ranges only depend on the media file, so they can be reused across
+# signed URLs of the same representation.
+DASH_RANGE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+DASH_RANGE_CACHE_MAX_ENTRIES = 2000
+_RANGE_CACHE_LOCK = Lock()
+_RANGE_CACHE = None
 
-def _webm_find_init_and_index_ranges(r):
+def _needed_bytes(view, next_offset, header_len):
+    # Bytes required to read the next header, or None when the walk stopped on
+    # data that was already available (i.e. it cannot make further progress).
+    needed = next_offset + header_len
+    return needed if needed > len(view) else None
+
+def _webm_scan_ranges(data):
     # Walk over the stream and find the offset of the 'Cues' element
-    # This isn't so easy due to the EBML encoding
+    # Returns the ranges plus the number of bytes needed to continue the walk,
+    # which is None once the walk is over (found or not).
     init_range = (0,0)
     index_range = (0,0)
 
-    # Verify the EMBL signature / root element
-    signature = struct.unpack('>I', r.content[0:4])[0]
-    if signature != 0x1A45DFA3:
-        return init_range, index_range
-
-    offset = 5
-    while offset < len(r.content) - 16:
-        # Get the element ID
-        id_len, _ = _webm_decode_int(r.content[offset])
-        id = int.from_bytes(r.content[offset:offset+id_len], byteorder='big', signed=False)
-
-        # Get the size of the element
-        size_len, sz = _webm_decode_int(r.content[offset+id_len])
-        size_bytes = bytearray() + sz.to_bytes(1, 'big')
-        begin = offset + id_len + 1
-        end = offset + id_len + size_len
-        size_bytes += r.content[begin:end]
-        size = int.from_bytes(size_bytes, byteorder='big', signed=False)
-
-        # Check if we have found the 'Cues' element we are looking for
-        if id == 0x1C53BB6B:
-            init_range = (0, offset - 1)
-            index_range = (offset, offset + id_len + size_len + size - 1)
-            break
+    with memoryview(data) as view:
+        if len(view) < 4:
+            return init_range, index_range, 4
 
-        # Check if we have found the Matroska Segment, which is of unknown size,
-        # and advance through the stream to the next element
-        if id == 0x18538067:
-            offset += id_len + size_len
-        else:
-            offset += id_len + size_len + size
+        # Verify the EMBL signature / root element
+        if media_boxes.read_uint32(view, 0) != media_boxes.EBML_HEADER_ID:
+            return init_range, index_range, None
+
+        next_offset = 5
+        for element_id, offset, header_len, size in media_boxes.iter_ebml_elements(view, next_offset):
+            # Check if we have found the 'Cues' element we are looking for
+            if element_id == media_boxes.EBML_CUES_ID:
+                init_range = (0, offset - 1)
+                index_range = (offset, offset + header_len + size - 1)
+                return init_range, index_range, None
+
+            # Cues written after the media data cannot be reached with a short probe
+            if element_id == media_boxes.EBML_CLUSTER_ID:
+                return init_range, index_range, None
+
+            # The Matroska Segment is entered rather than skipped
+            next_offset = offset + header_len
+            if element_id != media_boxes.EBML_SEGMENT_ID:
+                next_offset += size
 
+        return init_range, index_range, _needed_bytes(view, next_offset, media_boxes.EBML_MAX_HEADER_LEN)
+
+def _webm_find_init_and_index_ranges(r):
+    init_range, index_range, _needed = _webm_scan_ranges(r.content)
     return init_range, index_range
 
-def _mp4_find_init_and_index_ranges(r):
+def _mp4_scan_ranges(data):
     # Walk over the stream and find the offset of the sidx box
-    # Fortunately this is much easier than webm
     init_range = (0,0)
     index_range = (0,0)
-    offset = 0
-    while offset < len(r.content) - 8:
-        box_size = max(struct.unpack('>I', r.content[offset:offset + 4])[0], 8)
-        box_type = struct.unpack('4s', r.content[offset + 4:offset + 8])[0]
-        if box_type == b"sidx":
-            init_range = (0, offset - 1)
-            index_range = (offset, offset + box_size - 1)
-            break
-        offset = offset + box_size
+
+    with memoryview(data) as view:
+        next_offset = 0
+        for box_type, offset, _header_len, size in media_boxes.iter_iso_boxes(view):
+            if box_type == media_boxes.BOX_SIDX:
+                init_range = (0, offset - 1)
+                index_range = (offset, offset + size - 1)
+                return init_range, index_range, None
+            # The index always precedes the media data
+            if box_type in (media_boxes.BOX_MOOF, media_boxes.BOX_MDAT) or size == 0:
+                return init_range, index_range, None
+            next_offset = offset + size
+
+        return init_range, index_range, _needed_bytes(view, next_offset, 16)
+
+def _mp4_find_init_and_index_ranges(r):
+    init_range, index_range, _needed = _mp4_scan_ranges(r.content)
     return init_range, index_range
 
-def find_init_and_index_ranges(url, container):
-    # Download the first 1KiB of the stream
-    size = 1024
-    r = requests.get(
+def http_session():
+    """Return the pooled session shared by all upstream requests."""
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        if _HTTP_SESSION is None:
+            retry = Retry(
+                total=DASH_HTTP_RETRIES,
+                backoff_factor=0.3,
+                status_forcelist=_HTTP_RETRY_STATUSES,
+                # Hand the last answer to the caller instead of raising
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=DASH_HTTP_POOL_HOSTS,
+                pool_maxsize=DASH_HTTP_POOL_CONNECTIONS_PER_HOST,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _HTTP_SESSION = session
+        return _HTTP_SESSION
+
+def _close_http_session():
+    global _HTTP_SESSION
+    with _HTTP_SESSION_LOCK:
+        session = _HTTP_SESSION
+        _HTTP_SESSION = None
+    if session is not None:
+        session.close()
+
+def _fetch_range(session, url, start, end, headers=None):
+    request_headers = dict(headers or {})
+    request_headers['Range'] = 'bytes={}-{}'.format(start, end)
+    r = session.get(
         url,
-        headers={'Range': 'bytes=0-' + str(size - 1)},
+        headers=request_headers,
         timeout=_RANGE_REQUEST_TIMEOUT_SECONDS,
+        stream=True,
+    )
+    try:
+        r.raise_for_status()
+        # A server ignoring the Range header answers 200 with the whole file.
+        skip = start if r.status_code != 206 else 0
+        wanted = end - start + 1
+        body = bytearray()
+        for chunk in r.iter_content(chunk_size=16384):
+            body.extend(chunk)
+            if len(body) >= skip + wanted:
+                break
+        return bytes(body[skip:skip + wanted])
+    finally:
+        r.close()
+
+def fetch_init_and_index_ranges(url, container, session=None, headers=None):
+    # Start with a small probe and only fetch further (exponentially growing)
+    # ranges while the index lies beyond the bytes seen so far. *headers* are
+    # the format's http_headers (User-Agent, Referer, Cookie, ...) which some
+    # sites require on every media request.
+    scan_ranges = _webm_scan_ranges if container == 'webm_dash' else _mp4_scan_ranges
+    if session is None:
+        session = http_session()
+
+    data = bytearray()
+    request_count = 0
+    size = _RANGE_PROBE_INITIAL_BYTES
+    while True:
+        data += _fetch_range(session, url, len(data), size - 1, headers=headers)
+        request_count += 1
+        init_range, index_range, needed = scan_ranges(data)
+        if needed is None or len(data) < size or size >= _RANGE_PROBE_MAX_BYTES:
+            break
+        size = min(max(size * 2, needed), _RANGE_PROBE_MAX_BYTES)
+
+    if index_range == (0,0):
+        raise RuntimeError(
+            "Could not locate the segment index in the first {} bytes".format(len(data))
+        )
+    return {
+        'init_range': init_range,
+        'index_range': index_range,
+        'bytes_fetched': len(data),
+        'requests': request_count,
+    }
+
+def find_init_and_index_ranges(url, container, session=None, headers=None):
+    probe = fetch_init_and_index_ranges(url, container, session=session, headers=headers)
+    return probe['init_range'], probe['index_range']
+
+def _find_format_ranges(format):
+    return find_init_and_index_ranges(
+        format['url'], format['container'], headers=format.get('http_headers')
     )
-    r.raise_for_status()
-    if container == 'webm_dash':
-        return _webm_find_init_and_index_ranges(r)
-    return _mp4_find_init_and_index_ranges(r)
+
+def probe_init_and_index_ranges(formats, max_workers=_RANGE_PROBE_MAX_WORKERS, find_ranges=None):
+    # Probe all representations concurrently. Results keep the order of *formats*
+    # and carry the exception of a failed probe instead of raising it, so callers
+    # can still report failures per format.
+    if find_ranges is None:
+        find_ranges = _find_format_ranges
+
+    def probe(format):
+        try:
+            return find_ranges(format), None
+        except Exception as exc:
+            return None, exc
+
+    formats = list(formats)
+    workers = max(1, min(max_workers, len(formats)))
+    if workers == 1:
+        return [probe(format) for format in formats]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(probe, formats))
+
+def _range_cache():
+    global _RANGE_CACHE
+    with _RANGE_CACHE_LOCK:
+        if _RANGE_CACHE is None:
+            _RANGE_CACHE = PersistentLRUCache(
+                addon_data_path('dash_range_cache.json'),
+                max_entries=DASH_RANGE_CACHE_MAX_ENTRIES,
+                ttl_seconds=DASH_RANGE_CACHE_TTL_SECONDS,
+            )
+        return _RANGE_CACHE
+
+def _url_query_value(url, name):
+    if not url:
+        return None
+    values = parse_qs(urlparse(url).query).get(name)
+    return values[0] if values else None
+
+def range_cache_key(media_id, format):
+    # Identify the media file itself rather than its (expiring) URL. Without a
+    # content length we cannot tell re-encodes apart, so such formats are not cached.
+    format_id = format.get('format_id')
+    size = format.get('filesize') or _url_query_value(format.get('url'), 'clen')
+    if not media_id or not format_id or not size:
+        return None
+    return '{}:{}:{}'.format(media_id, format_id, size)
 
 def _iso8601_duration(secs):
     m, s = divmod(secs, 60)
@@ -115,7 +324,8 @@ def transform_url(url):
 
 
 class Manifest():
-    def __init__(self, duration):
+    def __init__(self, duration, media_id=None):
+        self.media_id = media_id
         self.mpd = Element('MPD')
         self.mpd.set('xmlns', 'urn:mpeg:DASH:schema:MPD:2011')
         self.mpd.set('profiles', 'urn:mpeg:dash:profile:isoff-main:2011')
@@ -146,6 +356,48 @@ class Manifest():
         self.video_set_role.set('value', 'main')
 
         self.tree = ElementTree(self.mpd)
+        self._probed_ranges = {}
+
+    def _find_ranges(self, format):
+        cache_key = range_cache_key(self.media_id, format)
+        if cache_key is not None:
+            cached = _range_cache().get(cache_key)
+            if cached is not None:
+                return tuple(cached[0]), tuple(cached[1])
+
+        ranges = _find_format_ranges(format)
+        if cache_key is not None:
+            _range_cache().put(cache_key, [list(ranges[0]), list(ranges[1])])
+        return ranges
+
+    def prefetch_ranges(self, formats):
+        formats = list(formats)
+        probed_ranges = probe_init_and_index_ranges(formats, find_ranges=self._find_ranges)
+        for format, probed in zip(formats, probed_ranges):
+            url = format.get('url')
+            if url is not None:
+                self._probed_ranges[url] = probed
+
+    def _ranges_for_format(self, format):
+        probed = self._probed_ranges.pop(format['url'], None)
+        if probed is None:
+            return self._find_ranges(format)
+
+        ranges, error = probed
+        if error is not None:
+            raise error
+        return ranges
+
+    def _add_segment_base(self, rep, format):
+        base_url = SubElement(rep, 'BaseURL')
+        base_url.text = format['url']
+
+        init_range, idx_range = self._ranges_for_format(format)
+        segment_base = SubElement(rep, 'SegmentBase')
+        segment_base.set('indexRange', '{}-{}'.format(idx_range[0], idx_range[1]))
+
+        init = SubElement(segment_base, 'Initialization')
+        init.set('range', '{}-{}'.format(init_range[0], init_range[1]))
 
     def add_audio_format(self, format):
         rep = SubElement(self.audio_set, 'Representation')
@@ -162,16 +414,7 @@ class Manifest():
         channels.set('schemeIdUri', 'urn:mpeg:dash:23003:3:audio_channel_configuration:2011')
         channels.set('value', str(format['audio_channels']))
 
-        url = format['url']
-        base_url = SubElement(rep, 'BaseURL')
-        base_url.text = url
-
-        init_range, idx_range = find_init_and_index_ranges(url, format['container'])
-        segment_base = SubElement(rep, 'SegmentBase')
-        segment_base.set('indexRange', '{}-{}'.format(idx_range[0], idx_range[1]))
-
-        init = SubElement(segment_base, 'Initialization')
-        init.set('range', '{}-{}'.format(init_range[0], init_range[1]))
+        self._add_segment_base(rep, format)
 
     def add_video_format(self, format):
         rep = SubElement(self.video_set, 'Representation')
@@ -187,18 +430,11 @@ class Manifest():
         if kbps is not None:
             rep.set('bandwidth', str(int(kbps * 1000)))
 
-        url = format['url']
-        base_url = SubElement(rep, 'BaseURL')
-        base_url.text = url
-
-        init_range, idx_range = find_init_and_index_ranges(url, format['container'])
-        segment_base = SubElement(rep, 'SegmentBase')
-        segment_base.set('indexRange', '{}-{}'.format(idx_range[0], idx_range[1]))
-
-        init = SubElement(segment_base, 'Initialization')
-        init.set('range', '{}-{}'.format(init_range[0], init_range[1]))
+        self._add_segment_base(rep, format)
 
     def emit(self):
+        if self.media_id:
+            _range_cache().flush()
         try:
             from xml.etree.ElementTree import indent
             indent(self.tree)
@@ -211,17 +447,42 @@ class Manifest():
 
 
 class HttpHandler(BaseHTTPRequestHandler):
+    # inputstream.adaptive re-requests the manifest on the same connection, so
+    # keep it open instead of paying a new TCP handshake per poll.
+    protocol_version = 'HTTP/1.1'
+    timeout = DASH_HTTPD_KEEPALIVE_TIMEOUT_SECONDS
+
+    def handle_one_request(self):
+        self._holds_worker = False
+        try:
+            BaseHTTPRequestHandler.handle_one_request(self)
+        finally:
+            if self._holds_worker:
+                self._holds_worker = False
+                self.server._workers.release()
+
+    def parse_request(self):
+        if not BaseHTTPRequestHandler.parse_request(self):
+            return False
+        # Take a worker only once a request has arrived, so idle keep-alive
+        # connections cannot starve manifest requests.
+        workers = getattr(self.server, '_workers', None)
+        if workers is not None:
+            workers.acquire()
+            self._holds_worker = True
+        return True
+
     def log_message(self, _format, *_args):
         # BaseHTTPRequestHandler writes to stderr by default, which Kodi surfaces
         # as error <general>. Suppress noisy per-request logs for local manifest
         # serving to avoid false error reports during normal playback.
         return
 
-    def _resolve_manifest_payload(self):
+    def _resolve_manifest(self):
         # Preserve compatibility for direct handler tests where mpd is set on self.
         local_manifest = getattr(self, 'mpd', None)
         if local_manifest is not None:
-            return bytes(local_manifest)
+            return _manifest_representation(local_manifest)
 
         path = self.path.split('?', 1)[0]
         if path == '/manifest.mpd':
@@ -241,65 +502,541 @@ class HttpHandler(BaseHTTPRequestHandler):
                 return None
             refresh_manifest = entry.get('refresh_manifest')
             refreshed_at = entry.get('refreshed_at', 0)
+            expires_at = entry.get('expires_at')
 
-        now = monotonic()
-        refreshed_payload = None
-        should_refresh = (
-            refresh_manifest is not None
-            and now - refreshed_at >= DASH_HTTPD_IDLE_TIMEOUT_SECONDS
-        )
-        if should_refresh:
-            try:
-                refreshed = refresh_manifest()
-            except Exception:
-                refreshed = None
-            if refreshed is not None:
-                refreshed_payload = bytes(refreshed)
+        if refresh_manifest is not None and _needs_refresh(refreshed_at, expires_at):
+            # Stale-while-revalidate: keep serving the current manifest while
+            # it is rebuilt, unless its URLs have already expired.
+            done = _start_refresh(manifest_id, refresh_manifest)
+            if expires_at is not None and time() >= expires_at:
+                # Bounded, so a hung re-extraction cannot pin a server worker;
+                # the expired manifest is served if the refresh is not done.
+                done.wait(DASH_MANIFEST_EXPIRED_REFRESH_WAIT_SECONDS)
 
         with _HTTPD_STATE_LOCK:
             entry = _MANIFESTS.get(manifest_id)
             if entry is None:
                 return None
 
-            if refreshed_payload is not None:
-                entry['manifest'] = refreshed_payload
-                entry['refreshed_at'] = now
+            entry['last_access_at'] = monotonic()
+            return {key: entry[key] for key in _REPRESENTATION_KEYS}
+
+    def _resolve_manifest_payload(self):
+        representation = HttpHandler._resolve_manifest(self)
+        return None if representation is None else representation['manifest']
 
-            entry['last_access_at'] = now
-            return entry['manifest']
+    def _send_not_found(self):
+        self.send_response(404, 'Not Found')
+        # Keep-alive clients need an explicit empty body.
+        self.send_header('Content-Length', '0')
+        self.end_headers()
 
-    def do_HEAD(self):
-        payload = HttpHandler._resolve_manifest_payload(self)
-        if payload is None:
-            self.send_response(404, 'Not Found')
+    def _send_manifest(self, include_body):
+        representation = HttpHandler._resolve_manifest(self)
+        if representation is None:
+            HttpHandler._send_not_found(self)
+            return
+
+        headers = getattr(self, 'headers', None) or {}
+        etag = representation['etag']
+        if _etag_matches(headers.get('If-None-Match'), etag):
+            self.send_response(304, 'Not Modified')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
             self.end_headers()
             return
 
+        payload = representation['manifest']
+        use_gzip = _accepts_gzip(headers.get('Accept-Encoding'))
+        if use_gzip:
+            payload = representation['gzip']
+
         self.send_response(200, 'OK')
         self.send_header('Content-type', 'application/dash+xml')
         self.send_header('Content-Length', str(len(payload)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(representation['modified_at'], usegmt=True))
+        # The manifest may be refreshed at any time, so clients must revalidate.
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
         self.end_headers()
+        if include_body:
+            self.wfile.write(payload)
 
-    def do_GET(self):
-        payload = HttpHandler._resolve_manifest_payload(self)
-        if payload is None:
-            self.send_response(404, 'Not Found')
+    def _send_segment(self, include_body):
+        parts = self.path.split('?', 1)[0].split('/')
+        if len(parts) != 4:
+            HttpHandler._send_not_found(self)
+            return
+        manifest_id, rep_key = parts[2], parts[3]
+
+        headers = {'Accept-Encoding': 'identity'}
+        for name in _SEGMENT_PROXY_REQUEST_HEADERS:
+            value = self.headers.get(name)
+            if value:
+                headers[name] = value
+
+        try:
+            response = _open_segment_upstream('GET' if include_body else 'HEAD', manifest_id, rep_key, headers)
+        except requests.RequestException:
+            _record_segment_stats(manifest_id, rep_key, errors=1)
+            self.send_response(502, 'Bad Gateway')
+            self.send_header('Content-Length', '0')
             self.end_headers()
             return
+        if response is None:
+            HttpHandler._send_not_found(self)
+            return
+
+        started = monotonic()
+        written = 0
+        failed = False
+        body = None
+        try:
+            self.send_response(response.status_code, response.reason)
+            for name in _SEGMENT_PROXY_RESPONSE_HEADERS:
+                value = response.headers.get(name)
+                if value:
+                    self.send_header(name, value)
+            if 'Content-Length' not in response.headers:
+                self.close_connection = True
+            self.end_headers()
+
+            if include_body:
+                # The reader thread owns the response from here on and closes
+                # it once it stopped reading.
+                chunks = response.iter_content(DASH_SEGMENT_PROXY_CHUNK_BYTES)
+                body = read_ahead(chunks, DASH_SEGMENT_PROXY_READ_AHEAD_CHUNKS, on_done=response.close)
+                for chunk in body:
+                    self.wfile.write(chunk)
+                    written += len(chunk)
+        except OSError:
+            # Player went away or upstream broke off; the body is incomplete
+            # so the connection cannot be reused.
+            self.close_connection = True
+            failed = True
+        finally:
+            if body is not None:
+                body.close()
+            else:
+                response.close()
+            _record_segment_stats(
+                manifest_id,
+                rep_key,
+                requests=1,
+                bytes=written,
+                seconds=monotonic() - started,
+                errors=1 if failed or response.status_code >= 400 else 0,
+            )
+
+    def do_HEAD(self):
+        if getattr(self, 'path', '').startswith('/segment/'):
+            HttpHandler._send_segment(self, include_body=False)
+            return
+        HttpHandler._send_manifest(self, include_body=False)
+
+    def do_GET(self):
+        if getattr(self, 'path', '').startswith('/segment/'):
+            HttpHandler._send_segment(self, include_body=True)
+            return
+        HttpHandler._send_manifest(self, include_body=True)
+
+
+_REPRESENTATION_KEYS = ('manifest', 'etag', 'gzip', 'modified_at')
+_STORED_PAYLOAD_KEYS = ('manifest', 'gzip')
 
-        self.send_response(200, 'OK')
-        self.send_header('Content-type', 'application/dash+xml')
-        self.send_header('Content-Length', str(len(payload)))
-        self.end_headers()
-        self.wfile.write(payload)
 
+def _manifest_representation(manifest, segment_url_prefix=None):
+    # Everything a response needs, computed once per manifest version
+    manifest = bytes(manifest)
+    representation = {'expires_at': manifest_expires_at(manifest)}
+    if segment_url_prefix is not None:
+        manifest, representation['segments'] = proxy_segment_urls(manifest, segment_url_prefix)
 
-def _handle_request(httpd):
+    representation.update({
+        'manifest': manifest,
+        'etag': '"{}"'.format(hashlib.sha1(manifest).hexdigest()),
+        'gzip': gzip.compress(manifest, mtime=0),
+        'modified_at': time(),
+    })
+    return representation
+
+
+def proxy_segment_urls(manifest, segment_url_prefix):
+    """
+    Point every Representation's BaseURL at *segment_url_prefix* + key.
+
+    Returns the rewritten manifest and a ``{key: upstream_url}`` mapping. Keys
+    are derived from the Representation ids, so they stay the same when a
+    refreshed manifest for the same media is rewritten.
+    """
+    segments = {}
+
+    def replace(match):
+        base_key = quote(match.group(2).decode('utf-8'), safe='')
+        key = base_key
+        suffix = 2
+        while key in segments:
+            key = '{}-{}'.format(base_key, suffix)
+            suffix += 1
+
+        segments[key] = xml_unescape(match.group(3).decode('utf-8'))
+        proxied_url = xml_escape(segment_url_prefix + key).encode('utf-8')
+        return match.group(1) + proxied_url + match.group(4)
+
+    return _REPRESENTATION_BASE_URL_RE.sub(replace, bytes(manifest)), segments
+
+
+def _segment_upstream(manifest_id, rep_key):
+    with _HTTPD_STATE_LOCK:
+        entry = _MANIFESTS.get(manifest_id)
+        if entry is None:
+            return None, None
+        entry['last_access_at'] = monotonic()
+        return entry.get('segments', {}).get(rep_key), entry.get('refresh_manifest')
+
+
+def _open_segment_upstream(method, manifest_id, rep_key, headers):
+    url, refresh_manifest = _segment_upstream(manifest_id, rep_key)
+    if url is None:
+        return None
+
+    session = http_session()
+    response = session.request(
+        method, url, headers=headers, stream=True, timeout=_SEGMENT_PROXY_TIMEOUT_SECONDS
+    )
+    if response.status_code not in _SEGMENT_PROXY_RERESOLVE_STATUSES or refresh_manifest is None:
+        return response
+
+    # The signed URL most likely expired: rebuild the manifest (shared with
+    # any refresh already in flight) and retry once with the new URL.
+    response.close()
+    _record_segment_stats(manifest_id, rep_key, reresolves=1)
+    if not _start_refresh(manifest_id, refresh_manifest).wait(_SEGMENT_PROXY_TIMEOUT_SECONDS):
+        # Do not pin a server worker on a hung re-extraction
+        raise requests.Timeout('Timed out re-resolving segment {}/{}'.format(manifest_id, rep_key))
+    url, _ = _segment_upstream(manifest_id, rep_key)
+    if url is None:
+        return None
+    return session.request(
+        method, url, headers=headers, stream=True, timeout=_SEGMENT_PROXY_TIMEOUT_SECONDS
+    )
+
+
+def read_ahead(chunks, max_chunks, on_done=None):
+    """
+    Yield the items of *chunks* while a background thread reads at most
+    *max_chunks* items ahead of the consumer.
+
+    Exceptions raised by *chunks* are re-raised in the consumer. Closing the
+    generator early stops the reader. *on_done* is called on the reader thread
+    once it no longer touches *chunks*, which makes it the place to release
+    the underlying response.
+    """
+    buffer = Queue(maxsize=max_chunks)
+    stopped = Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(('chunk', chunk)):
+                    return
+        except Exception as exc:
+            put(('error', exc))
+            return
+        finally:
+            if on_done is not None:
+                on_done()
+        put(('end', None))
+
+    reader = Thread(target=produce)
+    reader.daemon = True
+    reader.start()
     try:
         while True:
-            httpd.handle_request()
-    except TimeoutError:
-        return
+            kind, value = buffer.get()
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stopped.set()
+
+
+def _record_segment_stats(manifest_id, rep_key, **counters):
+    with _HTTPD_STATE_LOCK:
+        entry = _MANIFESTS.get(manifest_id)
+        if entry is None:
+            return
+        stats = entry.setdefault('segment_stats', {}).setdefault(rep_key, {
+            'requests': 0,
+            'bytes': 0,
+            'seconds': 0.0,
+            'errors': 0,
+            'reresolves': 0,
+        })
+        for name, value in counters.items():
+            stats[name] += value
+
+
+def get_segment_proxy_stats(manifest_id):
+    """
+    Return per-representation proxy counters of a manifest, including the
+    observed throughput in bytes per second.
+    """
+    with _HTTPD_STATE_LOCK:
+        entry = _MANIFESTS.get(manifest_id) or {}
+        stats = {key: dict(values) for key, values in entry.get('segment_stats', {}).items()}
+
+    for values in stats.values():
+        values['bytes_per_second'] = values['bytes'] / values['seconds'] if values['seconds'] > 0 else 0.0
+    return stats
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or 'W/' + etag in tags
+
+
+def _accepts_gzip(accept_encoding):
+    for token in (accept_encoding or '').split(','):
+        coding, _, params = token.strip().partition(';')
+        if coding.strip().lower() != 'gzip':
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def manifest_expires_at(manifest):
+    """
+    Return the earliest ``expire=`` timestamp (unix time) found in the
+    manifest's URLs, or None when the URLs do not advertise an expiry.
+    """
+    expiries = [int(value) for value in _EXPIRE_PARAM_RE.findall(bytes(manifest))]
+    return min(expiries) if expiries else None
+
+
+def _refresh_due_at(expires_at, now):
+    if expires_at is None:
+        return None
+    return max(expires_at - DASH_MANIFEST_REFRESH_MARGIN_SECONDS, now + DASH_MANIFEST_REFRESH_RETRY_SECONDS)
+
+
+def _needs_refresh(refreshed_at, expires_at):
+    if monotonic() - refreshed_at >= DASH_HTTPD_IDLE_TIMEOUT_SECONDS:
+        return True
+    return expires_at is not None and time() >= expires_at - DASH_MANIFEST_REFRESH_MARGIN_SECONDS
+
+
+def _start_refresh(manifest_id, refresh_manifest):
+    """
+    Rebuild a manifest on a background thread and return an Event that is set
+    once the rebuild finished.
+
+    Only one refresh per manifest id runs at a time; callers arriving while
+    one is in flight get the Event of that refresh.
+    """
+    with _HTTPD_STATE_LOCK:
+        in_flight = _MANIFEST_REFRESHES.get(manifest_id)
+        if in_flight is not None:
+            return in_flight
+
+        done = Event()
+        _MANIFEST_REFRESHES[manifest_id] = done
+
+    thread = Thread(target=_run_refresh, args=(manifest_id, refresh_manifest, done))
+    thread.daemon = True
+    thread.start()
+    return done
+
+
+def _run_refresh(manifest_id, refresh_manifest, done):
+    try:
+        try:
+            refreshed = refresh_manifest()
+        except Exception:
+            refreshed = None
+
+        with _HTTPD_STATE_LOCK:
+            segment_url_prefix = _MANIFESTS.get(manifest_id, {}).get('segment_url_prefix')
+        representation = None
+        if refreshed is not None:
+            representation = _manifest_representation(refreshed, segment_url_prefix)
+
+        with _HTTPD_STATE_LOCK:
+            entry = _MANIFESTS.get(manifest_id)
+            if entry is not None:
+                if representation is not None:
+                    entry.update(representation)
+                    entry['refreshed_at'] = monotonic()
+                entry['refresh_due_at'] = _refresh_due_at(entry.get('expires_at'), time())
+                _REFRESH_SCHEDULER_WAKEUP.notify_all()
+    finally:
+        with _HTTPD_STATE_LOCK:
+            _MANIFEST_REFRESHES.pop(manifest_id, None)
+        done.set()
+
+
+def _entry_bytes(entry):
+    # Every payload kept per manifest counts towards the registry budget
+    size = sum(len(entry.get(key) or b'') for key in _STORED_PAYLOAD_KEYS)
+    for key, url in (entry.get('segments') or {}).items():
+        size += len(key) + len(url)
+    return size
+
+
+def _evict_manifests():
+    # Must be called with _HTTPD_STATE_LOCK held
+    global _MANIFEST_EVICTIONS
+    now = monotonic()
+    candidates = sorted(
+        (entry.get('last_access_at', 0), manifest_id)
+        for manifest_id, entry in _MANIFESTS.items()
+        if manifest_id != _LATEST_MANIFEST_ID
+    )
+    total_bytes = sum(_entry_bytes(entry) for entry in _MANIFESTS.values())
+
+    for last_access_at, manifest_id in candidates:
+        over_limit = (
+            len(_MANIFESTS) > DASH_MANIFEST_REGISTRY_MAX_ENTRIES
+            or total_bytes > DASH_MANIFEST_REGISTRY_MAX_BYTES
+        )
+        if not over_limit and now - last_access_at <= DASH_MANIFEST_REGISTRY_TTL_SECONDS:
+            # Candidates are sorted oldest first, so all others are fresher
+            break
+
+        entry = _MANIFESTS.pop(manifest_id)
+        total_bytes -= _entry_bytes(entry)
+        _MANIFEST_EVICTIONS += 1
+
+
+def get_manifest_registry_stats():
+    """Return the number of registered manifests, their size and the eviction count."""
+    with _HTTPD_STATE_LOCK:
+        return {
+            'entries': len(_MANIFESTS),
+            'bytes': sum(_entry_bytes(entry) for entry in _MANIFESTS.values()),
+            'evictions': _MANIFEST_EVICTIONS,
+        }
+
+
+def _run_due_refreshes(now=None):
+    """
+    Start background refreshes for manifests that are close to expiry.
+
+    Returns the Events of the refreshes that were started.
+    """
+    now = time() if now is None else now
+    due = []
+    with _HTTPD_STATE_LOCK:
+        _evict_manifests()
+        for manifest_id, entry in _MANIFESTS.items():
+            refresh_due_at = entry.get('refresh_due_at')
+            if refresh_due_at is None or refresh_due_at > now:
+                continue
+
+            # Picked up again by the request path if it is ever played again
+            entry['refresh_due_at'] = None
+            idle = monotonic() - entry.get('last_access_at', 0)
+            if entry.get('refresh_manifest') is not None and idle <= DASH_MANIFEST_PROACTIVE_REFRESH_WINDOW_SECONDS:
+                due.append((manifest_id, entry['refresh_manifest']))
+
+    return [_start_refresh(manifest_id, refresh_manifest) for manifest_id, refresh_manifest in due]
+
+
+def _next_refresh_due_at():
+    # Must be called with _HTTPD_STATE_LOCK held
+    due_times = [
+        entry['refresh_due_at']
+        for entry in _MANIFESTS.values()
+        if entry.get('refresh_due_at') is not None
+    ]
+    return min(due_times) if due_times else None
+
+
+def _refresh_scheduler_loop():
+    while True:
+        _run_due_refreshes()
+        with _REFRESH_SCHEDULER_WAKEUP:
+            # Stop once the scheduler was reset and possibly replaced
+            if _REFRESH_SCHEDULER_THREAD is not current_thread():
+                return
+            next_due_at = _next_refresh_due_at()
+            timeout = _REFRESH_SCHEDULER_MAX_SLEEP_SECONDS
+            if next_due_at is not None:
+                timeout = min(max(next_due_at - time(), 0), timeout)
+            if timeout > 0:
+                _REFRESH_SCHEDULER_WAKEUP.wait(timeout)
+
+
+def _ensure_refresh_scheduler_started():
+    global _REFRESH_SCHEDULER_THREAD
+    with _HTTPD_STATE_LOCK:
+        if _REFRESH_SCHEDULER_THREAD is not None:
+            _REFRESH_SCHEDULER_WAKEUP.notify_all()
+            return
+
+        thread = Thread(target=_refresh_scheduler_loop)
+        thread.daemon = True
+        thread.start()
+        _REFRESH_SCHEDULER_THREAD = thread
+
+
+class ManifestHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Loopback HTTP server handling each connection on its own daemon thread.
+
+    At most *max_connections* connections are open at once; the accept loop
+    waits for one to close before picking up the next connection. Handlers
+    based on HttpHandler additionally hold one of *max_workers* workers while
+    they process a request.
+    """
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, server_address, handler_class, max_workers=DASH_HTTPD_MAX_WORKERS,
+                 max_connections=DASH_HTTPD_MAX_CONNECTIONS):
+        self._workers = BoundedSemaphore(max_workers)
+        self._connections = BoundedSemaphore(max_connections)
+        HTTPServer.__init__(self, server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        self._connections.acquire()
+        try:
+            ThreadingMixIn.process_request(self, request, client_address)
+        except Exception:
+            self._connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            self._connections.release()
+
 
 def _ensure_httpd_started():
     global _HTTPD, _HTTPD_THREAD
@@ -308,13 +1045,9 @@ def _ensure_httpd_started():
             return _HTTPD
 
         server_address = ('127.0.0.1', 0)
-        httpd = HTTPServer(server_address, HttpHandler)
-        # Keep server thread alive and periodically return from handle_request
-        # to avoid a permanently blocking accept call.
-        httpd.timeout = 1
-        httpd.handle_timeout = lambda: None
+        httpd = ManifestHTTPServer(server_address, HttpHandler)
 
-        thread = Thread(target=_handle_request, args=(httpd,))
+        thread = Thread(target=httpd.serve_forever, kwargs={'poll_interval': 1})
         thread.daemon = True
         thread.start()
 
@@ -323,30 +1056,56 @@ def _ensure_httpd_started():
         return _HTTPD
 
 
-def _register_manifest(manifest, refresh_manifest=None):
+def _register_manifest(manifest, refresh_manifest=None, proxy_port=None):
     global _LATEST_MANIFEST_ID
     manifest_id = uuid4().hex
+    segment_url_prefix = None
+    if proxy_port is not None:
+        segment_url_prefix = 'http://127.0.0.1:{}/segment/{}/'.format(proxy_port, manifest_id)
+    entry = _manifest_representation(manifest, segment_url_prefix)
+    entry.update({
+        'segment_url_prefix': segment_url_prefix,
+        'refresh_manifest': refresh_manifest,
+        'refreshed_at': monotonic(),
+        'last_access_at': monotonic(),
+        'refresh_due_at': _refresh_due_at(entry['expires_at'], time()) if refresh_manifest is not None else None,
+    })
     with _HTTPD_STATE_LOCK:
-        _MANIFESTS[manifest_id] = {
-            'manifest': bytes(manifest),
-            'refresh_manifest': refresh_manifest,
-            'refreshed_at': monotonic(),
-            'last_access_at': monotonic(),
-        }
+        _MANIFESTS[manifest_id] = entry
         _LATEST_MANIFEST_ID = manifest_id
+        _evict_manifests()
     return manifest_id
 
 
 def start_httpd(manifest, refresh_manifest=None):
     httpd = _ensure_httpd_started()
-    manifest_id = _register_manifest(manifest, refresh_manifest=refresh_manifest)
+    proxy_port = httpd.server_port if DASH_SEGMENT_PROXY_ENABLED else None
+    manifest_id = _register_manifest(manifest, refresh_manifest=refresh_manifest, proxy_port=proxy_port)
+    with _HTTPD_STATE_LOCK:
+        refresh_due_at = _MANIFESTS.get(manifest_id, {}).get('refresh_due_at')
+    if refresh_manifest is not None and refresh_due_at is not None:
+        _ensure_refresh_scheduler_started()
     return "http://127.0.0.1:{}/manifest/{}.mpd".format(httpd.server_port, manifest_id)
 
 
 def _reset_httpd_state_for_tests():
-    global _HTTPD, _HTTPD_THREAD, _MANIFESTS, _LATEST_MANIFEST_ID
+    global _HTTPD, _HTTPD_THREAD, _MANIFESTS, _MANIFEST_REFRESHES, _LATEST_MANIFEST_ID, _MANIFEST_EVICTIONS
+    global _REFRESH_SCHEDULER_THREAD
     with _HTTPD_STATE_LOCK:
+        _MANIFEST_EVICTIONS = 0
+        _REFRESH_SCHEDULER_THREAD = None
+        _REFRESH_SCHEDULER_WAKEUP.notify_all()
+        httpd = _HTTPD
+        thread = _HTTPD_THREAD
         _HTTPD = None
         _HTTPD_THREAD = None
         _MANIFESTS = {}
+        _MANIFEST_REFRESHES = {}
         _LATEST_MANIFEST_ID = None
+
+    # Pooled upstream connections must not leak into the next test
+    _close_http_session()
+
+    if isinstance(httpd, ManifestHTTPServer) and isinstance(thread, Thread) and thread.is_alive():
+        httpd.shutdown()
+        httpd.server_close()
@@ -27,8 +27,8 @@ import time
 import urllib.request
 import urllib.error
 import zipfile
-import io
 import logging
+from core.runtime_download import download_file, fetch_published_sha256
 from core.runtime_update_state import (
     apply_failure_state,
     apply_success_state,
@@ -55,6 +55,10 @@ _RELEASE_URL = (
     "https://github.com/denoland/deno/releases/download/{version}/{filename}"
 )
 
+# Each release asset has a "<asset>.sha256sum" companion
+_CHECKSUM_SUFFIX = ".sha256sum"
+_COPY_BUFFER_SIZE = 65536  # 64 KiB
+
 # Map (system, machine) -> release asset filename (without version prefix)
 _PLATFORM_MAP = {
     ("linux",   "x86_64"):  "deno-x86_64-unknown-linux-gnu.zip",
@@ -174,6 +178,10 @@ def _binary_path_for_version(version):
     return os.path.join(_runtime_dir_for_version(version), _deno_binary_name())
 
 
+def _archive_path_for_version(version, filename):
+    return os.path.join(_versions_dir(), "{}-{}".format(version, filename))
+
+
 def _find_runtime_for_version(version):
     runtime_path = _binary_path_for_version(version)
     if os.path.isfile(runtime_path) and os.access(runtime_path, os.X_OK):
@@ -432,54 +440,59 @@ def _download_deno(show_progress=True, version=None):
         except Exception:
             progress = None
 
-    try:
-        with urllib.request.urlopen(url, timeout=60) as response:
-            total = int(response.headers.get("Content-Length", 0))
-            downloaded = 0
-            chunks = []
-            chunk_size = 65536  # 64 KiB
-            while True:
-                chunk = response.read(chunk_size)
-                if not chunk:
-                    break
-                chunks.append(chunk)
-                downloaded += len(chunk)
-                if progress is not None and total > 0:
-                    pct = int(downloaded * 100 / total)
-                    progress.update(
-                        pct,
-                        "Downloading Deno {} ({}/{} MB)…".format(
-                            target_version,
-                            downloaded // (1024 * 1024),
-                            total // (1024 * 1024),
-                        ),
-                    )
-            data = b"".join(chunks)
-    finally:
-        if progress is not None:
-            progress.close()
-
-    # Extract the zip — it contains a single "deno" (or "deno.exe") binary
+    # The archive goes to disk (resuming a partial download left by an
+    # earlier attempt); only a 64 KiB chunk is held in memory
+    archive_path = _archive_path_for_version(target_version, filename)
     runtime_dir = _runtime_dir_for_version(target_version)
     tmp_runtime_dir = runtime_dir + ".tmp"
-    if os.path.isdir(tmp_runtime_dir):
-        shutil.rmtree(tmp_runtime_dir)
-    os.makedirs(tmp_runtime_dir, exist_ok=True)
-
-    with zipfile.ZipFile(io.BytesIO(data)) as zf:
-        binary_name = _deno_binary_name()
-        # The zip may contain the binary at the root or in a subdirectory
-        candidates = [n for n in zf.namelist()
-                      if os.path.basename(n) == binary_name]
-        if not candidates:
-            raise RuntimeError(
-                "Could not find {} inside the downloaded zip".format(binary_name)
+
+    def report_progress(downloaded, total):
+        if progress is not None and total:
+            pct = int(downloaded * 100 / total)
+            progress.update(
+                pct,
+                "Downloading Deno {} ({}/{} MB)…".format(
+                    target_version,
+                    downloaded // (1024 * 1024),
+                    total // (1024 * 1024),
+                ),
             )
-        # Use the first (usually only) match
-        member = candidates[0]
-        dest = os.path.join(tmp_runtime_dir, binary_name)
-        with zf.open(member) as src, open(dest, "wb") as dst:
-            dst.write(src.read())
+
+    try:
+        try:
+            expected_sha256 = fetch_published_sha256(url + _CHECKSUM_SUFFIX, filename)
+            download_file(url, archive_path, expected_sha256=expected_sha256, on_progress=report_progress)
+        finally:
+            if progress is not None:
+                progress.close()
+
+        # Extract the zip — it contains a single "deno" (or "deno.exe") binary
+        if os.path.isdir(tmp_runtime_dir):
+            shutil.rmtree(tmp_runtime_dir)
+        os.makedirs(tmp_runtime_dir, exist_ok=True)
+
+        with zipfile.ZipFile(archive_path) as zf:
+            binary_name = _deno_binary_name()
+            # The zip may contain the binary at the root or in a subdirectory
+            candidates = [n for n in zf.namelist()
+                          if os.path.basename(n) == binary_name]
+            if not candidates:
+                raise RuntimeError(
+                    "Could not find {} inside the downloaded zip".format(binary_name)
+                )
+            # Use the first (usually only) match
+            member = candidates[0]
+            dest = os.path.join(tmp_runtime_dir, binary_name)
+            with zf.open(member) as src, open(dest, "wb") as dst:
+                shutil.copyfileobj(src, dst, _COPY_BUFFER_SIZE)
+    except Exception:
+        shutil.rmtree(tmp_runtime_dir, ignore_errors=True)
+        raise
+    finally:
+        try:
+            os.remove(archive_path)
+        except OSError:
+            pass
 
     # Ensure the binary is executable on POSIX systems
     if platform.system().lower() != "windows":
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+URL routing index so only the extractors matching a URL are registered.
+
+``add_default_info_extractors()`` imports and registers every yt-dlp
+extractor, which costs seconds on slow devices. The index maps the host names
+found in each extractor's ``_VALID_URL`` to the extractor classes (kept in
+yt-dlp's own order). It is built once per managed yt-dlp version, the first
+time the default extractors are loaded anyway, and stored next to that
+runtime. URLs the index cannot route confidently keep using the defaults.
+"""
+
+import importlib
+import json
+import os
+import re
+import sys
+from threading import Lock
+from urllib.parse import urlsplit
+
+EXTRACTOR_INDEX_FORMAT = 1
+
+_GENERIC_EXTRACTOR_NAME = 'GenericIE'
+_HOST_RE = re.compile(r'(?<![\w-])((?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,})(?![\w-])')
+
+# path -> loaded index (or None when missing/invalid)
+_LOADED_INDEXES = {}
+_BUILD_LOCK = Lock()
+
+
+def valid_url_hosts(valid_url):
+    """Return the literal host names in a ``_VALID_URL`` pattern (or list of patterns)."""
+    patterns = valid_url if isinstance(valid_url, (list, tuple)) else [valid_url]
+    hosts = set()
+    for pattern in patterns:
+        if not isinstance(pattern, str):
+            continue
+        for host in _HOST_RE.findall(pattern.replace('\\.', '.').lower()):
+            hosts.add(host[4:] if host.startswith('www.') else host)
+    return hosts
+
+
+def _extractor_module(extractor):
+    # yt-dlp's lazy extractors keep the real module in _module
+    return getattr(extractor, '_module', None) or extractor.__module__
+
+
+def build_extractor_index(extractor_classes, version):
+    extractors = []
+    hosts = {}
+    for position, extractor in enumerate(extractor_classes):
+        extractors.append([_extractor_module(extractor), extractor.__name__])
+        for host in valid_url_hosts(getattr(extractor, '_VALID_URL', None)):
+            hosts.setdefault(host, []).append(position)
+
+    return {
+        'format': EXTRACTOR_INDEX_FORMAT,
+        'version': version,
+        'extractors': extractors,
+        'hosts': hosts,
+    }
+
+
+def load_extractor_index(path):
+    if path in _LOADED_INDEXES:
+        return _LOADED_INDEXES[path]
+
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except Exception:
+        index = None
+
+    if not isinstance(index, dict) or index.get('format') != EXTRACTOR_INDEX_FORMAT:
+        index = None
+    _LOADED_INDEXES[path] = index
+    return index
+
+
+def save_extractor_index(path, index):
+    try:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        return False
+    _LOADED_INDEXES[path] = index
+    return True
+
+
+def _host_suffixes(host):
+    labels = host.split('.')
+    return ['.'.join(labels[i:]) for i in range(len(labels) - 1)]
+
+
+def _load_extractor_class(module_name, class_name):
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def route_extractor_classes(index, url):
+    """
+    Return the extractor classes for *url* in yt-dlp order with Generic
+    last, or None when the index has no extractor that accepts the URL.
+    """
+    host = (urlsplit(url).hostname or '').lower()
+    positions = set()
+    for suffix in _host_suffixes(host):
+        positions.update(index['hosts'].get(suffix, ()))
+
+    routed = [index['extractors'][position] for position in sorted(positions)]
+    routed = [entry for entry in routed if entry[1] != _GENERIC_EXTRACTOR_NAME]
+    if not routed:
+        return None
+
+    try:
+        classes = [_load_extractor_class(module_name, class_name) for module_name, class_name in routed]
+        if not any(extractor.suitable(url) for extractor in classes):
+            return None
+        generic = next(
+            (entry for entry in index['extractors'] if entry[1] == _GENERIC_EXTRACTOR_NAME),
+            None,
+        )
+        if generic is not None:
+            classes.append(_load_extractor_class(*generic))
+    except Exception:
+        return None
+    return classes
+
+
+def _loaded_ytdlp_version():
+    # Never import yt-dlp just to look up the index
+    return getattr(sys.modules.get('yt_dlp.version'), '__version__', None)
+
+
+def _default_index_path():
+    version = _loaded_ytdlp_version()
+    if version is None:
+        return None
+    from core.ytdlp_manager import extractor_index_path
+    return extractor_index_path(version)
+
+
+def _ensure_extractor_index(path):
+    if path is None:
+        return
+    # Playlist prefetch workers may get here concurrently
+    with _BUILD_LOCK:
+        if load_extractor_index(path) is not None:
+            return
+        try:
+            extractor_classes = importlib.import_module('yt_dlp.extractor').gen_extractor_classes()
+        except Exception:
+            return
+        save_extractor_index(path, build_extractor_index(extractor_classes, _loaded_ytdlp_version()))
+
+
+def create_youtube_dl(youtube_dl_cls, ydl_opts, url, index_path=None):
+    """
+    Return ``(ydl, targeted)``: a YoutubeDL for *url* with only its routed
+    extractors plus Generic registered, or with all default extractors when
+    the index is missing or has no route for the URL.
+    """
+    index_path = index_path or _default_index_path()
+    index = load_extractor_index(index_path) if index_path else None
+    extractor_classes = route_extractor_classes(index, url) if index else None
+
+    ydl = youtube_dl_cls(ydl_opts, auto_init=False)
+    if extractor_classes is None:
+        ydl.add_default_info_extractors()
+        _ensure_extractor_index(index_path)
+        return ydl, False
+
+    for extractor in extractor_classes:
+        ydl.add_info_extractor(extractor)
+    return ydl, True
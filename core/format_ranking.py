@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Scoring engine that ranks candidate formats for playback.
+
+A scorer maps a format to a comparable value where larger is better. A
+ranking profile (codec preference, bitrate cap, fps, HDR, container) is
+turned into an ordered list of scorers; every candidate is scored once and
+the list is sorted once. Ties keep the caller's order.
+
+A decode profile is a hard filter on top: it caps the width and frame rate
+each video codec can be decoded at, so formats the device would decode in
+software (or not at all) are never picked or written into a manifest.
+"""
+
+import re
+from operator import itemgetter
+
+DEFAULT_FORMAT_RANKING = {
+    # Codec families in order of preference, e.g. ('avc1', 'vp9', 'av01')
+    'codec_preference': (),
+    # Total bitrate cap in kbit/s; formats above it rank after all others
+    'max_bitrate': None,
+    # True prefers high frame rates, False low ones, None has no preference
+    'prefer_high_fps': None,
+    # True prefers HDR, False SDR, None has no preference
+    'prefer_hdr': None,
+    # Containers/extensions in order of preference, e.g. ('mp4', 'webm')
+    'container_preference': (),
+}
+
+_CODEC_FAMILIES = {
+    'avc': 'avc1',
+    'avc1': 'avc1',
+    'avc3': 'avc1',
+    'h264': 'avc1',
+    'hev1': 'hevc',
+    'hvc1': 'hevc',
+    'hevc': 'hevc',
+    'h265': 'hevc',
+    'vp9': 'vp9',
+    'vp09': 'vp9',
+    'vp8': 'vp8',
+    'vp08': 'vp8',
+    'av01': 'av01',
+    'av1': 'av01',
+}
+
+# codec[:max_width][@max_fps], e.g. 'vp9:1920@30'
+_DECODE_PROFILE_ENTRY_RE = re.compile(r'^\s*([a-z][\w.]*)\s*(?::\s*(\d*))?\s*(?:@\s*(\d+))?\s*$', re.IGNORECASE)
+
+
+def codec_family(codec):
+    """Return the codec family of a yt-dlp codec string, e.g. 'avc1.64001F' -> 'avc1'."""
+    value = (codec or '').strip().lower()
+    if value in ('', 'none', 'unknown', 'null'):
+        return None
+    prefix = value.split('.', 1)[0]
+    return _CODEC_FAMILIES.get(prefix, prefix)
+
+
+def format_bitrate(format_info):
+    """Return the total bitrate of a format in kbit/s, or None when unknown."""
+    tbr = format_info.get('tbr')
+    if tbr:
+        return tbr
+    vbr = format_info.get('vbr') or 0
+    abr = format_info.get('abr') or 0
+    return (vbr + abr) or None
+
+
+def _preference_score(value, preference):
+    if value in preference:
+        return len(preference) - preference.index(value)
+    return 0
+
+
+def score_width(format_info):
+    width = format_info.get('width')
+    return width if width is not None else -1
+
+
+def score_codec_preference(preference):
+    preference = [codec_family(codec) for codec in preference]
+
+    def score(format_info):
+        return _preference_score(codec_family(format_info.get('vcodec')), preference)
+
+    return score
+
+
+def score_bitrate_cap(max_bitrate):
+    def score(format_info):
+        bitrate = format_bitrate(format_info)
+        return 0 if bitrate is not None and bitrate > max_bitrate else 1
+
+    return score
+
+
+def score_fps(prefer_high_fps):
+    sign = 1 if prefer_high_fps else -1
+
+    def score(format_info):
+        return sign * (format_info.get('fps') or 0)
+
+    return score
+
+
+def score_hdr(prefer_hdr):
+    def score(format_info):
+        dynamic_range = (format_info.get('dynamic_range') or 'SDR').upper()
+        return int((dynamic_range != 'SDR') == prefer_hdr)
+
+    return score
+
+
+def score_container_preference(preference):
+    preference = [container.lower() for container in preference]
+
+    def score(format_info):
+        container = (format_info.get('container') or format_info.get('ext') or '').lower()
+        # mp4_dash / webm_dash rank as their plain container
+        return _preference_score(container.split('_', 1)[0], preference)
+
+    return score
+
+
+def build_format_scorers(profile=None):
+    """
+    Return the scorers for a ranking profile, most significant first.
+
+    The bitrate cap and codec preference outrank resolution so a constrained
+    network or device never trades them for pixels; fps, HDR and container
+    only break ties between equally wide formats. The default profile ranks
+    by width alone.
+    """
+    profile = dict(DEFAULT_FORMAT_RANKING, **(profile or {}))
+    scorers = []
+    if profile['max_bitrate']:
+        scorers.append(score_bitrate_cap(profile['max_bitrate']))
+    if profile['codec_preference']:
+        scorers.append(score_codec_preference(profile['codec_preference']))
+    scorers.append(score_width)
+    if profile['prefer_high_fps'] is not None:
+        scorers.append(score_fps(profile['prefer_high_fps']))
+    if profile['prefer_hdr'] is not None:
+        scorers.append(score_hdr(profile['prefer_hdr']))
+    if profile['container_preference']:
+        scorers.append(score_container_preference(profile['container_preference']))
+    return scorers
+
+
+def rank_formats(formats, scorers=None, key=None):
+    """
+    Return *formats* ordered best first by *scorers*.
+
+    *key* extracts the format from each item, so candidate records wrapping
+    a format can be ranked directly.
+    """
+    if scorers is None:
+        scorers = build_format_scorers()
+    scored = [
+        (tuple(scorer(key(item) if key else item) for scorer in scorers), item)
+        for item in formats
+    ]
+    # Sorting is stable with reverse=True, so ties keep their input order
+    scored.sort(key=itemgetter(0), reverse=True)
+    return [item for _score, item in scored]
+
+
+def parse_decode_profile(value):
+    """
+    Parse a hardware decode profile such as ``'vp9:1920@30, av01:0'``.
+
+    Each entry is ``codec[:max_width][@max_fps]``; a max width of 0 means
+    the codec cannot be decoded at all. Codecs that are not listed are not
+    limited, and malformed entries are ignored.
+    """
+    profile = {}
+    for entry in (value or '').split(','):
+        match = _DECODE_PROFILE_ENTRY_RE.match(entry)
+        if match is None:
+            continue
+        codec, max_width, max_fps = match.groups()
+        profile[codec_family(codec)] = {
+            'max_width': int(max_width) if max_width else None,
+            'max_fps': int(max_fps) if max_fps else None,
+        }
+    return profile
+
+
+def is_decodable(format_info, decode_profile):
+    """Return whether the device decode profile can play the format's video."""
+    limits = decode_profile.get(codec_family(format_info.get('vcodec'))) if decode_profile else None
+    if limits is None:
+        return True
+
+    max_width = limits.get('max_width')
+    if max_width == 0:
+        return False
+    width = format_info.get('width')
+    if max_width is not None and width is not None and width > max_width:
+        return False
+    max_fps = limits.get('max_fps')
+    fps = format_info.get('fps')
+    return max_fps is None or fps is None or fps <= max_fps
+
+
+def filter_decodable(formats, decode_profile):
+    if not decode_profile:
+        return list(formats)
+    return [format_info for format_info in formats if is_decodable(format_info, decode_profile)]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Session-wide cache of inputstream.adaptive capability checks.
+
+``inputstreamhelper.Helper(stream).check_inputstream()`` touches Kodi add-on
+state and the filesystem on every call. Results are cached per manifest type
+in memory and in addon_data, keyed by the installed inputstream.adaptive
+version so an update (or a first install) invalidates them.
+"""
+
+from threading import Lock
+
+from core.persistent_cache import PersistentLRUCache, addon_data_path
+
+ISA_CAPABILITY_CACHE_MAX_ENTRIES = 32
+ISA_CAPABILITY_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+_STATS_LOCK = Lock()
+_STATS = {'checks': 0, 'hits': 0}
+
+
+def _capability_cache():
+    return PersistentLRUCache(
+        addon_data_path('isa_capabilities.json'),
+        ISA_CAPABILITY_CACHE_MAX_ENTRIES,
+        ISA_CAPABILITY_CACHE_TTL_SECONDS,
+    )
+
+
+def _count(name):
+    with _STATS_LOCK:
+        _STATS[name] += 1
+
+
+def get_isa_capability_stats():
+    """Return how many real checks and cache hits happened in this process."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def reset_isa_capability_stats():
+    with _STATS_LOCK:
+        _STATS['checks'] = 0
+        _STATS['hits'] = 0
+
+
+def create_isa_supports(check_inputstream, get_isa_version, cache=None):
+    """
+    Return an ``isa_supports(stream)`` callable backed by the capability cache.
+
+    *check_inputstream* performs the real check for a manifest type and
+    *get_isa_version* returns the installed inputstream.adaptive version (or
+    None); it is only queried once.
+    """
+    results = {}
+    state = {}
+    lock = Lock()
+
+    def cache_key(stream):
+        if 'prefix' not in state:
+            state['cache'] = _capability_cache() if cache is None else cache
+            state['prefix'] = '{}:'.format(get_isa_version() or 'none')
+        return state['prefix'] + stream
+
+    def isa_supports(stream):
+        if stream is None or len(stream) < 1:
+            return False
+
+        with lock:
+            if stream in results:
+                _count('hits')
+                return results[stream]
+
+            key = cache_key(stream)
+            supported = state['cache'].get(key)
+            if supported is not None:
+                _count('hits')
+            else:
+                _count('checks')
+                supported = bool(check_inputstream(stream))
+                state['cache'].put(key, supported)
+                state['cache'].flush()
+            results[stream] = supported
+            return supported
+
+    return isa_supports
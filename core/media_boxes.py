@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Allocation-free walkers over WebM (EBML) elements and MP4 (ISO-BMFF) boxes.
+
+Both walkers read straight from a ``memoryview`` using precompiled
+``struct.Struct`` objects and yield ``(id, offset, header_len, size)`` for
+every element/box whose header is completely available. Element ids keep
+their EBML length marker (e.g. ``0x1A45DFA3``); box types are returned as
+big-endian integers (e.g. ``0x73696478`` for ``sidx``).
+"""
+
+import struct
+
+_UINT32 = struct.Struct('>I')
+_UINT64 = struct.Struct('>Q')
+
+EBML_HEADER_ID = 0x1A45DFA3
+EBML_SEGMENT_ID = 0x18538067
+EBML_CUES_ID = 0x1C53BB6B
+EBML_CLUSTER_ID = 0x1F43B675
+# 4 byte id + 8 byte size
+EBML_MAX_HEADER_LEN = 12
+
+BOX_SIDX = _UINT32.unpack(b'sidx')[0]
+BOX_MOOF = _UINT32.unpack(b'moof')[0]
+BOX_MDAT = _UINT32.unpack(b'mdat')[0]
+BOX_HEADER_LEN = 8
+
+
+def read_uint32(view, offset):
+    return _UINT32.unpack_from(view, offset)[0]
+
+
+def ebml_vint_length(first_byte):
+    # Number of leading zero bits + 1, or 0 for an invalid (> 8 byte) vint
+    length = 1
+    mask = 0x80
+    while mask and not first_byte & mask:
+        mask >>= 1
+        length += 1
+    return length if mask else 0
+
+
+def _read_ebml_vint(view, offset, end, keep_marker):
+    first = view[offset]
+    length = ebml_vint_length(first)
+    if length == 0 or offset + length > end:
+        return 0, 0
+
+    value = first if keep_marker else first & (0xFF >> length)
+    for index in range(offset + 1, offset + length):
+        value = (value << 8) | view[index]
+    return length, value
+
+
+def iter_ebml_elements(view, offset=0, descend=(EBML_SEGMENT_ID,)):
+    """
+    Walk EBML elements starting at *offset*.
+
+    Elements listed in *descend* are entered instead of skipped, which is how
+    the children of the (often unknown-sized) Matroska Segment are reached.
+    The walk stops at the first header that is truncated or invalid.
+    """
+    end = len(view)
+    while offset < end:
+        id_len, element_id = _read_ebml_vint(view, offset, end, True)
+        if id_len == 0 or offset + id_len >= end:
+            return
+
+        size_len, size = _read_ebml_vint(view, offset + id_len, end, False)
+        if size_len == 0:
+            return
+
+        header_len = id_len + size_len
+        yield element_id, offset, header_len, size
+
+        if element_id in descend:
+            offset += header_len
+        else:
+            offset += header_len + size
+
+
+def iter_iso_boxes(view, offset=0):
+    """
+    Walk top-level ISO-BMFF boxes starting at *offset*.
+
+    64-bit ``largesize`` boxes are supported; a box of size 0 extends to the
+    end of the file and is the last one yielded. The walk stops at the first
+    truncated or invalid header.
+    """
+    end = len(view)
+    while offset + BOX_HEADER_LEN <= end:
+        size = _UINT32.unpack_from(view, offset)[0]
+        box_type = _UINT32.unpack_from(view, offset + 4)[0]
+        header_len = BOX_HEADER_LEN
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = _UINT64.unpack_from(view, offset + 8)[0]
+            header_len = 16
+
+        if size == 0:
+            yield box_type, offset, header_len, 0
+            return
+        if size < header_len:
+            return
+
+        yield box_type, offset, header_len, size
+        offset += size
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Small JSON-backed LRU cache with per-entry expiry, stored in addon_data."""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def addon_data_path(*parts):
+    """Return a path below the add-on's addon_data directory."""
+    try:
+        import xbmcvfs
+        base_dir = xbmcvfs.translatePath("special://profile/addon_data/plugin.video.sendtokodi/")
+    except ImportError:
+        base_dir = os.path.join(
+            os.path.expanduser("~"),
+            ".kodi",
+            "userdata",
+            "addon_data",
+            "plugin.video.sendtokodi",
+        )
+    return os.path.join(base_dir, *parts)
+
+
+@contextmanager
+def _file_lock(path):
+    # Advisory lock serializing flushes of all processes sharing a cache file
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _read_entries(path):
+    try:
+        with open(path, "r") as f:
+            raw = json.load(f)
+    except Exception:
+        raw = None
+
+    entries = raw.get("entries") if isinstance(raw, dict) else None
+    return entries if isinstance(entries, dict) else {}
+
+
+class PersistentLRUCache():
+    """
+    Key/value cache persisted as a single JSON file.
+
+    Entries expire after their TTL and the least recently used entries are
+    evicted once *max_entries* is exceeded. Values must be JSON serializable.
+    The file is only read on first use and only written by ``flush()``; all
+    errors are swallowed because the cache is an optimization, never a
+    requirement.
+
+    Several processes may share the file (Kodi runs each plugin invocation
+    in its own process, and playlist prefetch workers outlive it), so
+    ``flush()`` merges the entries this instance changed into the current
+    file contents under a file lock instead of overwriting them.
+    """
+
+    def __init__(self, path, max_entries, ttl_seconds, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = None
+        # Keys put or used since the last flush
+        self._changed = set()
+        self._lock = Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = _read_entries(self.path)
+        return self._entries
+
+    def _evict(self, entries, now):
+        for key in [key for key, entry in entries.items() if entry.get("expires_at", 0) <= now]:
+            del entries[key]
+
+        overflow = len(entries) - self.max_entries
+        if overflow > 0:
+            by_last_use = sorted(entries, key=lambda key: entries[key].get("last_used_at", 0))
+            for key in by_last_use[:overflow]:
+                del entries[key]
+
+    def get(self, key):
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None:
+                return None
+
+            now = self._clock()
+            if entry.get("expires_at", 0) <= now:
+                # Dropped from the file by the eviction of the next flush
+                del entries[key]
+                return None
+
+            entry["last_used_at"] = now
+            self._changed.add(key)
+            return entry.get("value")
+
+    def put(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            entries = self._load()
+            now = self._clock()
+            entries[key] = {
+                "value": value,
+                "expires_at": now + ttl,
+                "last_used_at": now,
+            }
+            self._evict(entries, now)
+            self._changed.add(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def flush(self):
+        with self._lock:
+            if not self._changed or self._entries is None:
+                return True
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with _file_lock(self.path):
+                    merged = _read_entries(self.path)
+                    merged.update(
+                        (key, self._entries[key]) for key in self._changed if key in self._entries
+                    )
+                    self._evict(merged, self._clock())
+                    # Unique per process: writers without fcntl must not share it
+                    tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+                    with open(tmp_path, "w") as f:
+                        json.dump({"entries": merged}, f)
+                    os.replace(tmp_path, self.path)
+            except Exception:
+                return False
+            self._entries = merged
+            self._changed = set()
+            return True
@@ -1,6 +1,9 @@
+from operator import itemgetter
 from urllib.parse import parse_qs, urlparse
 from urllib.parse import urlencode
 
+from core.format_ranking import filter_decodable, is_decodable, rank_formats
+
 
 def normalize_dash_audio_streams(dash_audio):
     if len(dash_audio) > 1:
@@ -54,35 +57,16 @@ def should_filter_by_max_width(width, maxwidth):
     return width is not None and width > maxwidth
 
 
-def should_replace_raw_candidate(current_format, candidate_format):
-    if current_format is None:
-        return True
-
-    current_width = current_format.get('width')
-    candidate_width = candidate_format.get('width')
-
-    if candidate_width is None:
-        return False
-    if current_width is None:
-        return True
-
-    return candidate_width > current_width
-
-
-def pick_best_dash_video_format(dash_video, maxwidth):
+def pick_best_dash_video_format(dash_video, maxwidth, format_scorers=None):
     if not dash_video:
         return None
 
-    best_within_limit = None
-    for format_info in dash_video:
-        width = format_info.get('width')
-        if width is None or width > maxwidth:
-            continue
-        if best_within_limit is None or width > best_within_limit.get('width', 0):
-            best_within_limit = format_info
-
-    if best_within_limit is not None:
-        return best_within_limit
+    within_limit = [
+        format_info for format_info in dash_video
+        if format_info.get('width') is not None and format_info['width'] <= maxwidth
+    ]
+    if within_limit:
+        return rank_formats(within_limit, format_scorers)[0]
     return dash_video[-1]
 
 
@@ -182,10 +166,14 @@ def evaluate_raw_format_candidate(
     manifest_type,
     manifest_supported,
     disable_opus_for_audio_only_hls_native=False,
+    decode_profile=None,
 ):
     if 'url' not in format_info:
         return {'decision': 'skip'}
 
+    if decode_profile and not is_decodable(format_info, decode_profile):
+        return {'decision': 'skip'}
+
     if should_skip_non_adaptive_candidate(
         have_video,
         have_audio,
@@ -229,11 +217,48 @@ def resolve_filtered_fallback_candidate(filtered_format, manifest_supported):
     }
 
 
-def add_dash_formats_to_builder(builder, dash_video, dash_audio, have_video, have_audio):
+def _with_http_headers(format_info, http_headers):
+    if http_headers is None or format_info.get('http_headers') is not None:
+        return format_info
+    return dict(format_info, http_headers=http_headers)
+
+
+def _failure_event(event_type, format_id, exc):
+    event = {'type': event_type, 'format_id': format_id, 'error': str(exc)}
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status is not None:
+        event['status'] = status
+    return event
+
+
+def add_dash_formats_to_builder(
+    builder,
+    dash_video,
+    dash_audio,
+    have_video,
+    have_audio,
+    http_headers=None,
+    decode_profile=None,
+):
     video_success = not have_video
     audio_success = not have_audio
     events = []
 
+    # Representations the device cannot decode never reach the manifest, so
+    # ISA's adaptive switching cannot pick them either.
+    dash_video = filter_decodable(dash_video, decode_profile)
+
+    # Range probes need the same headers the player later sends; formats
+    # without their own fall back to the result's headers.
+    dash_video = [_with_http_headers(fvideo, http_headers) for fvideo in dash_video]
+    dash_audio = [_with_http_headers(faudio, http_headers) for faudio in dash_audio]
+
+    # Builders that can probe all representations at once do so up front; the
+    # per-format calls below then only assemble the manifest in a stable order.
+    prefetch_ranges = getattr(builder, 'prefetch_ranges', None)
+    if prefetch_ranges is not None:
+        prefetch_ranges(list(dash_video) + list(dash_audio))
+
     for fvideo in dash_video:
         format_id = fvideo.get('format', "")
         try:
@@ -241,7 +266,7 @@ def add_dash_formats_to_builder(builder, dash_video, dash_audio, have_video, hav
             video_success = True
             events.append({'type': 'video_added', 'format_id': format_id})
         except Exception as exc:
-            events.append({'type': 'video_failed', 'format_id': format_id, 'error': str(exc)})
+            events.append(_failure_event('video_failed', format_id, exc))
 
     for faudio in dash_audio:
         format_id = faudio.get('format', "")
@@ -250,7 +275,7 @@ def add_dash_formats_to_builder(builder, dash_video, dash_audio, have_video, hav
             audio_success = True
             events.append({'type': 'audio_added', 'format_id': format_id})
         except Exception as exc:
-            events.append({'type': 'audio_failed', 'format_id': format_id, 'error': str(exc)})
+            events.append(_failure_event('audio_failed', format_id, exc))
 
     return {
         'video_success': video_success,
@@ -259,6 +284,31 @@ def add_dash_formats_to_builder(builder, dash_video, dash_audio, have_video, hav
     }
 
 
+def _create_manifest_builder(manifest_factory, duration, media_id):
+    if media_id is None:
+        return manifest_factory(duration)
+    return manifest_factory(duration, media_id=media_id)
+
+
+def _has_forbidden_failure(events):
+    return any(event.get('status') == 403 for event in events)
+
+
+def call_once(func):
+    # Memoize a zero-argument callable (e.g. a yt-dlp re-resolve) so repeated
+    # retries within one selection share a single call.
+    if func is None:
+        return None
+    results = []
+
+    def wrapper():
+        if not results:
+            results.append(func())
+        return results[0]
+
+    return wrapper
+
+
 def build_dash_manifest_candidate(
     duration,
     dash_video,
@@ -268,13 +318,19 @@ def build_dash_manifest_candidate(
     manifest_factory,
     start_httpd,
     resolve_fresh_result=None,
+    media_id=None,
+    http_headers=None,
+    resolve_retry_result=None,
+    decode_profile=None,
 ):
     def build_manifest_bytes():
+        refreshed_media_id = media_id
         refreshed_duration = duration
         refreshed_dash_video = dash_video
         refreshed_dash_audio = dash_audio
         refreshed_have_video = have_video
         refreshed_have_audio = have_audio
+        refreshed_http_headers = http_headers
 
         if resolve_fresh_result is not None:
             fresh_result = resolve_fresh_result()
@@ -282,30 +338,61 @@ def build_dash_manifest_candidate(
                 return None
 
             refreshed_duration = fresh_result.get('duration', duration)
+            refreshed_media_id = fresh_result.get('id', media_id)
+            refreshed_http_headers = fresh_result.get('http_headers', http_headers)
             refreshed_have_video, refreshed_have_audio, refreshed_dash_video, refreshed_dash_audio = analyze_formats(
                 fresh_result.get('formats', [])
             )
 
-        refreshed_builder = manifest_factory(refreshed_duration)
+        refreshed_builder = _create_manifest_builder(manifest_factory, refreshed_duration, refreshed_media_id)
         refreshed_result = add_dash_formats_to_builder(
             refreshed_builder,
             refreshed_dash_video,
             refreshed_dash_audio,
             refreshed_have_video,
             refreshed_have_audio,
+            http_headers=refreshed_http_headers,
+            decode_profile=decode_profile,
         )
         if refreshed_result['video_success'] and refreshed_result['audio_success']:
             return refreshed_builder.emit()
         return None
 
-    builder = manifest_factory(duration)
+    builder = _create_manifest_builder(manifest_factory, duration, media_id)
     build_result = add_dash_formats_to_builder(
         builder,
         dash_video,
         dash_audio,
         have_video,
         have_audio,
+        http_headers=http_headers,
+        decode_profile=decode_profile,
     )
+
+    if resolve_retry_result is None:
+        resolve_retry_result = resolve_fresh_result
+    complete = build_result['video_success'] and build_result['audio_success']
+    if not complete and resolve_retry_result is not None and _has_forbidden_failure(build_result['events']):
+        # Expired signatures or cookies: retry once with freshly resolved
+        # formats (URLs and headers), keeping the requested format selection.
+        retry = _build_from_retry_result(
+            resolve_retry_result(),
+            duration,
+            dash_video,
+            dash_audio,
+            have_video,
+            have_audio,
+            manifest_factory,
+            media_id,
+            http_headers,
+            decode_profile,
+        )
+        if retry is not None:
+            retry_builder, retry_result = retry
+            events = build_result['events'] + [{'type': 'retried_fresh_formats', 'format_id': ""}]
+            builder = retry_builder
+            build_result = dict(retry_result, events=events + retry_result['events'])
+
     if build_result['video_success'] and build_result['audio_success']:
         manifest = builder.emit()
         try:
@@ -319,7 +406,65 @@ def build_dash_manifest_candidate(
     return {'events': build_result['events']}
 
 
-def analyze_formats(formats):
+def _build_from_retry_result(
+    fresh_result,
+    duration,
+    dash_video,
+    dash_audio,
+    have_video,
+    have_audio,
+    manifest_factory,
+    media_id,
+    http_headers,
+    decode_profile=None,
+):
+    if fresh_result is None:
+        return None
+
+    _fresh_have_video, _fresh_have_audio, fresh_dash_video, fresh_dash_audio = analyze_formats(
+        fresh_result.get('formats', [])
+    )
+    requested_video_ids = {fvideo.get('format_id') for fvideo in dash_video}
+    selected_dash_video = [
+        fvideo for fvideo in fresh_dash_video if fvideo.get('format_id') in requested_video_ids
+    ] or fresh_dash_video
+
+    builder = _create_manifest_builder(
+        manifest_factory,
+        fresh_result.get('duration', duration),
+        fresh_result.get('id', media_id),
+    )
+    build_result = add_dash_formats_to_builder(
+        builder,
+        selected_dash_video,
+        fresh_dash_audio,
+        have_video,
+        have_audio,
+        http_headers=fresh_result.get('http_headers', http_headers),
+        decode_profile=decode_profile,
+    )
+    return builder, build_result
+
+
+def _normalize_codec(codec):
+    value = (codec or "").strip().lower()
+    if value in ("", "none", "unknown", "null"):
+        return "none"
+    return value
+
+
+def build_format_index(formats):
+    """
+    Classify every format of a result in a single pass.
+
+    Each entry records the format's stream kind, the manifest types of its
+    url and manifest_url and its width, so selection and labeling never
+    re-scan the format list or re-parse URLs. ``by_url`` maps a stream URL
+    to the last format using it and ``dash_anchor`` is the format at which
+    selection tries the DASH manifest builder.
+    """
+    entries = []
+    by_url = {}
     have_video = False
     have_audio = False
     dash_video = []
@@ -335,12 +480,70 @@ def analyze_formats(formats):
             have_audio = True
 
         container = fmt.get('container', '')
-        if vcodec != 'none' and acodec == 'none' and container in ['mp4_dash', 'webm_dash']:
+        is_dash_video = vcodec != 'none' and acodec == 'none' and container in ['mp4_dash', 'webm_dash']
+        if is_dash_video:
             dash_video.append(fmt)
         if vcodec == 'none' and acodec != 'none' and container in ['m4a_dash', 'webm_dash']:
             dash_audio.append(fmt)
 
-    return have_video, have_audio, dash_video, normalize_dash_audio_streams(dash_audio)
+        url = fmt.get('url')
+        manifest_url = fmt.get('manifest_url')
+        is_audio_only = _normalize_codec(fmt.get('vcodec')) == 'none' and _normalize_codec(fmt.get('acodec')) != 'none'
+        entry = {
+            'format': fmt,
+            'kind': 'audio' if is_audio_only else 'video',
+            'manifest_type': guess_manifest_type(fmt, url) if url is not None else None,
+            'manifest_url_type': guess_manifest_type(fmt, manifest_url) if manifest_url is not None else None,
+            'width': fmt.get('width'),
+            'dash_video': is_dash_video,
+        }
+        entries.append(entry)
+        if url is not None:
+            by_url[url] = entry
+
+    dash_audio = normalize_dash_audio_streams(dash_audio)
+    dash_anchor = None
+    if have_video and dash_video:
+        dash_anchor = dash_video[-1]
+    elif not have_video and have_audio and dash_audio:
+        dash_anchor = dash_audio[-1]
+
+    return {
+        'entries': entries,
+        'by_url': by_url,
+        'have_video': have_video,
+        'have_audio': have_audio,
+        'dash_video': dash_video,
+        'dash_audio': dash_audio,
+        'dash_anchor': dash_anchor,
+    }
+
+
+def analyze_formats(formats):
+    format_index = build_format_index(formats)
+    return (
+        format_index['have_video'],
+        format_index['have_audio'],
+        format_index['dash_video'],
+        format_index['dash_audio'],
+    )
+
+
+def infer_stream_kind(format_index, url):
+    entry = format_index['by_url'].get(url)
+    return entry['kind'] if entry is not None else 'video'
+
+
+def memoize_by_argument(func):
+    """Cache *func* results per argument, e.g. isa_supports per manifest type."""
+    results = {}
+
+    def memoized(value):
+        if value not in results:
+            results[value] = func(value)
+        return results[value]
+
+    return memoized
 
 
 def find_playlist_start_index(url, entries):
@@ -399,14 +602,25 @@ def select_playback_source(
     preferred_format_url=None,
     disable_opus_for_audio_only_hls_native=False,
     strict_max_resolution=True,
+    format_index=None,
+    format_scorers=None,
+    decode_profile=None,
 ):
+    # inputstreamhelper checks are expensive and only depend on the manifest type
+    isa_supports = memoize_by_argument(isa_supports)
     dash_manifest_factory = None
     dash_start_httpd = None
+    # Shared by every DASH attempt of this selection, so a 403 triggers at most
+    # one re-resolve. Manifest refreshes keep using the uncached callable.
+    resolve_retry_result = call_once(result.get('resolve_fresh_result'))
     if usedashbuilder and dashbuilder is not None:
         dash_manifest_factory = dashbuilder.Manifest
         dash_start_httpd = dashbuilder.start_httpd
 
     has_manual_stream_preference = preferred_format_url is not None
+    # A stream the user picked by hand is played even if the decode profile excludes it
+    if has_manual_stream_preference:
+        decode_profile = None
 
     if not strict_max_resolution and preferred_format_url is None:
         manifest_url = result.get('manifest_url') if usemanifest else None
@@ -420,14 +634,19 @@ def select_playback_source(
             return original_manifest_candidate
 
     format_manifest_fallback = None
-    filtered_format = None
-    best_raw_format = None
-    best_raw_candidate = None
-
-    all_formats = result.get('formats', [])
-    have_video, have_audio, dash_video, dash_audio = analyze_formats(all_formats)
-
-    for format_info in reversed(all_formats):
+    filtered_entry = None
+    raw_candidates = []
+
+    if format_index is None:
+        format_index = build_format_index(result.get('formats', []))
+    have_video = format_index['have_video']
+    have_audio = format_index['have_audio']
+    dash_video = format_index['dash_video']
+    dash_audio = format_index['dash_audio']
+    decodable_dash_video = filter_decodable(dash_video, decode_profile)
+
+    for entry in reversed(format_index['entries']):
+        format_info = entry['format']
         vcodec = format_info.get('vcodec')
         acodec = format_info.get('acodec')
         if should_skip_manifest_candidate(have_video, vcodec, acodec):
@@ -439,8 +658,8 @@ def select_playback_source(
         if (
             has_manual_stream_preference
             and usedashbuilder
+            and entry['dash_video']
             and isa_supports("mpd")
-            and is_dash_video_format(format_info)
         ):
             dash_result = None
             if dash_manifest_factory is not None and dash_start_httpd is not None:
@@ -453,6 +672,9 @@ def select_playback_source(
                     dash_manifest_factory,
                     dash_start_httpd,
                     result.get('resolve_fresh_result'),
+                    media_id=result.get('id'),
+                    http_headers=result.get('http_headers'),
+                    resolve_retry_result=resolve_retry_result,
                 )
             dash_url = dash_result.get('url') if dash_result is not None else None
             if dash_url is not None:
@@ -468,7 +690,7 @@ def select_playback_source(
             manifest_url = format_info.get('manifest_url') if usemanifest else None
             format_manifest_candidate = resolve_manifest_candidate(
                 manifest_url,
-                isa_supports(guess_manifest_type(format_info, manifest_url)) if manifest_url is not None else False,
+                isa_supports(entry['manifest_url_type']) if manifest_url is not None else False,
                 format_info.get('http_headers'),
             )
             if format_manifest_candidate is not None and not strict_max_resolution:
@@ -480,7 +702,7 @@ def select_playback_source(
                 format_manifest_candidate['format_label'] = format_info.get('format', "")
                 format_manifest_fallback = format_manifest_candidate
 
-        if should_try_dash_builder(
+        if format_info is format_index['dash_anchor'] and should_try_dash_builder(
             usedashbuilder,
             have_video,
             dash_video,
@@ -491,16 +713,24 @@ def select_playback_source(
         ):
             dash_result = None
             if dash_manifest_factory is not None and dash_start_httpd is not None:
-                selected_dash_video = pick_best_dash_video_format(dash_video, maxwidth) if strict_max_resolution else None
+                selected_dash_video = pick_best_dash_video_format(
+                    decodable_dash_video,
+                    maxwidth,
+                    format_scorers,
+                ) if strict_max_resolution else None
                 dash_result = build_dash_manifest_candidate(
                     result.get('duration', "0"),
-                    [selected_dash_video] if selected_dash_video is not None else dash_video,
+                    [selected_dash_video] if selected_dash_video is not None else decodable_dash_video,
                     dash_audio,
                     have_video,
                     have_audio,
                     dash_manifest_factory,
                     dash_start_httpd,
                     result.get('resolve_fresh_result'),
+                    media_id=result.get('id'),
+                    http_headers=result.get('http_headers'),
+                    resolve_retry_result=resolve_retry_result,
+                    decode_profile=decode_profile,
                 )
             dash_url = dash_result.get('url') if dash_result is not None else None
             if dash_url is not None:
@@ -512,7 +742,7 @@ def select_playback_source(
                     'events': dash_result.get('events', []),
                 }
 
-        manifest_type = guess_manifest_type(format_info, format_info['url']) if 'url' in format_info else None
+        manifest_type = entry['manifest_type']
         raw_candidate = evaluate_raw_format_candidate(
             format_info,
             have_video,
@@ -521,12 +751,13 @@ def select_playback_source(
             manifest_type,
             isa_supports(manifest_type),
             disable_opus_for_audio_only_hls_native,
+            decode_profile,
         )
         if raw_candidate['decision'] == 'skip':
             continue
         if raw_candidate['decision'] == 'filtered':
-            if filtered_format is None:
-                filtered_format = format_info
+            if filtered_entry is None:
+                filtered_entry = entry
             continue
 
         if not strict_max_resolution:
@@ -534,14 +765,13 @@ def select_playback_source(
             raw_candidate['format_label'] = format_info.get('format', "")
             return raw_candidate
 
-        if should_replace_raw_candidate(best_raw_format, format_info):
-            raw_candidate['source'] = 'raw_format'
-            raw_candidate['format_label'] = format_info.get('format', "")
-            best_raw_candidate = raw_candidate
-            best_raw_format = format_info
+        raw_candidate['source'] = 'raw_format'
+        raw_candidate['format_label'] = format_info.get('format', "")
+        raw_candidates.append((format_info, raw_candidate))
 
-    if best_raw_candidate is not None:
-        return best_raw_candidate
+    if raw_candidates:
+        # Rank every playable raw format in one pass
+        return rank_formats(raw_candidates, format_scorers, key=itemgetter(0))[0][1]
 
     if format_manifest_fallback is not None:
         return format_manifest_fallback
@@ -557,8 +787,8 @@ def select_playback_source(
         return original_manifest_candidate
 
     filtered_fallback = resolve_filtered_fallback_candidate(
-        filtered_format,
-        isa_supports(guess_manifest_type(filtered_format, filtered_format['url'])) if filtered_format is not None else False,
+        filtered_entry['format'] if filtered_entry is not None else None,
+        isa_supports(filtered_entry['manifest_type']) if filtered_entry is not None else False,
     )
     if filtered_fallback is not None:
         filtered_fallback['source'] = 'filtered_fallback'
@@ -603,6 +833,8 @@ def selection_log_messages(selected_source):
                 messages.append("Added audio stream {} to DASH manifest".format(format_id))
             elif event_type == 'audio_failed':
                 messages.append("Failed to add DASH audio stream {}: {}".format(format_id, event['error']))
+            elif event_type == 'retried_fresh_formats':
+                messages.append("Retrying DASH manifest with freshly resolved formats after HTTP 403")
         messages.append("Picked DASH with custom manifest")
         return messages
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Background pre-resolution of the entries that follow the playing playlist item.
+
+Queued playlist entries are lazy plugin:// items, so each one normally pays
+the full extraction latency when playback transitions to it. While the first
+item plays, the next few entries are resolved in worker threads and stored in
+the extraction result cache, which the plugin consults when the queued item
+is invoked.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from core import result_cache
+from core.ydl_pool import pooled_extract_info
+
+PLAYLIST_PREFETCH_MAX_WORKERS = 2
+
+
+def next_playlist_entries(unresolved_entries, start_index, count):
+    """
+    Return the first *count* resolvable entries that play after the starting
+    entry, i.e. the entries queued behind position *start_index*.
+    """
+    if count <= 0:
+        return []
+
+    start_index = max(0, start_index or 0)
+    following = unresolved_entries[start_index:]
+    return [entry for entry in following if entry.get('url')][:count]
+
+
+def _prefetch_entry(entry, ydl_opts, youtube_dl_cls, log):
+    url = entry['url']
+    if result_cache.get_cached_result(url, ydl_opts) is not None:
+        return False
+
+    try:
+        result = pooled_extract_info(youtube_dl_cls, ydl_opts, url)
+    except Exception as exc:
+        log("Playlist prefetch failed for {}: {}".format(url, exc))
+        return False
+
+    stored = result_cache.store_result(url, ydl_opts, result)
+    if stored:
+        log("Prefetched playlist entry {}".format(url))
+    return stored
+
+
+def prefetch_playlist_entries(entries, ydl_opts, youtube_dl_cls, log, max_workers=None):
+    """
+    Resolve *entries* in background threads and cache the results.
+
+    Workers check warm YoutubeDL instances out of the shared pool, one
+    worker per instance at a time. Returns the futures, one per entry, resolving to whether
+    the entry was stored.
+    """
+    if not entries:
+        return []
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers or PLAYLIST_PREFETCH_MAX_WORKERS,
+        thread_name_prefix='playlist-prefetch',
+    )
+    futures = [
+        executor.submit(_prefetch_entry, entry, ydl_opts, youtube_dl_cls, log)
+        for entry in entries
+    ]
+    # Workers keep running after the call returns; the plugin process only
+    # exits once they are done.
+    executor.shutdown(wait=False)
+    return futures
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Optional long-lived resolver that keeps yt-dlp and its extractors loaded.
+
+The add-on's ``xbmc.service`` entry point (resolver_service.py) runs the
+daemon on a loopback port and publishes the port plus a random token in
+addon_data. Plugin invocations forward ``extract_info`` calls to it through
+``RemoteYoutubeDL`` and resolve in-process whenever the daemon is absent or
+unreachable, so the plugin never depends on it.
+"""
+
+import http.client
+import json
+import os
+import secrets
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Thread
+
+from core.persistent_cache import addon_data_path
+from core.ydl_pool import pooled_youtube_dl
+
+RESOLVER_DAEMON_CONNECT_TIMEOUT_SECONDS = 0.5
+RESOLVER_DAEMON_RESOLVE_TIMEOUT_SECONDS = 120
+
+_RESOLVE_PATH = '/resolve'
+_TOKEN_HEADER = 'X-SendToKodi-Token'
+# JSON has no sets; yt-dlp options such as remote_components use them
+_SET_MARKER = '__set__'
+
+
+class ResolverDaemonError(Exception):
+    """Raised when the daemon was reached but extraction failed there."""
+
+
+def endpoint_path():
+    return addon_data_path('resolver_daemon.json')
+
+
+def read_endpoint(path=None):
+    """Return the published ``{'port', 'token', 'pid'}`` endpoint, or None."""
+    try:
+        with open(path or endpoint_path(), 'r') as f:
+            endpoint = json.load(f)
+    except Exception:
+        return None
+
+    if not isinstance(endpoint, dict):
+        return None
+    if not isinstance(endpoint.get('port'), int) or not isinstance(endpoint.get('token'), str):
+        return None
+    return endpoint
+
+
+def _write_endpoint(path, endpoint):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(endpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _remove_endpoint(path, token):
+    # Only remove the file if it still describes this daemon instance.
+    endpoint = read_endpoint(path)
+    if endpoint is None or endpoint['token'] != token:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def encode_ydl_opts(value):
+    """Return *value* with sets replaced by JSON-safe ``{'__set__': [...]}`` objects."""
+    if isinstance(value, (set, frozenset)):
+        return {_SET_MARKER: sorted((encode_ydl_opts(item) for item in value), key=repr)}
+    if isinstance(value, dict):
+        return {key: encode_ydl_opts(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_ydl_opts(item) for item in value]
+    return value
+
+
+def decode_ydl_opts(value):
+    """Restore the sets encoded by encode_ydl_opts()."""
+    if isinstance(value, dict):
+        if set(value) == {_SET_MARKER} and isinstance(value[_SET_MARKER], list):
+            return set(decode_ydl_opts(item) for item in value[_SET_MARKER])
+        return {key: decode_ydl_opts(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_ydl_opts(item) for item in value]
+    return value
+
+
+def extract_info(youtube_dl_cls, url, ydl_opts):
+    with pooled_youtube_dl(youtube_dl_cls, ydl_opts) as ydl:
+        result = ydl.extract_info(url, download=False)
+        sanitize_info = getattr(ydl, 'sanitize_info', None)
+        return sanitize_info(result) if sanitize_info is not None else result
+
+
+def warm_up(youtube_dl_cls, ydl_opts):
+    """Create a pooled instance so the extractor registry is loaded up front."""
+    with pooled_youtube_dl(youtube_dl_cls, ydl_opts):
+        pass
+
+
+class ResolverRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, _format, *_args):
+        # Keep stderr quiet; Kodi logs it as an error.
+        return
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != _RESOLVE_PATH:
+            self._send_json(404, {'error': 'not found'})
+            return
+        if self.headers.get(_TOKEN_HEADER) != self.server.token:
+            self._send_json(403, {'error': 'forbidden'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length))
+            url = request['url']
+            ydl_opts = decode_ydl_opts(request.get('ydl_opts') or {})
+        except (KeyError, TypeError, ValueError):
+            self._send_json(400, {'error': 'bad request'})
+            return
+
+        try:
+            result = self.server.resolve(url, ydl_opts)
+        except Exception as exc:
+            self._send_json(500, {'error': '{}: {}'.format(type(exc).__name__, exc)})
+            return
+
+        self._send_json(200, {'result': result})
+
+
+class ResolverHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, resolve, token):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), ResolverRequestHandler)
+        self.resolve = resolve
+        self.token = token
+        self.endpoint_path = None
+
+
+def start_daemon(youtube_dl_cls, path=None):
+    """Serve resolve requests in a background thread and publish the endpoint."""
+    token = secrets.token_hex(16)
+    httpd = ResolverHTTPServer(lambda url, ydl_opts: extract_info(youtube_dl_cls, url, ydl_opts), token)
+    Thread(target=httpd.serve_forever, kwargs={'poll_interval': 1}, daemon=True).start()
+
+    httpd.endpoint_path = path or endpoint_path()
+    _write_endpoint(httpd.endpoint_path, {
+        'port': httpd.server_address[1],
+        'token': token,
+        'pid': os.getpid(),
+    })
+    return httpd
+
+
+def stop_daemon(httpd):
+    _remove_endpoint(httpd.endpoint_path, httpd.token)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def resolve_remote(url, ydl_opts, endpoint=None, timeout=None):
+    """
+    Resolve *url* through the daemon.
+
+    Returns None when no daemon is reachable so callers can fall back to
+    in-process resolution; raises ResolverDaemonError when the daemon
+    itself failed to extract the URL.
+    """
+    endpoint = endpoint or read_endpoint()
+    if endpoint is None:
+        return None
+
+    try:
+        body = json.dumps({'url': url, 'ydl_opts': encode_ydl_opts(ydl_opts)}).encode('utf-8')
+    except (TypeError, ValueError):
+        return None
+
+    connection = http.client.HTTPConnection(
+        '127.0.0.1',
+        endpoint['port'],
+        timeout=RESOLVER_DAEMON_CONNECT_TIMEOUT_SECONDS,
+    )
+    try:
+        connection.connect()
+        connection.sock.settimeout(timeout or RESOLVER_DAEMON_RESOLVE_TIMEOUT_SECONDS)
+        connection.request('POST', _RESOLVE_PATH, body, {
+            'Content-Type': 'application/json',
+            _TOKEN_HEADER: endpoint['token'],
+        })
+        response = connection.getresponse()
+        payload = json.loads(response.read())
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+    finally:
+        connection.close()
+
+    if response.status == 500:
+        raise ResolverDaemonError(payload.get('error'))
+    if response.status != 200:
+        return None
+    return payload.get('result')
+
+
+class RemoteYoutubeDL():
+    """
+    YoutubeDL stand-in that forwards ``extract_info`` to the resolver daemon.
+
+    Downloads and any call the daemon cannot serve run on a local YoutubeDL,
+    created from *load_youtube_dl_cls* only when it is actually needed.
+    """
+
+    def __init__(self, load_youtube_dl_cls, params=None, auto_init=True, endpoint=None):
+        self.params = dict(params or {})
+        self._load_youtube_dl_cls = load_youtube_dl_cls
+        self._endpoint = endpoint
+        self._default_extractors = bool(auto_init)
+        self._extractors = []
+        self._local = None
+
+    def add_default_info_extractors(self):
+        # The daemon always has the default extractors registered
+        self._default_extractors = True
+
+    def add_info_extractor(self, extractor):
+        self._extractors.append(extractor)
+
+    def _local_instance(self):
+        if self._local is None:
+            self._local = self._load_youtube_dl_cls()(self.params, auto_init=False)
+            if self._default_extractors:
+                self._local.add_default_info_extractors()
+            for extractor in self._extractors:
+                self._local.add_info_extractor(extractor)
+        return self._local
+
+    def extract_info(self, url, download=True, **kwargs):
+        if not download and not kwargs:
+            result = resolve_remote(url, self.params, endpoint=self._endpoint)
+            if result is not None:
+                return result
+        return self._local_instance().extract_info(url, download=download, **kwargs)
+
+    def close(self):
+        if self._local is not None:
+            close = getattr(self._local, 'close', None)
+            if close is not None:
+                close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+        return False
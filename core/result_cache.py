@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of yt-dlp extraction results for single videos.
+
+Results are keyed by the normalized source URL plus a fingerprint of the
+effective yt-dlp options and stored in a compact form, keeping only the
+fields playback selection needs. An entry lives until shortly before the
+earliest signed stream URL in it expires, so a cache hit can be played
+without importing yt-dlp at all.
+"""
+
+import hashlib
+import json
+import re
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from core.persistent_cache import PersistentLRUCache, addon_data_path
+
+RESULT_CACHE_MAX_ENTRIES = 50
+# Results whose stream URLs carry no expiry are only reused for a short while
+RESULT_CACHE_DEFAULT_TTL_SECONDS = 5 * 60
+RESULT_CACHE_MAX_TTL_SECONDS = 60 * 60
+# Stream URLs must stay valid for a while after playback starts
+RESULT_CACHE_EXPIRY_MARGIN_SECONDS = 10 * 60
+
+_RESULT_KEYS = (
+    'id',
+    'title',
+    'description',
+    'thumbnail',
+    'duration',
+    'url',
+    'webpage_url',
+    'original_url',
+    'manifest_url',
+    'protocol',
+    'ext',
+    'vcodec',
+    'acodec',
+    'http_headers',
+    'subtitles',
+    'formats',
+)
+_FORMAT_KEYS = (
+    'format_id',
+    'format',
+    'url',
+    'manifest_url',
+    'protocol',
+    'ext',
+    'container',
+    'vcodec',
+    'acodec',
+    'width',
+    'height',
+    'resolution',
+    'fps',
+    'tbr',
+    'vbr',
+    'abr',
+    'asr',
+    'audio_channels',
+    'filesize',
+    'dynamic_range',
+    'http_headers',
+)
+_EXPIRE_PARAM_RE = re.compile(r'[?&/]expire[=/](\d+)')
+
+_CACHE = None
+
+
+def _result_cache():
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = PersistentLRUCache(
+            addon_data_path('result_cache.json'),
+            RESULT_CACHE_MAX_ENTRIES,
+            RESULT_CACHE_DEFAULT_TTL_SECONDS,
+        )
+    return _CACHE
+
+
+def normalize_url(url):
+    """Normalize *url* so trivially different spellings share a cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    default_port = {'http': ':80', 'https': ':443'}.get(scheme)
+    if default_port and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def _fingerprint_value(value):
+    # Sets (e.g. remote_components) by their contents, anything else that
+    # JSON cannot encode by its repr
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return repr(value)
+
+
+def ydl_opts_fingerprint(ydl_opts):
+    encoded = json.dumps(ydl_opts, sort_keys=True, default=_fingerprint_value)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+
+def result_cache_key(url, ydl_opts):
+    return '{}#{}'.format(normalize_url(url), ydl_opts_fingerprint(ydl_opts))
+
+
+def is_cacheable_result(result):
+    if not isinstance(result, dict):
+        return False
+    # Playlists, live streams and downloads are always resolved again
+    if 'entries' in result or result.get('is_live'):
+        return False
+    if result.get('requested_downloads') or '_filename' in result:
+        return False
+    return bool(result.get('formats') or result.get('url'))
+
+
+def compact_result(result):
+    compact = {key: result[key] for key in _RESULT_KEYS if result.get(key) is not None}
+    if 'formats' in compact:
+        compact['formats'] = [
+            {key: format_info[key] for key in _FORMAT_KEYS if format_info.get(key) is not None}
+            for format_info in compact['formats']
+        ]
+    return compact
+
+
+def _stream_urls(result):
+    yield result.get('url')
+    yield result.get('manifest_url')
+    for format_info in result.get('formats') or []:
+        yield format_info.get('url')
+        yield format_info.get('manifest_url')
+
+
+def result_ttl_seconds(result, now=None):
+    """
+    Return how long *result* may be reused, or 0 when it must not be cached.
+
+    The TTL ends RESULT_CACHE_EXPIRY_MARGIN_SECONDS before the earliest
+    ``expire=`` timestamp of the result's stream URLs.
+    """
+    now = time.time() if now is None else now
+    expiries = [
+        int(match)
+        for url in _stream_urls(result)
+        if url
+        for match in _EXPIRE_PARAM_RE.findall(url)
+    ]
+    if not expiries:
+        return RESULT_CACHE_DEFAULT_TTL_SECONDS
+
+    ttl = min(expiries) - now - RESULT_CACHE_EXPIRY_MARGIN_SECONDS
+    return int(max(0, min(ttl, RESULT_CACHE_MAX_TTL_SECONDS)))
+
+
+def get_cached_result(url, ydl_opts, cache=None):
+    cache = _result_cache() if cache is None else cache
+    return cache.get(result_cache_key(url, ydl_opts))
+
+
+def store_result(url, ydl_opts, result, cache=None, now=None):
+    """Cache *result* for *url*; returns whether it was stored."""
+    if not is_cacheable_result(result):
+        return False
+
+    ttl = result_ttl_seconds(result, now=now)
+    if ttl <= 0:
+        return False
+
+    cache = _result_cache() if cache is None else cache
+    cache.put(result_cache_key(url, ydl_opts), compact_result(result), ttl_seconds=ttl)
+    return cache.flush()
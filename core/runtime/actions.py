@@ -348,7 +348,10 @@ def configure_managed_ytdlp(handle, log):
             _set_installed_version_display("ytdlp", status.get("installed_version"))
 
     if status["ready"] and status["runtime_path"] is not None:
-        manager_module.activate_runtime(status["runtime_path"])
+        manager_module.activate_runtime(
+            status["runtime_path"],
+            zip_runtime=settings["zip_runtime"],
+        )
         log("Using managed yt-dlp version {}".format(status["version"]))
         return
 
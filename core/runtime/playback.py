@@ -4,11 +4,15 @@ import xbmcgui
 import xbmcvfs
 
 from core import dash_builder
+from core.playlist_prefetch import next_playlist_entries, prefetch_playlist_entries
+from core.ydl_pool import pooled_extract_info
 from core.addon_params import build_flat_playlist_item_url, resolve_playlist_item_title
 from core.playback_selection import (
+    build_format_index,
     collect_subtitle_urls,
     encode_inputstream_headers,
     find_playlist_start_index,
+    infer_stream_kind,
     resolve_effective_headers,
     resolve_start_index,
     resolve_starting_entry,
@@ -42,27 +46,6 @@ def _format_stream_option(format_info):
     return "{} | {} | {} / {} | {}".format(format_label, protocol, vcodec, acodec, resolution)
 
 
-def _normalize_codec(codec):
-    value = (codec or "").strip().lower()
-    if value in ("", "none", "unknown", "null"):
-        return "none"
-    return value
-
-
-def _infer_selected_stream_kind(result, selected_url):
-    for format_info in reversed(result.get("formats", [])):
-        if format_info.get("url") != selected_url:
-            continue
-
-        vcodec = _normalize_codec(format_info.get("vcodec"))
-        acodec = _normalize_codec(format_info.get("acodec"))
-        if vcodec == "none" and acodec != "none":
-            return "audio"
-        return "video"
-
-    return "video"
-
-
 def _prompt_preferred_stream_url(result):
     formats = result.get("formats", [])
     entries = []
@@ -84,6 +67,11 @@ def _prompt_preferred_stream_url(result):
     return entries[selected_index - 1][0]
 
 
+def result_refresh_url(result):
+    """Return the URL a DASH refresh re-resolves *result* from."""
+    return result.get("webpage_url") or result.get("original_url") or result.get("url")
+
+
 def create_list_item_from_video(
     result,
     ydl_opts,
@@ -97,23 +85,25 @@ def create_list_item_from_video(
     youtube_dl_cls,
     log,
     show_error_notification,
+    format_scorers=None,
+    decode_profile=None,
 ):
     def resolve_fresh_result():
-        refresh_url = result.get("webpage_url") or result.get("original_url") or result.get("url")
+        refresh_url = result_refresh_url(result)
         if refresh_url is None:
             return None
         try:
             # Re-resolve source metadata so DASH manifests can be rebuilt with fresh stream URLs.
-            refresh_ydl = youtube_dl_cls(ydl_opts)
-            refresh_ydl.add_default_info_extractors()
-            with refresh_ydl:
-                return refresh_ydl.extract_info(refresh_url, download=False)
+            # A warm pooled instance keeps extractor setup, cookies and player JS across refreshes.
+            return pooled_extract_info(youtube_dl_cls, ydl_opts, refresh_url)
         except Exception as exc:
             log("DASH refresh re-resolve failed: {}".format(exc), xbmc.LOGWARNING)
             return None
 
     selection_result = dict(result)
     selection_result["resolve_fresh_result"] = resolve_fresh_result
+    # Classify the formats once for both selection passes and stream labeling
+    format_index = build_format_index(result.get("formats", []))
     preferred_stream_url = _prompt_preferred_stream_url(selection_result) if askstream else None
     selected_source = select_playback_source(
         selection_result,
@@ -125,6 +115,9 @@ def create_list_item_from_video(
         preferred_format_url=preferred_stream_url,
         disable_opus_for_audio_only_hls_native=disable_opus_for_audio_only_hls_native,
         strict_max_resolution=strict_max_resolution,
+        format_index=format_index,
+        format_scorers=format_scorers,
+        decode_profile=decode_profile,
     )
 
     if selected_source is None and preferred_stream_url is not None:
@@ -138,6 +131,9 @@ def create_list_item_from_video(
             dash_builder,
             disable_opus_for_audio_only_hls_native=disable_opus_for_audio_only_hls_native,
             strict_max_resolution=strict_max_resolution,
+            format_index=format_index,
+            format_scorers=format_scorers,
+            decode_profile=decode_profile,
         )
 
     if selected_source is not None:
@@ -170,7 +166,7 @@ def create_list_item_from_video(
 
     log("creating list item for url {}".format(url))
     list_item = xbmcgui.ListItem(result["title"], path=url)
-    stream_kind = _infer_selected_stream_kind(result, url)
+    stream_kind = infer_stream_kind(format_index, url)
     if stream_kind == "audio":
         music_info = list_item.getMusicInfoTag()
         music_info.setTitle(result["title"])
@@ -246,6 +242,9 @@ def play_playlist_result(
     youtube_dl_cls,
     log,
     show_error_notification,
+    prefetch_count=0,
+    format_scorers=None,
+    decode_profile=None,
 ):
     playlist = xbmc.PlayList(1)
     playlist.clear()
@@ -279,6 +278,17 @@ def play_playlist_result(
         youtube_dl_cls,
         log,
         show_error_notification,
+        format_scorers=format_scorers,
+        decode_profile=decode_profile,
     )
     playlist.add(starting_item.getPath(), starting_item, index_to_start_at)
     xbmc.executebuiltin("Playlist.PlayOffset(%s,%d)" % ("video", index_to_start_at))
+
+    # Downloads are never served from the result cache
+    if not media_download_enabled:
+        prefetch_playlist_entries(
+            next_playlist_entries(unresolved_entries, index_to_start_at, prefetch_count),
+            ydl_opts,
+            youtube_dl_cls,
+            log,
+        )
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable, verified downloads for the managed runtimes (yt-dlp and Deno).
+
+A download is written to ``<dest>.part``, and the response validators (ETag
+or Last-Modified) are kept in ``<dest>.part.json``. When the connection
+drops, the transfer continues from the partial file with an HTTP Range
+request. The If-Range validator makes the server send the whole file again
+if it changed in the meantime. A partial file left behind by a failed
+install is resumed the same way by the next attempt. Completed files are
+checked against the SHA-256 published with the release before they are
+used.
+"""
+
+import hashlib
+import http.client
+import json
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+
+RUNTIME_DOWNLOAD_TIMEOUT_SECONDS = 60
+RUNTIME_DOWNLOAD_MAX_ATTEMPTS = 5
+RUNTIME_DOWNLOAD_RETRY_DELAY_SECONDS = 2
+
+_CHUNK_SIZE = 65536  # 64 KiB
+_SHA256_RE = re.compile(r'\b[0-9a-fA-F]{64}\b')
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-\d+/(\d+|\*)')
+# Client errors worth retrying; others such as 404 fail right away
+_RETRYABLE_HTTP_CODES = (408, 429)
+
+
+class IncompleteDownloadError(OSError):
+    """The connection closed before the announced length was received."""
+
+
+class ChecksumMismatchError(RuntimeError):
+    """A completed download does not match its published SHA-256."""
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_sha256sums(text, filename):
+    """
+    Return the SHA-256 for *filename* from a checksum file, or None.
+
+    Understands ``sha256sum`` output listing several files (yt-dlp's
+    ``SHA2-256SUMS``) as well as files carrying a single hash (Deno's
+    ``.sha256sum``).
+    """
+    found = set()
+    for line in text.splitlines():
+        hashes = _SHA256_RE.findall(line)
+        if not hashes:
+            continue
+        names = [os.path.basename(name.lstrip('*')) for name in line.split()]
+        if filename in names:
+            return hashes[0].lower()
+        found.update(value.lower() for value in hashes)
+
+    if len(found) == 1:
+        return found.pop()
+    return None
+
+
+def fetch_published_sha256(checksums_url, filename, timeout=20):
+    with urllib.request.urlopen(checksums_url, timeout=timeout) as response:
+        text = response.read().decode('utf-8', 'replace')
+
+    expected = parse_sha256sums(text, filename)
+    if expected is None:
+        raise RuntimeError("No SHA-256 checksum for {} in {}".format(filename, checksums_url))
+    return expected
+
+
+def _partial_paths(dest_path):
+    return dest_path + '.part', dest_path + '.part.json'
+
+
+def discard_partial_download(dest_path):
+    for path in _partial_paths(dest_path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _load_validators(meta_path, url):
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(meta, dict) or meta.get('url') != url:
+        return None
+    return meta.get('etag') or meta.get('last_modified')
+
+
+def _save_validators(meta_path, url, headers):
+    meta = {
+        'url': url,
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+    }
+    try:
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+    except Exception:
+        pass
+
+
+def _download_attempt(url, dest_path, timeout, on_progress):
+    part_path, meta_path = _partial_paths(dest_path)
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    validator = _load_validators(meta_path, url) if offset else None
+
+    request = urllib.request.Request(url)
+    if validator:
+        request.add_header('Range', 'bytes={}-'.format(offset))
+        request.add_header('If-Range', validator)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as exc:
+        if exc.code == 416:
+            # The partial file does not fit the resource (anymore); start over
+            discard_partial_download(dest_path)
+            raise IncompleteDownloadError("Partial download rejected (HTTP 416)")
+        raise
+
+    with response:
+        match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range') or '')
+        if validator and getattr(response, 'status', 200) == 206 and match and int(match.group(1)) == offset:
+            total = int(match.group(2)) if match.group(2) != '*' else None
+            mode = 'ab'
+        else:
+            # Full response: new download, or the resource changed since
+            offset = 0
+            total = int(response.headers.get('Content-Length') or 0) or None
+            mode = 'wb'
+            _save_validators(meta_path, url, response.headers)
+
+        downloaded = offset
+        with open(part_path, mode) as part:
+            while True:
+                chunk = response.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                part.write(chunk)
+                downloaded += len(chunk)
+                if on_progress is not None:
+                    on_progress(downloaded, total)
+
+    # http.client reports a dropped connection as a short read
+    if total is not None and downloaded < total:
+        raise IncompleteDownloadError(
+            "Connection closed after {} of {} bytes".format(downloaded, total)
+        )
+
+
+def _is_retryable(exc):
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code >= 500 or exc.code in _RETRYABLE_HTTP_CODES
+    return isinstance(exc, (OSError, http.client.HTTPException))
+
+
+def download_file(url, dest_path, expected_sha256=None, on_progress=None, timeout=None, max_attempts=None):
+    """
+    Download *url* to *dest_path*, resuming after dropped connections.
+
+    *on_progress* is called with ``(downloaded_bytes, total_bytes_or_None)``.
+    Raises ChecksumMismatchError (and discards the data) when the result does
+    not match *expected_sha256*. After the last failed attempt the partial
+    file is kept so a later call resumes it.
+    """
+    timeout = timeout or RUNTIME_DOWNLOAD_TIMEOUT_SECONDS
+    max_attempts = max_attempts or RUNTIME_DOWNLOAD_MAX_ATTEMPTS
+    part_path, meta_path = _partial_paths(dest_path)
+    os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            _download_attempt(url, dest_path, timeout, on_progress)
+            break
+        except Exception as exc:
+            if attempt >= max_attempts or not _is_retryable(exc):
+                raise
+        time.sleep(RUNTIME_DOWNLOAD_RETRY_DELAY_SECONDS)
+
+    if expected_sha256:
+        actual = sha256_file(part_path)
+        if actual != expected_sha256.lower():
+            discard_partial_download(dest_path)
+            raise ChecksumMismatchError(
+                "SHA-256 mismatch for {}: expected {}, got {}".format(url, expected_sha256, actual)
+            )
+
+    os.replace(part_path, dest_path)
+    try:
+        os.remove(meta_path)
+    except OSError:
+        pass
+    return dest_path
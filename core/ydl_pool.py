@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of warm YoutubeDL instances shared by long-lived resolver code.
+
+Creating a YoutubeDL and registering its extractors is the expensive part of
+a resolve, so instances are kept per effective option set (and URL host,
+since extractors are registered per host) and handed out one caller at a
+time: YoutubeDL is not thread-safe, but the threaded DASH server, the
+resolver daemon and playlist prefetch workers may all resolve concurrently.
+A reused instance keeps its HTTP connections, cookie jar and the extractors'
+caches such as YouTube's player JS. Like the plugin, pooled_extract_info()
+retries with all extractors when the routed ones fail.
+"""
+
+import atexit
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from urllib.parse import urlsplit
+
+from core.extractor_index import create_youtube_dl
+from core.result_cache import ydl_opts_fingerprint
+
+YDL_POOL_MAX_OPTION_SETS = 4
+YDL_POOL_MAX_IDLE_PER_OPTION_SET = 2
+
+_POOL_LOCK = Lock()
+# (youtube_dl_cls, options fingerprint, URL host) -> idle (instance, targeted)
+# pairs, least recently used first
+_IDLE_INSTANCES = OrderedDict()
+
+
+def _pool_key(youtube_dl_cls, ydl_opts, url):
+    host = (urlsplit(url).hostname or '').lower() if url else None
+    return (youtube_dl_cls, ydl_opts_fingerprint(ydl_opts), host)
+
+
+def _create_instance(youtube_dl_cls, ydl_opts, url):
+    if url:
+        return create_youtube_dl(youtube_dl_cls, dict(ydl_opts), url)
+    ydl = youtube_dl_cls(dict(ydl_opts))
+    ydl.add_default_info_extractors()
+    return ydl, False
+
+
+def close_youtube_dl(ydl):
+    close = getattr(ydl, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _checkout(key):
+    with _POOL_LOCK:
+        idle = _IDLE_INSTANCES.get(key)
+        if idle:
+            _IDLE_INSTANCES.move_to_end(key)
+            return idle.pop()
+    return None
+
+
+def _checkin(key, entry):
+    discarded = []
+    with _POOL_LOCK:
+        idle = _IDLE_INSTANCES.setdefault(key, [])
+        _IDLE_INSTANCES.move_to_end(key)
+        if len(idle) < YDL_POOL_MAX_IDLE_PER_OPTION_SET:
+            idle.append(entry)
+        else:
+            discarded.append(entry)
+        while len(_IDLE_INSTANCES) > YDL_POOL_MAX_OPTION_SETS:
+            _key, evicted = _IDLE_INSTANCES.popitem(last=False)
+            discarded.extend(evicted)
+
+    for ydl, _targeted in discarded:
+        close_youtube_dl(ydl)
+
+
+@contextmanager
+def _pooled_instance(youtube_dl_cls, ydl_opts, url):
+    key = _pool_key(youtube_dl_cls, ydl_opts, url)
+    entry = _checkout(key)
+    if entry is None:
+        entry = _create_instance(youtube_dl_cls, ydl_opts, url)
+    try:
+        yield entry
+    finally:
+        _checkin(key, entry)
+
+
+@contextmanager
+def pooled_youtube_dl(youtube_dl_cls, ydl_opts, url=None):
+    """
+    Yield a YoutubeDL for *ydl_opts*, reusing an idle instance created with
+    the same options when available. With *url* only the extractors routed
+    for its host are registered, otherwise all default extractors.
+    """
+    with _pooled_instance(youtube_dl_cls, ydl_opts, url) as (ydl, _targeted):
+        yield ydl
+
+
+def pooled_extract_info(youtube_dl_cls, ydl_opts, url):
+    """
+    Resolve *url* without downloading on a pooled instance.
+
+    Routed extractors may hand off to sites they do not cover, so when an
+    instance with only those fails the URL is resolved again with all
+    default extractors.
+    """
+    with _pooled_instance(youtube_dl_cls, ydl_opts, url) as (ydl, targeted):
+        try:
+            return ydl.extract_info(url, download=False)
+        except Exception:
+            if not targeted:
+                raise
+
+    with pooled_youtube_dl(youtube_dl_cls, ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
+
+def adopt_youtube_dl(youtube_dl_cls, ydl_opts, url, ydl, targeted=True):
+    """
+    Hand an instance over to the pool under the host of *url*.
+
+    *targeted* tells whether only routed extractors are registered, in which
+    case pooled_extract_info() retries a failed extraction with all of them.
+    """
+    _checkin(_pool_key(youtube_dl_cls, ydl_opts, url), (ydl, targeted))
+
+
+def get_ydl_pool_stats():
+    with _POOL_LOCK:
+        return {
+            'option_sets': len(_IDLE_INSTANCES),
+            'idle_instances': sum(len(idle) for idle in _IDLE_INSTANCES.values()),
+        }
+
+
+def clear_ydl_pool():
+    with _POOL_LOCK:
+        instances = [ydl for idle in _IDLE_INSTANCES.values() for ydl, _targeted in idle]
+        _IDLE_INSTANCES.clear()
+
+    for ydl in instances:
+        close_youtube_dl(ydl)
+
+
+# Pooled instances are never closed by their users; close them (which also
+# saves the cookie jar) when the process exits.
+atexit.register(clear_ydl_pool)
@@ -7,16 +7,20 @@ This module allows the addon to keep a managed yt-dlp installation under
 between versions based on addon settings.
 """
 
+import compileall
 import io
 import json
 import logging
 import os
+import py_compile
 import time
 import shutil
 import sys
 import tarfile
 import urllib.error
 import urllib.request
+import zipfile
+from core.runtime_download import download_file, fetch_published_sha256
 from core.runtime_update_state import (
     apply_failure_state,
     apply_success_state,
@@ -38,7 +42,12 @@ YTDLP_LATEST_SENTINEL = "latest"
 
 _LATEST_RELEASE_API = "https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest"
 _RELEASES_API = "https://api.github.com/repos/yt-dlp/yt-dlp/releases?per_page=100&page={page}"
-_TARBALL_URL = "https://github.com/yt-dlp/yt-dlp/archive/refs/tags/{version}.tar.gz"
+# Release assets rather than GitHub's generated archives, which have no
+# published checksums
+_TARBALL_NAME = "yt-dlp.tar.gz"
+_TARBALL_URL = "https://github.com/yt-dlp/yt-dlp/releases/download/{version}/" + _TARBALL_NAME
+_CHECKSUMS_URL = "https://github.com/yt-dlp/yt-dlp/releases/download/{version}/SHA2-256SUMS"
+_COPY_BUFFER_SIZE = 65536  # 64 KiB
 
 
 def _log(msg, level=None):
@@ -164,10 +173,163 @@ def _runtime_path_for_version(version):
     return os.path.join(_versions_dir(), version)
 
 
+def _archive_path_for_version(version):
+    return os.path.join(_versions_dir(), "{}.tar.gz".format(version))
+
+
 def _yt_dlp_package_path(runtime_path):
     return os.path.join(runtime_path, "yt_dlp")
 
 
+def _bytecode_marker_path(runtime_path):
+    return os.path.join(runtime_path, "bytecode.json")
+
+
+def runtime_bytecode_is_current(runtime_path):
+    """Return whether the runtime was byte-compiled for the running interpreter."""
+    try:
+        with open(_bytecode_marker_path(runtime_path), "r") as f:
+            marker = json.load(f)
+    except Exception:
+        return False
+    return isinstance(marker, dict) and marker.get("cache_tag") == sys.implementation.cache_tag
+
+
+def compile_runtime_bytecode(runtime_path):
+    """
+    Byte-compile the runtime's yt_dlp package for the running interpreter.
+
+    Kodi does not write ``__pycache__`` on import, so without this every play
+    compiles the imported yt-dlp modules again. Files that are already up to
+    date are skipped, and the marker records the interpreter's cache tag so a
+    Kodi Python upgrade triggers a recompile.
+    """
+    package_path = _yt_dlp_package_path(runtime_path)
+    if not os.path.isdir(package_path):
+        return False
+
+    try:
+        compiled = compileall.compile_dir(package_path, quiet=1)
+    except Exception as exc:
+        _warn("Could not byte-compile yt-dlp runtime: {}".format(exc))
+        return False
+    if not compiled:
+        _warn("Some yt-dlp modules could not be byte-compiled")
+        return False
+
+    try:
+        with open(_bytecode_marker_path(runtime_path), "w") as f:
+            json.dump(
+                {
+                    "cache_tag": sys.implementation.cache_tag,
+                    "python": sys.version.split()[0],
+                },
+                f,
+            )
+    except Exception as exc:
+        _warn("Could not write yt-dlp bytecode marker: {}".format(exc))
+    return True
+
+
+def ensure_runtime_bytecode(runtime_path):
+    """
+    Compile the runtime unless it is already compiled for this interpreter.
+
+    Runs in the add-on service (and after installs), never in a plugin
+    process: Kodi ends those right after playback starts, which would cut
+    the compile short on every play.
+    """
+    if runtime_bytecode_is_current(runtime_path):
+        return None
+    return compile_runtime_bytecode(runtime_path)
+
+
+def runtime_zip_path(runtime_path):
+    """Return where the zip of the runtime for the running interpreter lives."""
+    # The cache tag in the name makes a Kodi Python upgrade pack a new zip
+    return os.path.join(runtime_path, "yt_dlp-{}.zip".format(sys.implementation.cache_tag))
+
+
+def pack_runtime_zip(runtime_path):
+    """
+    Pack the runtime's yt_dlp package into a zip imported through zipimport.
+
+    Every module is stored next to its unchecked hash-based ``.pyc``, the
+    layout zipimport loads bytecode from, so importing neither compiles nor
+    validates sources. The archive is not compressed: yt-dlp is imported on
+    every play and inflating it would cost more than the bytes saved. It is
+    written to a temporary file and moved into place, so an interrupted pack
+    never leaves a truncated zip behind. Zips packed for other interpreters
+    are removed.
+    """
+    package_path = _yt_dlp_package_path(runtime_path)
+    if not os.path.isdir(package_path):
+        return False
+
+    zip_path = runtime_zip_path(runtime_path)
+    tmp_zip_path = zip_path + ".tmp"
+    tmp_pyc_path = zip_path + ".pyc.tmp"
+    try:
+        with zipfile.ZipFile(tmp_zip_path, "w", zipfile.ZIP_STORED) as archive:
+            for root, dirs, files in os.walk(package_path):
+                dirs[:] = sorted(name for name in dirs if name != "__pycache__")
+                for name in sorted(files):
+                    if name.endswith(".pyc"):
+                        continue
+                    path = os.path.join(root, name)
+                    arcname = os.path.relpath(path, runtime_path).replace(os.sep, "/")
+                    archive.write(path, arcname)
+                    if not name.endswith(".py"):
+                        continue
+                    # Tracebacks point into the zip, where zipimport finds the source
+                    py_compile.compile(
+                        path,
+                        cfile=tmp_pyc_path,
+                        dfile=os.path.join(zip_path, arcname),
+                        doraise=True,
+                        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+                    )
+                    archive.write(tmp_pyc_path, arcname[:-3] + ".pyc")
+        os.replace(tmp_zip_path, zip_path)
+    except Exception as exc:
+        _warn("Could not pack yt-dlp runtime into a zip: {}".format(exc))
+        try:
+            os.remove(tmp_zip_path)
+        except OSError:
+            pass
+        return False
+    finally:
+        try:
+            os.remove(tmp_pyc_path)
+        except OSError:
+            pass
+
+    for name in os.listdir(runtime_path):
+        path = os.path.join(runtime_path, name)
+        if name.startswith("yt_dlp-") and name.endswith(".zip") and path != zip_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return True
+
+
+def runtime_zip_is_current(runtime_path):
+    """Return whether a complete zip for the running interpreter exists."""
+    return zipfile.is_zipfile(runtime_zip_path(runtime_path))
+
+
+def ensure_runtime_zip(runtime_path):
+    """
+    Pack the runtime unless a zip for this interpreter already exists.
+
+    Like ensure_runtime_bytecode() this runs in the add-on service.
+    """
+    if runtime_zip_is_current(runtime_path):
+        return None
+    return pack_runtime_zip(runtime_path)
+
+
 def _find_runtime_for_version(version):
     runtime_path = _runtime_path_for_version(version)
     package_path = _yt_dlp_package_path(runtime_path)
@@ -176,6 +338,14 @@ def _find_runtime_for_version(version):
     return None
 
 
+def extractor_index_path(version):
+    """Return where the extractor routing index of *version* lives, if installed."""
+    runtime_path = _find_runtime_for_version(version)
+    if runtime_path is None:
+        return None
+    return os.path.join(runtime_path, "extractor_index.json")
+
+
 def _find_installed_runtime():
     version = _read_installed_version()
     if version is None:
@@ -349,37 +519,54 @@ def _safe_join(base_dir, relative_path):
     return joined
 
 
-def _extract_yt_dlp_from_tarball(tar_bytes, destination_runtime_path):
+def _extract_yt_dlp_from_tarball(tar_source, destination_runtime_path):
+    """
+    Extract the ``yt_dlp`` package from a gzipped release tarball.
+
+    *tar_source* is a readable stream (or the archive bytes). The archive is
+    read in stream mode and every member is copied with a bounded buffer, so
+    memory use does not grow with the archive size.
+    """
+    if isinstance(tar_source, bytes):
+        tar_source = io.BytesIO(tar_source)
+
     tmp_path = destination_runtime_path + ".tmp"
     if os.path.isdir(tmp_path):
         shutil.rmtree(tmp_path)
     os.makedirs(tmp_path, exist_ok=True)
 
-    with tarfile.open(fileobj=io.BytesIO(tar_bytes), mode="r:gz") as tf:
-        for member in tf.getmembers():
-            name = member.name.replace("\\", "/")
-            if "/" not in name:
-                continue
+    try:
+        with tarfile.open(fileobj=tar_source, mode="r|gz") as tf:
+            for member in tf:
+                name = member.name.replace("\\", "/")
+                if "/" not in name:
+                    continue
 
-            rel_name = name.split("/", 1)[1]
-            if rel_name != "yt_dlp" and not rel_name.startswith("yt_dlp/"):
-                continue
+                rel_name = name.split("/", 1)[1]
+                if rel_name != "yt_dlp" and not rel_name.startswith("yt_dlp/"):
+                    continue
 
-            target_path = _safe_join(tmp_path, rel_name)
-            if member.isdir():
-                os.makedirs(target_path, exist_ok=True)
-                continue
+                target_path = _safe_join(tmp_path, rel_name)
+                if member.isdir():
+                    os.makedirs(target_path, exist_ok=True)
+                    continue
+                if not member.isfile():
+                    continue
 
-            src = tf.extractfile(member)
-            if src is None:
-                continue
+                src = tf.extractfile(member)
+                if src is None:
+                    continue
 
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-            with open(target_path, "wb") as dst:
-                dst.write(src.read())
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with open(target_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, _COPY_BUFFER_SIZE)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
 
     expected_init = os.path.join(tmp_path, "yt_dlp", "__init__.py")
     if not os.path.isfile(expected_init):
+        shutil.rmtree(tmp_path, ignore_errors=True)
         raise RuntimeError("Downloaded archive does not contain a valid yt_dlp package")
 
     if os.path.isdir(destination_runtime_path):
@@ -401,35 +588,47 @@ def _download_and_install(version):
     except Exception:
         progress = None
 
+    runtime_path = _runtime_path_for_version(version)
+    archive_path = _archive_path_for_version(version)
+    reported = {"pct": -1}
+
+    def report_progress(downloaded, total):
+        if progress is None or not total:
+            return
+        pct = int(downloaded * 100 / total)
+        if pct == reported["pct"]:
+            return
+        reported["pct"] = pct
+        progress.update(
+            pct,
+            "Downloading yt-dlp {} ({}/{} MB)...".format(
+                version,
+                downloaded // (1024 * 1024),
+                total // (1024 * 1024),
+            ),
+        )
+
     try:
-        with urllib.request.urlopen(url, timeout=60) as response:
-            total = int(response.headers.get("Content-Length", 0))
-            downloaded = 0
-            chunks = []
-            chunk_size = 65536  # 64 KiB
-            while True:
-                chunk = response.read(chunk_size)
-                if not chunk:
-                    break
-                chunks.append(chunk)
-                downloaded += len(chunk)
-                if progress is not None and total > 0:
-                    pct = int(downloaded * 100 / total)
-                    progress.update(
-                        pct,
-                        "Downloading yt-dlp {} ({}/{} MB)...".format(
-                            version,
-                            downloaded // (1024 * 1024),
-                            total // (1024 * 1024),
-                        ),
-                    )
-            data = b"".join(chunks)
+        expected_sha256 = fetch_published_sha256(_CHECKSUMS_URL.format(version=version), _TARBALL_NAME)
+        # Resumes a partial download left by an earlier attempt
+        download_file(url, archive_path, expected_sha256=expected_sha256, on_progress=report_progress)
     finally:
         if progress is not None:
             progress.close()
 
-    runtime_path = _runtime_path_for_version(version)
-    _extract_yt_dlp_from_tarball(data, runtime_path)
+    try:
+        # Extraction streams from the verified archive; it is never held in
+        # memory as a whole.
+        with open(archive_path, "rb") as archive:
+            _extract_yt_dlp_from_tarball(archive, runtime_path)
+    finally:
+        try:
+            os.remove(archive_path)
+        except OSError:
+            pass
+
+    # Compile now so the first play does not pay for it
+    compile_runtime_bytecode(runtime_path)
     _write_installed_version(version)
     _log("yt-dlp {} installed at {}".format(version, runtime_path))
     return runtime_path
@@ -566,10 +765,19 @@ def ensure_ytdlp_ready(
         return _not_ready("error", None, None, None, error=str(exc))
 
 
-def activate_runtime(runtime_path):
-    """Prepend the managed runtime path to sys.path so yt_dlp imports from it."""
+def activate_runtime(runtime_path, zip_runtime=False):
+    """
+    Prepend the managed runtime path to sys.path so yt_dlp imports from it.
+
+    With *zip_runtime* yt_dlp is imported from the runtime's zip, which
+    replaces hundreds of file lookups and opens with reads from one archive.
+    The directory is used until the add-on service has packed the zip.
+    """
     if runtime_path is None:
         return
-    if runtime_path in sys.path:
+    import_path = runtime_path
+    if zip_runtime and runtime_zip_is_current(runtime_path):
+        import_path = runtime_zip_path(runtime_path)
+    if import_path in sys.path:
         return
-    sys.path.insert(0, runtime_path)
\ No newline at end of file
+    sys.path.insert(0, import_path)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Kodi service entry point running the optional resolver daemon.
+
+While the "resolver_daemon" setting is enabled, yt-dlp and its extractors
+stay loaded in this long-lived process and plugin invocations forward their
+extraction requests here (see core/resolver_daemon.py).
+
+The service also byte-compiles the managed yt-dlp runtime when it is not
+compiled for Kodi's Python yet, and packs it into a zip when the zip runtime
+setting is enabled. Plugin processes are ended right after playback starts,
+so they never do that work themselves.
+"""
+import importlib
+
+import xbmc
+import xbmcaddon
+
+from core import resolver_daemon
+from core.addon_params import build_ydl_opts, resolve_js_runtime_opts, resolve_ytdlp_settings
+
+SETTINGS_POLL_SECONDS = 10
+
+# Runtimes already prepared by this service run; a failed compile is not
+# retried every poll
+_PREPARED_RUNTIMES = set()
+
+
+def log(msg, level=xbmc.LOGINFO):
+    addon = xbmcaddon.Addon()
+    addonID = addon.getAddonInfo('id')
+    xbmc.log('%s: %s' % (addonID, msg), level)
+
+
+def get_setting(_handle, name):
+    return xbmcaddon.Addon().getSetting(name)
+
+
+def load_youtube_dl_cls():
+    # Use the managed runtime when installed; never download from a service,
+    # the plugin takes care of installs and prompts.
+    settings = resolve_ytdlp_settings(None, get_setting)
+    manager_module = importlib.import_module("core.ytdlp_manager")
+    status = manager_module.ensure_ytdlp_ready(
+        allow_install=False,
+        requested_version=settings["version"],
+    )
+    if status["ready"] and status["runtime_path"] is not None:
+        manager_module.activate_runtime(
+            status["runtime_path"],
+            zip_runtime=settings["zip_runtime"],
+        )
+    return importlib.import_module("yt_dlp").YoutubeDL
+
+
+def prepare_managed_runtime():
+    settings = resolve_ytdlp_settings(None, get_setting)
+    manager_module = importlib.import_module("core.ytdlp_manager")
+    status = manager_module.ensure_ytdlp_ready(
+        allow_install=False,
+        requested_version=settings["version"],
+    )
+    runtime_path = status["runtime_path"]
+    prepared_key = (runtime_path, settings["zip_runtime"])
+    if not status["ready"] or runtime_path is None or prepared_key in _PREPARED_RUNTIMES:
+        return
+    _PREPARED_RUNTIMES.add(prepared_key)
+    if manager_module.ensure_runtime_bytecode(runtime_path):
+        log("Byte-compiled managed yt-dlp {}".format(status["version"]))
+    if settings["zip_runtime"] and manager_module.ensure_runtime_zip(runtime_path):
+        log("Packed managed yt-dlp {} into a zip".format(status["version"]))
+
+
+def plugin_ydl_opts():
+    # The options a plugin invocation without extra yt-dlp options sends, so
+    # the warmed-up instance is the one its requests are served from
+    try:
+        from core.deno_manager import get_ydl_opts
+        js_runtime_opts = resolve_js_runtime_opts(None, get_setting, get_ydl_opts)
+    except Exception as exc:
+        log("Failed to configure JavaScript runtime: {}".format(exc), xbmc.LOGWARNING)
+        js_runtime_opts = {}
+    return build_ydl_opts({}, js_runtime_opts)
+
+
+def start_resolver_daemon():
+    youtube_dl_cls = load_youtube_dl_cls()
+    resolver_daemon.warm_up(youtube_dl_cls, plugin_ydl_opts())
+    httpd = resolver_daemon.start_daemon(youtube_dl_cls)
+    log("Resolver daemon listening on port {}".format(httpd.server_address[1]))
+    return httpd
+
+
+def run():
+    monitor = xbmc.Monitor()
+    httpd = None
+    start_failed = False
+
+    while not monitor.abortRequested():
+        # Picks up new installs and version switches
+        try:
+            prepare_managed_runtime()
+        except Exception as exc:
+            log("Could not prepare managed yt-dlp: {}".format(exc), xbmc.LOGWARNING)
+
+        enabled = get_setting(None, "resolver_daemon") == 'true'
+        if enabled and httpd is None and not start_failed:
+            try:
+                httpd = start_resolver_daemon()
+            except Exception as exc:
+                # Retried only once the setting is toggled again
+                start_failed = True
+                log("Resolver daemon failed to start: {}".format(exc), xbmc.LOGWARNING)
+        elif not enabled:
+            start_failed = False
+            if httpd is not None:
+                resolver_daemon.stop_daemon(httpd)
+                httpd = None
+                log("Resolver daemon stopped")
+
+        if monitor.waitForAbort(SETTINGS_POLL_SECONDS):
+            break
+
+    if httpd is not None:
+        resolver_daemon.stop_daemon(httpd)
+
+
+if __name__ == '__main__':
+    run()
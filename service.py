@@ -7,7 +7,7 @@ import xbmcaddon
 import xbmcgui
 import xbmcplugin
 import xbmcvfs
-from core import dash_builder
+from core import dash_builder, isa_capabilities, resolver_daemon, result_cache
 
 from core.addon_params import (
     parse_cli_paramstring,
@@ -17,12 +17,19 @@ from core.addon_params import (
     resolve_js_runtime_opts,
     resolve_media_download_settings,
     resolve_dash_httpd_idle_timeout,
+    resolve_playlist_prefetch_count,
+    resolve_format_ranking,
+    resolve_decode_profile,
 )
+from core.extractor_index import create_youtube_dl
+from core.format_ranking import build_format_scorers
+from core.ydl_pool import adopt_youtube_dl, close_youtube_dl
 from core.runtime.playback import (
     create_list_item_from_video,
     download_result_with_progress,
     extract_result_with_progress,
     play_playlist_result,
+    result_refresh_url,
 )
 from core.runtime.actions import (
     configure_managed_ytdlp,
@@ -94,24 +101,39 @@ if legacy_python_workarounds_enabled:
     install_stderr_workaround()
 
 
+def isa_adaptive_version():
+    try:
+        return xbmcaddon.Addon('inputstream.adaptive').getAddonInfo('version')
+    except Exception:
+        return None
+
+
 try:
     import inputstreamhelper
 
-    def isa_supports(stream):
-        if stream is None or len(stream) < 1:
-            return False
+    def check_inputstream(stream):
         return inputstreamhelper.Helper(stream).check_inputstream()
+
+    # Checks are cached per manifest type until inputstream.adaptive changes
+    isa_supports = isa_capabilities.create_isa_supports(check_inputstream, isa_adaptive_version)
 except ImportError:
     def isa_supports(stream):
         return False
 
 
+# The YoutubeDL that resolved the url; handed to the pool on success
+ydl = None
+
+
 def handle_resolve_failure(set_resolved_false=False):
     showErrorNotification("Could not resolve the url, check the log for more info")
     import traceback
     log(msg=traceback.format_exc(), level=xbmc.LOGERROR)
     if set_resolved_false:
         xbmcplugin.setResolvedUrl(__handle__, False, listitem=xbmcgui.ListItem())
+    # Not pooled, so close it here (this also saves the cookie jar)
+    if ydl is not None:
+        close_youtube_dl(ydl)
     exit()
 
 
@@ -164,17 +186,26 @@ if action is not None and handle_runtime_action(
 
 configure_managed_ytdlp(__handle__, log)
 
-# yt-dlp is the only supported resolver
-try:
-    YoutubeDL = importlib.import_module("yt_dlp").YoutubeDL
-except Exception as exc:
-    showErrorNotification("yt-dlp is unavailable")
-    log("yt-dlp import failed: {}".format(exc), xbmc.LOGERROR)
-    exit()
+_youtube_dl_cls = None
+
+
+def load_youtube_dl_cls():
+    # yt-dlp is the only supported resolver. It is imported on first use so
+    # cached extraction results can be played without loading it.
+    global _youtube_dl_cls
+    if _youtube_dl_cls is None:
+        _youtube_dl_cls = importlib.import_module("yt_dlp").YoutubeDL
+        # patch broken strptime (see above)
+        if legacy_python_workarounds_enabled:
+            patch_strptime()
+    return _youtube_dl_cls
+
+
+def YoutubeDL(*args, **kwargs):
+    if use_resolver_daemon:
+        return resolver_daemon.RemoteYoutubeDL(load_youtube_dl_cls, *args, **kwargs)
+    return load_youtube_dl_cls()(*args, **kwargs)
 
-# patch broken strptime (see above)
-if legacy_python_workarounds_enabled:
-    patch_strptime()
 
 params = parse_cli_paramstring(sys.argv[2])
 url = str(params['url'])
@@ -212,21 +243,65 @@ disable_opus_for_audio_only_hls_native = (
 dash_httpd_idle_timeout_seconds = resolve_dash_httpd_idle_timeout(__handle__, xbmcplugin.getSetting)
 dash_builder.DASH_HTTPD_IDLE_TIMEOUT_SECONDS = dash_httpd_idle_timeout_seconds
 log("DASH MPD server idle timeout: {}s".format(dash_httpd_idle_timeout_seconds))
+dash_builder.DASH_SEGMENT_PROXY_ENABLED = xbmcplugin.getSetting(__handle__, "dash_segment_proxy") == 'true'
 maxresolution_setting = int(xbmcplugin.getSetting(__handle__, "maxresolution"))
 strict_max_resolution = maxresolution_setting >= 0
 maxwidth = maxresolution_setting if strict_max_resolution else 7680
-
-ydl = YoutubeDL(ydl_opts)
-ydl.add_default_info_extractors()
-
-with ydl:
+format_scorers = build_format_scorers(resolve_format_ranking(__handle__, xbmcplugin.getSetting))
+decode_profile = resolve_decode_profile(__handle__, xbmcplugin.getSetting, sys.argv[2])
+if decode_profile:
+    log("Hardware decode profile: {}".format(decode_profile))
+
+result = None
+if not media_download_enabled:
+    result = result_cache.get_cached_result(url, ydl_opts)
+    if result is not None:
+        log("Using cached extraction result for {}".format(url))
+
+# The resolver daemon keeps yt-dlp loaded in the add-on service; extraction
+# falls back to this process whenever it is not reachable.
+use_resolver_daemon = (
+    xbmcplugin.getSetting(__handle__, "resolver_daemon") == 'true'
+    and resolver_daemon.read_endpoint() is not None
+)
+if use_resolver_daemon:
+    log("Forwarding extraction to the resolver daemon")
+
+if result is None:
+    if not use_resolver_daemon:
+        try:
+            load_youtube_dl_cls()
+        except Exception as exc:
+            showErrorNotification("yt-dlp is unavailable")
+            log("yt-dlp import failed: {}".format(exc), xbmc.LOGERROR)
+            exit()
+
+    def resolve_with(ydl):
+        resolved = extract_result_with_progress(ydl, url)
+        if media_download_enabled and 'entries' not in resolved:
+            resolved = download_result_with_progress(ydl, url)
+        return resolved
+
+    ydl, targeted_extractors = create_youtube_dl(YoutubeDL, ydl_opts, url)
     try:
-        result = extract_result_with_progress(ydl, url)
-        if media_download_enabled and 'entries' not in result:
-            result = download_result_with_progress(ydl, url)
+        try:
+            result = resolve_with(ydl)
+        except Exception:
+            if not targeted_extractors:
+                raise
+            # Routed extractors may hand off to sites they do not cover
+            log("Retrying extraction with all extractors", xbmc.LOGWARNING)
+            close_youtube_dl(ydl)
+            ydl = YoutubeDL(ydl_opts)
+            ydl.add_default_info_extractors()
+            targeted_extractors = False
+            result = resolve_with(ydl)
     except Exception:
         handle_resolve_failure()
 
+    if not media_download_enabled:
+        result_cache.store_result(url, ydl_opts, result)
+
 if 'entries' in result:
     try:
         play_playlist_result(
@@ -247,6 +322,9 @@ if 'entries' in result:
             YoutubeDL,
             log,
             showErrorNotification,
+            prefetch_count=resolve_playlist_prefetch_count(__handle__, xbmcplugin.getSetting),
+            format_scorers=format_scorers,
+            decode_profile=decode_profile,
         )
     except Exception:
         handle_resolve_failure()
@@ -265,7 +343,26 @@ else:
             YoutubeDL,
             log,
             showErrorNotification,
+            format_scorers=format_scorers,
+            decode_profile=decode_profile,
         )
         xbmcplugin.setResolvedUrl(__handle__, True, listitem=list_item)
     except Exception:
         handle_resolve_failure(set_resolved_false=True)
+
+isa_capability_stats = isa_capabilities.get_isa_capability_stats()
+log("inputstream capability checks: {} real, {} cached".format(
+    isa_capability_stats['checks'],
+    isa_capability_stats['hits'],
+))
+
+# Keep the warm instance around so DASH manifest refreshes reuse it; they
+# look it up by the URL they re-resolve, which may be on another host.
+if ydl is not None:
+    adopt_youtube_dl(
+        YoutubeDL,
+        ydl_opts,
+        result_refresh_url(result) or url,
+        ydl,
+        targeted=targeted_extractors,
+    )
@@ -1,9 +1,11 @@
 from core.addon_params import (
     DEFAULT_DASH_HTTPD_IDLE_TIMEOUT_SECONDS,
     DEFAULT_DENO_VERSION,
+    DEFAULT_PLAYLIST_PREFETCH_COUNT,
     DEFAULT_JS_RUNTIME_MODE,
     MAX_DASH_HTTPD_IDLE_TIMEOUT_SECONDS,
     DEFAULT_MEDIA_DOWNLOAD_PATH,
+    MAX_PLAYLIST_PREFETCH_COUNT,
     MIN_DASH_HTTPD_IDLE_TIMEOUT_SECONDS,
     DEFAULT_YTDLP_VERSION,
     parse_cli_paramstring,
@@ -17,6 +19,9 @@ from core.addon_params import (
     resolve_js_runtime_opts,
     resolve_quickjs_opts,
     resolve_dash_httpd_idle_timeout,
+    resolve_playlist_prefetch_count,
+    resolve_format_ranking,
+    resolve_decode_profile,
     resolve_media_download_settings,
     resolve_ytdlp_settings,
 )
@@ -521,6 +526,7 @@ def test_resolve_ytdlp_settings_uses_defaults_when_version_empty():
     assert settings == {
         "auto_update": True,
         "version": DEFAULT_YTDLP_VERSION,
+        "zip_runtime": False,
     }
 
 
@@ -530,6 +536,8 @@ def test_resolve_ytdlp_settings_reads_all_values():
             return "false"
         if name == "ytdlp_version":
             return "2026.03.26"
+        if name == "ytdlp_zip_runtime":
+            return "true"
         return ""
 
     settings = resolve_ytdlp_settings(1, get_setting)
@@ -537,6 +545,7 @@ def test_resolve_ytdlp_settings_reads_all_values():
     assert settings == {
         "auto_update": False,
         "version": DEFAULT_YTDLP_VERSION,
+        "zip_runtime": True,
     }
 
 
@@ -568,3 +577,69 @@ def test_resolve_dash_httpd_idle_timeout_accepts_valid_integer():
     value = resolve_dash_httpd_idle_timeout(1, lambda _handle, _name: "180")
 
     assert value == 180
+
+
+def test_resolve_playlist_prefetch_count_uses_default_when_missing_or_invalid():
+    assert resolve_playlist_prefetch_count(1, lambda _handle, _name: "") == DEFAULT_PLAYLIST_PREFETCH_COUNT
+    assert resolve_playlist_prefetch_count(1, lambda _handle, _name: "abc") == DEFAULT_PLAYLIST_PREFETCH_COUNT
+
+
+def test_resolve_playlist_prefetch_count_clamps_to_range():
+    assert resolve_playlist_prefetch_count(1, lambda _handle, _name: "-3") == 0
+    assert resolve_playlist_prefetch_count(1, lambda _handle, _name: "99") == MAX_PLAYLIST_PREFETCH_COUNT
+    assert resolve_playlist_prefetch_count(1, lambda _handle, _name: "4") == 4
+
+
+def test_resolve_format_ranking_reads_codec_and_bitrate_cap():
+    settings = {"preferred_codec": "avc1", "max_bitrate": "4500"}
+
+    ranking = resolve_format_ranking(1, lambda _handle, name: settings.get(name))
+
+    assert ranking == {'codec_preference': ('avc1',), 'max_bitrate': 4500}
+
+
+def test_resolve_format_ranking_defaults_to_no_preference():
+    settings = {"preferred_codec": "any", "max_bitrate": "abc"}
+
+    ranking = resolve_format_ranking(1, lambda _handle, name: settings.get(name))
+
+    assert ranking == {'codec_preference': (), 'max_bitrate': None}
+
+
+def test_resolve_decode_profile_lets_query_params_override_codec_limits():
+    settings = {"decode_profile": "vp9:1920@30,av01:0"}
+
+    decode_profile = resolve_decode_profile(
+        1,
+        lambda _handle, name: settings.get(name),
+        "?url=https%3A%2F%2Fexample.com%2Fvideo&decode-profile=vp9%3A1280%2Cavc1%3A3840%4060",
+    )
+
+    assert decode_profile == {
+        'vp9': {'max_width': 1280, 'max_fps': None},
+        'av01': {'max_width': 0, 'max_fps': None},
+        'avc1': {'max_width': 3840, 'max_fps': 60},
+    }
+
+
+def test_resolve_decode_profile_ignores_legacy_paramstrings():
+    decode_profile = resolve_decode_profile(
+        1,
+        lambda _handle, _name: "",
+        "?https://example.com/watch?decode-profile=av01:0",
+    )
+
+    assert decode_profile == {}
+
+
+def test_build_flat_playlist_item_url_keeps_decode_profile_override():
+    item_url = build_flat_playlist_item_url(
+        "plugin://plugin.video.sendtokodi",
+        "https://example.com/video",
+        "?url=https%3A%2F%2Fexample.com%2Finput&decode-profile=av01%3A0",
+    )
+
+    assert item_url == (
+        "plugin://plugin.video.sendtokodi"
+        "?url=https%3A%2F%2Fexample.com%2Fvideo&decode-profile=av01%3A0"
+    )
@@ -1,3 +1,12 @@
+import gzip
+import http.client
+import http.server
+import struct
+import threading
+import time
+
+import pytest
+
 from core import dash_builder
 
 
@@ -6,14 +15,6 @@ class DummyResponse:
         self.content = content
 
 
-def test_webm_decode_int_prefix_lengths():
-    assert dash_builder._webm_decode_int(0b10000000) == (1, 0)
-    assert dash_builder._webm_decode_int(0b01000001) == (2, 1)
-    assert dash_builder._webm_decode_int(0b00100010) == (3, 2)
-    assert dash_builder._webm_decode_int(0b00010011) == (4, 3)
-    assert dash_builder._webm_decode_int(0b00000000) == (8, 0)
-
-
 def test_webm_find_ranges_returns_default_for_non_ebml_payload():
     response = DummyResponse(b"not-ebml-content")
     init_range, index_range = dash_builder._webm_find_init_and_index_ranges(response)
@@ -53,12 +54,6 @@ def test_transform_url_keeps_original_url():
     assert dash_builder.transform_url(url) == url
 
 
-def test_webm_decode_int_covers_longer_prefix_lengths():
-    assert dash_builder._webm_decode_int(0b00001000) == (5, 0)
-    assert dash_builder._webm_decode_int(0b00000100) == (6, 0)
-    assert dash_builder._webm_decode_int(0b00000010) == (7, 0)
-
-
 def test_webm_find_ranges_finds_cues_element():
     ebml = bytes.fromhex("1A45DFA3")
     filler = b"\x00"
@@ -72,27 +67,119 @@ def test_webm_find_ranges_finds_cues_element():
     assert index_range == (10, 14)
 
 
-def test_find_init_and_index_ranges_dispatches_by_container(monkeypatch):
-    called = []
+class FakeRangeResponse:
+    def __init__(self, payload, status_code=206):
+        self.payload = payload
+        self.status_code = status_code
+        self.closed = False
 
-    class DummyRequestsResponse:
-        content = b"dummy"
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError("HTTP {}".format(self.status_code))
 
-        def raise_for_status(self):
-            return None
+    def iter_content(self, chunk_size):
+        for offset in range(0, len(self.payload), chunk_size):
+            yield self.payload[offset:offset + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRangeSession:
+    """Serves byte ranges of *payload*, honouring the Range header like a CDN."""
+
+    def __init__(self, payload, honour_range=True):
+        self.payload = payload
+        self.honour_range = honour_range
+        self.requested_ranges = []
+        self.requested_headers = []
+        self.timeouts = []
+
+    def get(self, url, headers, timeout, stream):
+        assert stream is True
+        start, end = headers["Range"][len("bytes="):].split("-")
+        start, end = int(start), int(end)
+        self.requested_ranges.append((start, end))
+        self.requested_headers.append(headers)
+        self.timeouts.append(timeout)
+        if not self.honour_range:
+            return FakeRangeResponse(self.payload, status_code=200)
+        return FakeRangeResponse(self.payload[start:end + 1])
+
+
+def _mp4_payload_with_sidx_at(offset):
+    ftyp_box = b"\x00\x00\x00\x10" + b"ftyp" + b"isom0000"
+    moov_size = offset - len(ftyp_box)
+    moov_box = struct.pack(">I", moov_size) + b"moov" + (b"\x00" * (moov_size - 8))
+    sidx_box = b"\x00\x00\x00\x18" + b"sidx" + (b"\x00" * 16)
+    mdat_box = b"\x00\x00\x10\x08" + b"mdat" + (b"\x00" * 4096)
+    return ftyp_box + moov_box + sidx_box + mdat_box
+
+
+def test_find_init_and_index_ranges_dispatches_by_container():
+    ebml = bytes.fromhex("1A45DFA3") + b"\x00" + bytes.fromhex("1853806780")
+    webm_payload = ebml + bytes.fromhex("1C53BB6B80") + (b"\x00" * 20)
+    webm_session = FakeRangeSession(webm_payload)
+    mp4_session = FakeRangeSession(_mp4_payload_with_sidx_at(24))
+
+    assert dash_builder.find_init_and_index_ranges("https://x", "webm_dash", session=webm_session) == ((0, 9), (10, 14))
+    assert dash_builder.find_init_and_index_ranges("https://x", "mp4_dash", session=mp4_session) == ((0, 23), (24, 47))
+    assert webm_session.requested_ranges == [(0, 1023)]
+    assert webm_session.timeouts == [dash_builder._RANGE_REQUEST_TIMEOUT_SECONDS]
+
+
+def test_fetch_init_and_index_ranges_refetches_until_sidx_is_reached():
+    session = FakeRangeSession(_mp4_payload_with_sidx_at(5000))
+
+    probe = dash_builder.fetch_init_and_index_ranges("https://x", "mp4_dash", session=session)
+
+    assert probe["init_range"] == (0, 4999)
+    assert probe["index_range"] == (5000, 5023)
+    # The follow-up range continues where the first one stopped and jumps
+    # straight to the end of the known box instead of doubling blindly.
+    assert session.requested_ranges == [(0, 1023), (1024, 5015)]
+    assert probe["requests"] == 2
+    assert probe["bytes_fetched"] == 5016
+
+
+def test_fetch_init_and_index_ranges_grows_window_exponentially_for_unknown_layout():
+    # Many small boxes: each scan only knows the next header offset.
+    boxes = b"".join(struct.pack(">I", 100) + b"free" + (b"\x00" * 92) for _ in range(40))
+    payload = boxes + b"\x00\x00\x00\x18" + b"sidx" + (b"\x00" * 16)
+    session = FakeRangeSession(payload)
+
+    probe = dash_builder.fetch_init_and_index_ranges("https://x", "mp4_dash", session=session)
+
+    assert probe["index_range"] == (4000, 4023)
+    assert session.requested_ranges == [(0, 1023), (1024, 2047), (2048, 4095)]
 
-    def fake_get(url, headers, timeout):
-        called.append((url, headers, timeout))
-        return DummyRequestsResponse()
 
-    monkeypatch.setattr(dash_builder.requests, "get", fake_get)
-    monkeypatch.setattr(dash_builder, "_webm_find_init_and_index_ranges", lambda _r: ((1, 2), (3, 4)))
-    monkeypatch.setattr(dash_builder, "_mp4_find_init_and_index_ranges", lambda _r: ((5, 6), (7, 8)))
+def test_fetch_init_and_index_ranges_raises_when_index_is_missing(monkeypatch):
+    monkeypatch.setattr(dash_builder, "_RANGE_PROBE_MAX_BYTES", 4096)
+    session = FakeRangeSession(_mp4_payload_with_sidx_at(100000))
 
-    assert dash_builder.find_init_and_index_ranges("https://x", "webm_dash") == ((1, 2), (3, 4))
-    assert dash_builder.find_init_and_index_ranges("https://x", "mp4_dash") == ((5, 6), (7, 8))
-    assert called[0][1]["Range"] == "bytes=0-1023"
-    assert called[0][2] == dash_builder._RANGE_REQUEST_TIMEOUT_SECONDS
+    with pytest.raises(RuntimeError):
+        dash_builder.fetch_init_and_index_ranges("https://x", "mp4_dash", session=session)
+
+    assert session.requested_ranges[-1][1] == 4095
+
+
+def test_fetch_init_and_index_ranges_stops_at_media_data():
+    payload = b"\x00\x00\x00\x10" + b"ftyp" + b"isom0000" + b"\x00\x00\x10\x08" + b"mdat" + (b"\x00" * 8192)
+    session = FakeRangeSession(payload)
+
+    with pytest.raises(RuntimeError):
+        dash_builder.fetch_init_and_index_ranges("https://x", "mp4_dash", session=session)
+
+    assert session.requested_ranges == [(0, 1023)]
+
+
+def test_fetch_init_and_index_ranges_handles_servers_ignoring_range():
+    session = FakeRangeSession(_mp4_payload_with_sidx_at(1500), honour_range=False)
+
+    probe = dash_builder.fetch_init_and_index_ranges("https://x", "mp4_dash", session=session)
+
+    assert probe["index_range"] == (1500, 1523)
 
 
 def test_manifest_add_formats_and_emit(monkeypatch):
@@ -201,20 +288,6 @@ def test_http_handler_head_and_get_methods_write_headers_and_body():
     assert handler.wfile.written == b"manifest"
 
 
-def test_handle_request_stops_after_timeout():
-    class DummyHttpd:
-        def __init__(self):
-            self.calls = 0
-
-        def handle_request(self):
-            self.calls += 1
-            raise TimeoutError()
-
-    httpd = DummyHttpd()
-    dash_builder._handle_request(httpd)
-    assert httpd.calls == 1
-
-
 def test_start_httpd_uses_server_and_thread(monkeypatch):
     started = {"called": False}
 
@@ -225,52 +298,55 @@ def test_start_httpd_uses_server_and_thread(monkeypatch):
             self.server_address = server_address
             self.handler = handler
             self.server_port = 8123
-            self.timeout = None
-            self.handle_timeout = None
 
-        def handle_request(self):
-            raise TimeoutError()
+        def serve_forever(self, poll_interval=0.5):
+            return None
 
     class FakeThread:
-        def __init__(self, target, args):
+        def __init__(self, target, kwargs):
             self.target = target
-            self.args = args
+            self.kwargs = kwargs
 
         def start(self):
             started["called"] = True
+            started["target"] = self.target
 
-    monkeypatch.setattr(dash_builder, "HTTPServer", FakeHTTPServer)
+    monkeypatch.setattr(dash_builder, "ManifestHTTPServer", FakeHTTPServer)
     monkeypatch.setattr(dash_builder, "Thread", FakeThread)
 
     url = dash_builder.start_httpd(b"manifest")
 
     assert started["called"] is True
+    assert started["target"] == dash_builder._HTTPD.serve_forever
     assert url.startswith("http://127.0.0.1:8123/manifest/")
     assert url.endswith(".mpd")
 
 
-def test_start_httpd_refreshes_manifest_after_timeout(monkeypatch):
+def test_start_httpd_refreshes_stale_manifest_in_background(monkeypatch):
     dash_builder._reset_httpd_state_for_tests()
+    threads = []
 
     class FakeHTTPServer:
         def __init__(self, _server_address, _handler):
             self.server_port = 8123
-            self.timeout = None
-            self.handle_timeout = None
 
-        def handle_request(self):
-            raise TimeoutError()
+        def serve_forever(self, poll_interval=0.5):
+            return None
 
     class FakeThread:
-        def __init__(self, target, args):
+        def __init__(self, target, kwargs=None, args=()):
             self.target = target
+            self.kwargs = kwargs or {}
             self.args = args
             self.daemon = False
 
         def start(self):
-            return None
+            threads.append(self)
+
+        def run(self):
+            self.target(*self.args, **self.kwargs)
 
-    monkeypatch.setattr(dash_builder, "HTTPServer", FakeHTTPServer)
+    monkeypatch.setattr(dash_builder, "ManifestHTTPServer", FakeHTTPServer)
     monkeypatch.setattr(dash_builder, "Thread", FakeThread)
     monkeypatch.setattr(dash_builder, "DASH_HTTPD_IDLE_TIMEOUT_SECONDS", 1)
 
@@ -290,6 +366,903 @@ def test_start_httpd_refreshes_manifest_after_timeout(monkeypatch):
         def __init__(self, path):
             self.path = path
 
-    payload = dash_builder.HttpHandler._resolve_manifest_payload(DummyHandler(url.replace("http://127.0.0.1:8123", "")))
+    handler = DummyHandler(url.replace("http://127.0.0.1:8123", ""))
+
+    # The request is answered with the stale manifest and does not wait
+    assert dash_builder.HttpHandler._resolve_manifest_payload(handler) == b"manifest-v1"
+    # A second request while the refresh is pending does not start another one
+    assert dash_builder.HttpHandler._resolve_manifest_payload(handler) == b"manifest-v1"
+    refresh_threads = [thread for thread in threads if thread.target == dash_builder._run_refresh]
+    assert len(refresh_threads) == 1
+
+    refresh_threads[0].run()
+
+    assert dash_builder.HttpHandler._resolve_manifest_payload(handler) == b"manifest-v2"
+    assert dash_builder._MANIFEST_REFRESHES == {}
+
+
+def test_manifest_expires_at_uses_earliest_expire_param():
+    manifest = (
+        b"<BaseURL>https://x/v?id=1&amp;expire=2000&amp;sig=a</BaseURL>"
+        b"<BaseURL>https://x/a?expire=1500</BaseURL>"
+        b"<BaseURL>https://x/videoplayback/expire/1700/id/3</BaseURL>"
+    )
+
+    assert dash_builder.manifest_expires_at(manifest) == 1500
+    assert dash_builder.manifest_expires_at(b"<BaseURL>https://x/v?sig=a</BaseURL>") is None
+
+
+def test_register_manifest_schedules_refresh_ahead_of_expiry(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "time", lambda: 10000)
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_REFRESH_MARGIN_SECONDS", 600)
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_REFRESH_RETRY_SECONDS", 60)
+
+    manifest_id = dash_builder._register_manifest(
+        b"<BaseURL>https://x/v?expire=20000</BaseURL>", refresh_manifest=lambda: None
+    )
+    near_expiry_id = dash_builder._register_manifest(
+        b"<BaseURL>https://x/v?expire=10100</BaseURL>", refresh_manifest=lambda: None
+    )
+    static_id = dash_builder._register_manifest(b"<BaseURL>https://x/v?expire=20000</BaseURL>")
+
+    assert dash_builder._MANIFESTS[manifest_id]["refresh_due_at"] == 19400
+    # Never scheduled sooner than the retry delay
+    assert dash_builder._MANIFESTS[near_expiry_id]["refresh_due_at"] == 10060
+    assert dash_builder._MANIFESTS[static_id]["refresh_due_at"] is None
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def test_run_due_refreshes_refreshes_only_recently_used_due_manifests(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_PROACTIVE_REFRESH_WINDOW_SECONDS", 100)
+    calls = []
+
+    def make_refresh(name):
+        def refresh():
+            calls.append(name)
+            return "<BaseURL>https://x/{}?expire=99999999999</BaseURL>".format(name).encode("utf-8")
+        return refresh
+
+    due_id = dash_builder._register_manifest(b"due", refresh_manifest=make_refresh("due"))
+    idle_id = dash_builder._register_manifest(b"idle", refresh_manifest=make_refresh("idle"))
+    later_id = dash_builder._register_manifest(b"later", refresh_manifest=make_refresh("later"))
+    dash_builder._MANIFESTS[due_id]["refresh_due_at"] = 50
+    dash_builder._MANIFESTS[idle_id]["refresh_due_at"] = 50
+    dash_builder._MANIFESTS[idle_id]["last_access_at"] = dash_builder.monotonic() - 1000
+    dash_builder._MANIFESTS[later_id]["refresh_due_at"] = 500
+
+    started = dash_builder._run_due_refreshes(now=100)
+    for done in started:
+        assert done.wait(5)
+
+    assert calls == ["due"]
+    assert dash_builder._MANIFESTS[due_id]["manifest"].startswith(b"<BaseURL>https://x/due")
+    assert dash_builder._MANIFESTS[due_id]["expires_at"] == 99999999999
+    assert dash_builder._MANIFESTS[due_id]["refresh_due_at"] is not None
+    # Idle manifests go dormant until they are requested again
+    assert dash_builder._MANIFESTS[idle_id]["refresh_due_at"] is None
+    assert dash_builder._MANIFESTS[later_id]["refresh_due_at"] == 500
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def test_failed_refresh_is_retried_later(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "time", lambda: 1000)
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_REFRESH_RETRY_SECONDS", 60)
+
+    def failing_refresh():
+        raise RuntimeError("extract failed")
+
+    manifest_id = dash_builder._register_manifest(
+        b"<BaseURL>https://x/v?expire=1200</BaseURL>", refresh_manifest=failing_refresh
+    )
+    dash_builder._MANIFESTS[manifest_id]["refresh_due_at"] = 900
+
+    for done in dash_builder._run_due_refreshes():
+        assert done.wait(5)
+
+    entry = dash_builder._MANIFESTS[manifest_id]
+    assert entry["manifest"] == b"<BaseURL>https://x/v?expire=1200</BaseURL>"
+    assert entry["refresh_due_at"] == 1060
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def _get_manifest(connection, path):
+    started = time.monotonic()
+    connection.request("GET", path)
+    response = connection.getresponse()
+    body = response.read()
+    return response.status, body, time.monotonic() - started
+
+
+def test_http_handler_returns_empty_404_on_keep_alive_connection():
+    dash_builder._reset_httpd_state_for_tests()
+    url = dash_builder.start_httpd(b"manifest")
+    port = dash_builder._HTTPD.server_port
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        status, body, _ = _get_manifest(connection, "/manifest/unknown.mpd")
+        assert (status, body) == (404, b"")
+
+        # Same connection is still usable after the 404
+        status, body, _ = _get_manifest(connection, url.split(str(port), 1)[1])
+        assert (status, body) == (200, b"manifest")
+    finally:
+        connection.close()
+        dash_builder._reset_httpd_state_for_tests()
+
+
+def test_concurrent_refreshes_share_one_call_and_do_not_block_other_manifests(monkeypatch, record_property):
+    dash_builder._reset_httpd_state_for_tests()
+
+    refresh_started = threading.Event()
+    release_refresh = threading.Event()
+    refresh_calls = []
+
+    def slow_refresh():
+        # Stands in for a full yt-dlp re-extract
+        refresh_calls.append(1)
+        refresh_started.set()
+        release_refresh.wait(5)
+        return b"slow-v2"
+
+    # Already expired, so requests have to wait for the refreshed manifest
+    slow_url = dash_builder.start_httpd(b"<BaseURL>https://x/v?expire=1</BaseURL>", refresh_manifest=slow_refresh)
+    fast_url = dash_builder.start_httpd(b"fast", refresh_manifest=lambda: b"fast-v2")
+    port = dash_builder._HTTPD.server_port
+    slow_path = slow_url.split(str(port), 1)[1]
+    fast_path = fast_url.split(str(port), 1)[1]
+
+    slow_results = []
+
+    def request_slow():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        try:
+            slow_results.append(_get_manifest(connection, slow_path)[:2])
+        finally:
+            connection.close()
+
+    slow_threads = [threading.Thread(target=request_slow) for _ in range(3)]
+    try:
+        for thread in slow_threads:
+            thread.start()
+        assert refresh_started.wait(5)
+
+        latencies = []
+        fast_results = []
+        lock = threading.Lock()
+
+        def poll_fast():
+            # One keep-alive connection per client, like inputstream.adaptive
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            try:
+                for _ in range(25):
+                    status, body, elapsed = _get_manifest(connection, fast_path)
+                    with lock:
+                        fast_results.append((status, body))
+                        latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        fast_threads = [threading.Thread(target=poll_fast) for _ in range(4)]
+        for thread in fast_threads:
+            thread.start()
+        for thread in fast_threads:
+            thread.join(10)
+        # The slow refresh is still in flight while all fast GETs complete
+        fast_finished_during_refresh = not any(thread.is_alive() for thread in fast_threads)
+        refresh_still_running = len(refresh_calls) == 1 and not slow_results
+    finally:
+        release_refresh.set()
+        for thread in slow_threads:
+            thread.join(10)
+        dash_builder._reset_httpd_state_for_tests()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    record_property("manifest_get_p99_ms", round(p99 * 1000, 3))
+
+    assert fast_results == [(200, b"fast")] * 100
+    assert fast_finished_during_refresh
+    assert refresh_still_running
+    assert slow_results == [(200, b"slow-v2")] * 3
+    assert len(refresh_calls) == 1
+
+
+def test_manifest_server_bounds_concurrent_workers():
+    release = threading.Event()
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    class BlockingHandler(dash_builder.HttpHandler):
+        def do_GET(self):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            release.wait(10)
+            with lock:
+                active.pop()
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    httpd = dash_builder.ManifestHTTPServer(("127.0.0.1", 0), BlockingHandler, max_workers=2)
+    server_thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    server_thread.start()
+    statuses = []
+
+    def request():
+        connection = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=10)
+        try:
+            connection.request("GET", "/")
+            response = connection.getresponse()
+            response.read()
+            statuses.append(response.status)
+        finally:
+            connection.close()
+
+    clients = [threading.Thread(target=request) for _ in range(5)]
+    try:
+        for client in clients:
+            client.start()
+        deadline = time.monotonic() + 5
+        while len(peak) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Let the accept loop try to hand out more workers than it has
+        time.sleep(0.2)
+        assert len(peak) == 2
+        release.set()
+        for client in clients:
+            client.join(10)
+    finally:
+        release.set()
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert statuses == [200] * 5
+    assert max(peak) == 2
+
+
+
+def test_idle_keep_alive_connection_does_not_hold_a_worker():
+    dash_builder._reset_httpd_state_for_tests()
+    manifest_id = dash_builder._register_manifest(b"<MPD/>")
+    path = "/manifest/{}.mpd".format(manifest_id)
+    httpd = _serve_in_background(dash_builder.ManifestHTTPServer(("127.0.0.1", 0), dash_builder.HttpHandler, max_workers=1))
+    idle = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=5)
+    other = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=5)
+    try:
+        idle.request("GET", path)
+        first = idle.getresponse()
+        first.read()
+        # *idle* stays open, waiting for its next request
+        other.request("GET", path)
+        second = other.getresponse()
+        assert second.read() == b"<MPD/>"
+        assert (first.status, second.status) == (200, 200)
+
+        idle.request("GET", path)
+        assert idle.getresponse().status == 200
+    finally:
+        idle.close()
+        other.close()
+        httpd.shutdown()
+        httpd.server_close()
+        dash_builder._reset_httpd_state_for_tests()
+
+
+def test_reset_stops_refresh_scheduler():
+    dash_builder._reset_httpd_state_for_tests()
+    dash_builder._ensure_refresh_scheduler_started()
+    scheduler = dash_builder._REFRESH_SCHEDULER_THREAD
+
+    dash_builder._reset_httpd_state_for_tests()
+    scheduler.join(5)
+
+    assert dash_builder._REFRESH_SCHEDULER_THREAD is None
+    assert not scheduler.is_alive()
+
+def test_probe_init_and_index_ranges_runs_probes_concurrently(monkeypatch):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_find(url, _container, headers=None):
+        # Only passes when all three probes are in flight at the same time.
+        barrier.wait()
+        return (0, len(url)), (len(url) + 1, 99)
+
+    monkeypatch.setattr(dash_builder, "find_init_and_index_ranges", fake_find)
+
+    formats = [
+        {"url": "https://x/a", "container": "mp4_dash"},
+        {"url": "https://x/bb", "container": "mp4_dash"},
+        {"url": "https://x/ccc", "container": "webm_dash"},
+    ]
+    results = dash_builder.probe_init_and_index_ranges(formats, max_workers=3)
+
+    assert results == [
+        (((0, len(fmt["url"])), (len(fmt["url"]) + 1, 99)), None)
+        for fmt in formats
+    ]
+
+
+def test_probe_init_and_index_ranges_keeps_failures_per_format(monkeypatch):
+    def fake_find(url, _container, headers=None):
+        if url.endswith("bad"):
+            raise RuntimeError("probe failed")
+        return (0, 1), (2, 3)
+
+    monkeypatch.setattr(dash_builder, "find_init_and_index_ranges", fake_find)
+
+    results = dash_builder.probe_init_and_index_ranges(
+        [
+            {"url": "https://x/bad", "container": "mp4_dash"},
+            {"url": "https://x/good", "container": "mp4_dash"},
+        ]
+    )
+
+    assert results[0][0] is None
+    assert str(results[0][1]) == "probe failed"
+    assert results[1] == (((0, 1), (2, 3)), None)
+
+
+def test_manifest_prefetch_ranges_is_used_by_add_methods(monkeypatch):
+    calls = []
+
+    def fake_find(url, _container, headers=None):
+        calls.append(url)
+        if url.endswith("v2"):
+            raise RuntimeError("video probe failed")
+        return (0, 9), (10, 19)
+
+    monkeypatch.setattr(dash_builder, "find_init_and_index_ranges", fake_find)
+
+    video_formats = [
+        {
+            "format_id": fid,
+            "vcodec": "avc1",
+            "fps": 30,
+            "resolution": "1280x720",
+            "ext": "mp4",
+            "url": "https://example.com/" + fid,
+            "container": "mp4_dash",
+        }
+        for fid in ("v1", "v2", "v3")
+    ]
+
+    manifest = dash_builder.Manifest(duration=10)
+    manifest.prefetch_ranges(video_formats)
+    assert sorted(calls) == ["https://example.com/v1", "https://example.com/v2", "https://example.com/v3"]
+
+    manifest.add_video_format(video_formats[0])
+    with pytest.raises(RuntimeError):
+        manifest.add_video_format(video_formats[1])
+    manifest.add_video_format(video_formats[2])
+
+    # No additional network probes once the ranges were prefetched.
+    assert len(calls) == 3
+    xml_text = manifest.emit().decode("utf-8")
+    assert xml_text.index('id="v1"') < xml_text.index('id="v3"')
+
+
+def test_range_cache_key_uses_media_identity_not_url():
+    fmt = {"format_id": "137", "url": "https://r1.googlevideo.com/videoplayback?clen=1234&sig=abc"}
+    other_signature = dict(fmt, url="https://r5.googlevideo.com/videoplayback?clen=1234&sig=xyz")
+
+    assert dash_builder.range_cache_key("vid", fmt) == "vid:137:1234"
+    assert dash_builder.range_cache_key("vid", other_signature) == "vid:137:1234"
+    assert dash_builder.range_cache_key("vid", {"format_id": "137", "filesize": 99, "url": "u"}) == "vid:137:99"
+    assert dash_builder.range_cache_key(None, fmt) is None
+    assert dash_builder.range_cache_key("vid", {"format_id": "137", "url": "https://x/no-size"}) is None
+
+
+def test_manifest_reuses_cached_ranges_without_network_probes(monkeypatch, tmp_path):
+    cache = dash_builder.PersistentLRUCache(str(tmp_path / "ranges.json"), max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr(dash_builder, "_RANGE_CACHE", cache)
+
+    probes = []
+
+    def fake_find(url, _container, headers=None):
+        probes.append(url)
+        return (0, 9), (10, 19)
+
+    monkeypatch.setattr(dash_builder, "find_init_and_index_ranges", fake_find)
+
+    def video_format(signature):
+        return {
+            "format_id": "137",
+            "vcodec": "avc1",
+            "fps": 30,
+            "resolution": "1920x1080",
+            "ext": "mp4",
+            "filesize": 4096,
+            "url": "https://example.com/v?sig=" + signature,
+            "container": "mp4_dash",
+        }
+
+    first = dash_builder.Manifest(duration=10, media_id="abc")
+    first.prefetch_ranges([video_format("1")])
+    first.add_video_format(video_format("1"))
+    first.emit()
+    assert len(probes) == 1
+    assert (tmp_path / "ranges.json").is_file()
+
+    # A fresh process reading the persisted cache needs no network probe.
+    monkeypatch.setattr(
+        dash_builder,
+        "_RANGE_CACHE",
+        dash_builder.PersistentLRUCache(str(tmp_path / "ranges.json"), max_entries=10, ttl_seconds=60),
+    )
+    second = dash_builder.Manifest(duration=10, media_id="abc")
+    second.prefetch_ranges([video_format("2")])
+    second.add_video_format(video_format("2"))
+
+    assert len(probes) == 1
+    assert 'indexRange="10-19"' in second.emit().decode("utf-8")
+
+
+def test_manifest_does_not_cache_failed_probes(monkeypatch, tmp_path):
+    cache = dash_builder.PersistentLRUCache(str(tmp_path / "ranges.json"), max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr(dash_builder, "_RANGE_CACHE", cache)
+    # No sidx before the media data, so the probe fails
+    payload = b"\x00\x00\x00\x10" + b"ftyp" + b"isom0000" + b"\x00\x00\x10\x08" + b"mdat" + (b"\x00" * 8192)
+    session = FakeRangeSession(payload)
+    monkeypatch.setattr(dash_builder, "http_session", lambda: session)
+
+    manifest = dash_builder.Manifest(duration=10, media_id="abc")
+    with pytest.raises(RuntimeError):
+        manifest._find_ranges({"format_id": "251", "filesize": 10, "url": "https://x", "container": "mp4_dash"})
+
+    assert len(cache) == 0
+
+
+def test_manifest_registry_evicts_least_recently_used_entries(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_REGISTRY_MAX_ENTRIES", 3)
+
+    first = dash_builder._register_manifest(b"first")
+    second = dash_builder._register_manifest(b"second")
+    third = dash_builder._register_manifest(b"third")
+    # Requesting the first manifest makes the second one the least recently used
+    dash_builder._MANIFESTS[first]["last_access_at"] = dash_builder.monotonic() + 1
+    fourth = dash_builder._register_manifest(b"fourth")
+
+    assert set(dash_builder._MANIFESTS) == {first, third, fourth}
+    assert second not in dash_builder._MANIFESTS
+    assert dash_builder.get_manifest_registry_stats() == {
+        "entries": 3,
+        "bytes": sum(
+            len(manifest) + len(gzip.compress(manifest, mtime=0))
+            for manifest in (b"first", b"third", b"fourth")
+        ),
+        "evictions": 1,
+    }
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def test_manifest_registry_is_bounded_by_bytes_and_keeps_latest(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_REGISTRY_MAX_BYTES", 250)
+
+    for _ in range(10):
+        dash_builder._register_manifest(b"x" * 100)
+    large = dash_builder._register_manifest(b"y" * 400)
+
+    # The newest manifest is kept even when it alone exceeds the byte budget
+    assert list(dash_builder._MANIFESTS) == [large]
+    stats = dash_builder.get_manifest_registry_stats()
+    # The pre-compressed copy counts towards the budget as well
+    assert stats == {
+        "entries": 1,
+        "bytes": 400 + len(gzip.compress(b"y" * 400, mtime=0)),
+        "evictions": 10,
+    }
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def test_manifest_registry_expires_idle_entries(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "DASH_MANIFEST_REGISTRY_TTL_SECONDS", 100)
+
+    idle = dash_builder._register_manifest(b"idle", refresh_manifest=lambda: b"refreshed")
+    dash_builder._MANIFESTS[idle]["last_access_at"] = dash_builder.monotonic() - 101
+    latest = dash_builder._register_manifest(b"latest")
+
+    assert list(dash_builder._MANIFESTS) == [latest]
+    assert dash_builder.get_manifest_registry_stats()["evictions"] == 1
+
+    class DummyHandler:
+        path = "/manifest/{}.mpd".format(idle)
+
+    assert dash_builder.HttpHandler._resolve_manifest_payload(DummyHandler()) is None
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def test_accepts_gzip_honours_quality_values():
+    assert dash_builder._accepts_gzip("gzip, deflate") is True
+    assert dash_builder._accepts_gzip("deflate, gzip;q=0.5") is True
+    assert dash_builder._accepts_gzip("gzip;q=0") is False
+    assert dash_builder._accepts_gzip("identity") is False
+    assert dash_builder._accepts_gzip(None) is False
+
+
+class _CountingWriter:
+    def __init__(self, wfile, counter):
+        self._wfile = wfile
+        self._counter = counter
+
+    def write(self, data):
+        self._counter["bytes"] += len(data)
+        return self._wfile.write(data)
+
+    def flush(self):
+        return self._wfile.flush()
+
+
+def _serve_in_background(httpd):
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.daemon = True
+    thread.start()
+    return httpd
+
+
+def _serve_counting(counter):
+    class CountingHandler(dash_builder.HttpHandler):
+        def setup(self):
+            dash_builder.HttpHandler.setup(self)
+            self.wfile = _CountingWriter(self.wfile, counter)
+
+    return _serve_in_background(dash_builder.ManifestHTTPServer(("127.0.0.1", 0), CountingHandler))
+
+
+def test_conditional_and_gzip_polls_write_far_fewer_bytes(record_property):
+    dash_builder._reset_httpd_state_for_tests()
+    manifest = b"<MPD>" + b"".join(
+        b'<Representation id="%d"><BaseURL>https://example.com/v?itag=%d</BaseURL></Representation>' % (i, i)
+        for i in range(200)
+    ) + b"</MPD>"
+    manifest_id = dash_builder._register_manifest(manifest)
+    path = "/manifest/{}.mpd".format(manifest_id)
+    polls = 20
+
+    def poll(conditional):
+        counter = {"bytes": 0}
+        httpd = _serve_counting(counter)
+        connection = http.client.HTTPConnection("127.0.0.1", httpd.server_port, timeout=5)
+        etag = None
+        statuses = []
+        try:
+            for _ in range(polls):
+                headers = {}
+                if conditional:
+                    headers["Accept-Encoding"] = "gzip"
+                    if etag:
+                        headers["If-None-Match"] = etag
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                statuses.append(response.status)
+                etag = response.getheader("ETag")
+                if response.status == 200 and conditional:
+                    assert response.getheader("Content-Encoding") == "gzip"
+                    assert gzip.decompress(body) == manifest
+                elif response.status == 200:
+                    assert body == manifest
+        finally:
+            connection.close()
+            httpd.shutdown()
+            httpd.server_close()
+        return counter["bytes"], statuses
+
+    plain_bytes, plain_statuses = poll(conditional=False)
+    conditional_bytes, conditional_statuses = poll(conditional=True)
+    dash_builder._reset_httpd_state_for_tests()
+
+    record_property("manifest_poll_bytes_plain", plain_bytes)
+    record_property("manifest_poll_bytes_conditional", conditional_bytes)
+
+    assert plain_statuses == [200] * polls
+    assert conditional_statuses == [200] + [304] * (polls - 1)
+    assert plain_bytes > polls * len(manifest)
+    assert conditional_bytes * 20 < plain_bytes
+
+
+def test_refresh_changes_etag(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    manifest_id = dash_builder._register_manifest(b"v1", refresh_manifest=lambda: b"v2")
+    old_etag = dash_builder._MANIFESTS[manifest_id]["etag"]
+
+    done = threading.Event()
+    dash_builder._run_refresh(manifest_id, lambda: b"v2", done)
+
+    entry = dash_builder._MANIFESTS[manifest_id]
+    assert entry["manifest"] == b"v2"
+    assert gzip.decompress(entry["gzip"]) == b"v2"
+    assert entry["etag"] != old_etag
+    assert done.is_set()
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def _serve_upstream(payload, rejected_paths=(), transient_statuses=None):
+    # transient_statuses: path -> statuses answered (in order) before succeeding
+    requests_seen = []
+    transient_statuses = transient_statuses or {}
+
+    class UpstreamHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, _format, *_args):
+            return
+
+        def do_GET(self):
+            requests_seen.append((self.path, self.headers.get("Range"), self.headers.get("User-Agent")))
+            self.server.connections.add(self.client_address)
+            pending = transient_statuses.get(self.path)
+            if self.path in rejected_paths or pending:
+                self.send_response(pending.pop(0) if pending else 403)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            start, end = 0, len(payload) - 1
+            range_header = self.headers.get("Range")
+            if range_header:
+                first, last = range_header.split("=", 1)[1].split("-")
+                start, end = int(first), min(int(last), len(payload) - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, len(payload)))
+            else:
+                self.send_response(200)
+            body = payload[start:end + 1]
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    # Threaded, so pooled keep-alive connections cannot block shutdown()
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    httpd.daemon_threads = True
+    httpd.connections = set()
+    return _serve_in_background(httpd), requests_seen
+
+
+def test_proxy_segment_urls_rewrites_base_urls_with_stable_keys():
+    manifest = (
+        b'<AdaptationSet><Representation id="137" codecs="avc1">'
+        b"<BaseURL>https://cdn/v?a=1&amp;expire=5</BaseURL></Representation>"
+        b'<Representation id="251"><BaseURL>https://cdn/a</BaseURL></Representation>'
+        b'<Representation id="251"><BaseURL>https://cdn/a2</BaseURL></Representation></AdaptationSet>'
+    )
+
+    rewritten, segments = dash_builder.proxy_segment_urls(manifest, "http://127.0.0.1:1/segment/m/")
+
+    assert segments == {"137": "https://cdn/v?a=1&expire=5", "251": "https://cdn/a", "251-2": "https://cdn/a2"}
+    assert b"<BaseURL>http://127.0.0.1:1/segment/m/137</BaseURL>" in rewritten
+    assert b"<BaseURL>http://127.0.0.1:1/segment/m/251-2</BaseURL>" in rewritten
+    assert b"cdn" not in rewritten
+
+
+def test_segment_proxy_streams_ranges_and_reresolves_expired_urls(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "DASH_SEGMENT_PROXY_ENABLED", True)
+    monkeypatch.setattr(dash_builder, "DASH_SEGMENT_PROXY_CHUNK_BYTES", 1000)
+    monkeypatch.setattr(dash_builder, "DASH_SEGMENT_PROXY_READ_AHEAD_CHUNKS", 2)
+    payload = bytes(range(256)) * 400
+    rejected_paths = set()
+    upstream, upstream_requests = _serve_upstream(payload, rejected_paths)
+    base = "http://127.0.0.1:{}".format(upstream.server_port)
+
+    def manifest_for(path):
+        return '<Representation id="137"><BaseURL>{}{}</BaseURL></Representation>'.format(base, path).encode("utf-8")
+
+    refreshes = []
+
+    def refresh_manifest():
+        refreshes.append(1)
+        return manifest_for("/v2")
+
+    manifest_url = dash_builder.start_httpd(manifest_for("/v1"), refresh_manifest=refresh_manifest)
+    port = dash_builder._HTTPD.server_port
+    manifest_id = manifest_url.rsplit("/", 1)[-1][:-len(".mpd")]
+    segment_path = "/segment/{}/137".format(manifest_id)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request("GET", "/manifest/{}.mpd".format(manifest_id))
+        served_manifest = connection.getresponse().read()
+        assert "http://127.0.0.1:{}{}".format(port, segment_path).encode("utf-8") in served_manifest
+
+        connection.request("GET", segment_path, headers={"Range": "bytes=100-5099", "User-Agent": "ISA"})
+        response = connection.getresponse()
+        assert response.status == 206
+        assert response.getheader("Content-Range") == "bytes 100-5099/{}".format(len(payload))
+        assert response.read() == payload[100:5100]
+
+        # The CDN now rejects the old signed URL
+        rejected_paths.add("/v1")
+        connection.request("GET", segment_path, headers={"Range": "bytes=0-99"})
+        response = connection.getresponse()
+        assert response.status == 206
+        assert response.read() == payload[:100]
+        stats = dash_builder.get_segment_proxy_stats(manifest_id)["137"]
+    finally:
+        connection.close()
+        dash_builder._reset_httpd_state_for_tests()
+        upstream.shutdown()
+        upstream.server_close()
+
+    assert refreshes == [1]
+    assert [(path, byte_range) for path, byte_range, _ in upstream_requests] == [
+        ("/v1", "bytes=100-5099"),
+        ("/v1", "bytes=0-99"),
+        ("/v2", "bytes=0-99"),
+    ]
+    # Player headers are forwarded upstream
+    assert upstream_requests[0][2] == "ISA"
+    assert stats["requests"] == 2
+    assert stats["bytes"] == 5100
+    assert stats["reresolves"] == 1
+    assert stats["errors"] == 0
+    assert stats["bytes_per_second"] > 0
+    dash_builder._reset_httpd_state_for_tests()
+
+
+def test_segment_proxy_returns_404_for_unknown_representation():
+    dash_builder._reset_httpd_state_for_tests()
+    manifest_id = dash_builder._register_manifest(b"<MPD/>", proxy_port=1)
+    url = dash_builder.start_httpd(b"<MPD/>")
+    port = dash_builder._HTTPD.server_port
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", "/segment/{}/137".format(manifest_id))
+        response = connection.getresponse()
+        assert (response.status, response.read()) == (404, b"")
+    finally:
+        connection.close()
+        dash_builder._reset_httpd_state_for_tests()
+    assert url
+
+
+def test_read_ahead_is_bounded_and_propagates_errors():
+    produced = []
+
+    def chunks():
+        for index in range(10):
+            produced.append(index)
+            yield index
+
+    reader = dash_builder.read_ahead(chunks(), 2)
+    assert next(reader) == 0
+    time.sleep(0.2)
+    # One chunk handed out, two buffered and one blocked in put()
+    assert len(produced) <= 4
+    assert list(reader) == list(range(1, 10))
+
+    def failing():
+        yield b"a"
+        raise OSError("upstream reset")
+
+    reader = dash_builder.read_ahead(failing(), 2)
+    assert next(reader) == b"a"
+    with pytest.raises(OSError, match="upstream reset"):
+        next(reader)
+
+
+def test_read_ahead_calls_on_done_from_reader_after_early_close():
+    done = threading.Event()
+    reader_threads = []
+
+    def chunks():
+        index = 0
+        while True:
+            index += 1
+            yield index
+
+    def on_done():
+        reader_threads.append(threading.current_thread())
+        done.set()
+
+    reader = dash_builder.read_ahead(chunks(), 2, on_done=on_done)
+    assert next(reader) == 1
+    reader.close()
+
+    assert done.wait(5)
+    assert reader_threads[0] is not threading.current_thread()
+
+
+def test_segment_proxy_answers_502_when_reresolve_times_out(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    monkeypatch.setattr(dash_builder, "DASH_SEGMENT_PROXY_ENABLED", True)
+    monkeypatch.setattr(dash_builder, "_SEGMENT_PROXY_TIMEOUT_SECONDS", 0.2)
+    upstream, _ = _serve_upstream(b"data", {"/v1"})
+    release_refresh = threading.Event()
+
+    def hung_refresh():
+        release_refresh.wait(5)
+        return None
+
+    manifest = '<Representation id="137"><BaseURL>http://127.0.0.1:{}/v1</BaseURL></Representation>'.format(
+        upstream.server_port
+    ).encode("utf-8")
+    manifest_url = dash_builder.start_httpd(manifest, refresh_manifest=hung_refresh)
+    manifest_id = manifest_url.rsplit("/", 1)[-1][:-len(".mpd")]
+    connection = http.client.HTTPConnection("127.0.0.1", dash_builder._HTTPD.server_port, timeout=5)
+    try:
+        connection.request("GET", "/segment/{}/137".format(manifest_id))
+        response = connection.getresponse()
+        assert (response.status, response.read()) == (502, b"")
+        stats = dash_builder.get_segment_proxy_stats(manifest_id)["137"]
+    finally:
+        release_refresh.set()
+        connection.close()
+        dash_builder._reset_httpd_state_for_tests()
+        upstream.shutdown()
+        upstream.server_close()
+
+    assert stats["reresolves"] == 1
+    assert stats["errors"] == 1
+
+
+def test_range_probes_reuse_pooled_connections():
+    dash_builder._reset_httpd_state_for_tests()
+    upstream, upstream_requests = _serve_upstream(_mp4_payload_with_sidx_at(3000))
+    base = "http://127.0.0.1:{}".format(upstream.server_port)
+    try:
+        for path in ("/137", "/248", "/251"):
+            ranges = dash_builder.find_init_and_index_ranges(base + path, "mp4_dash")
+            assert ranges == ((0, 2999), (3000, 3023))
+        connections = set(upstream.connections)
+    finally:
+        dash_builder._reset_httpd_state_for_tests()
+        upstream.shutdown()
+        upstream.server_close()
+
+    # Two growing probes per representation, all over a single connection
+    assert len(upstream_requests) == 6
+    assert len(connections) == 1
+
+
+def test_range_probes_retry_transient_upstream_errors(monkeypatch):
+    dash_builder._reset_httpd_state_for_tests()
+    upstream, upstream_requests = _serve_upstream(
+        _mp4_payload_with_sidx_at(24), transient_statuses={"/v": [503]}
+    )
+    try:
+        ranges = dash_builder.find_init_and_index_ranges(
+            "http://127.0.0.1:{}/v".format(upstream.server_port), "mp4_dash"
+        )
+    finally:
+        dash_builder._reset_httpd_state_for_tests()
+        upstream.shutdown()
+        upstream.server_close()
+
+    assert ranges == ((0, 23), (24, 47))
+    assert [byte_range for _, byte_range, _ in upstream_requests] == ["bytes=0-1023", "bytes=0-1023"]
+
+
+def test_range_probe_sends_format_http_headers():
+    session = FakeRangeSession(_mp4_payload_with_sidx_at(24))
+    headers = {"User-Agent": "UA", "Referer": "https://site/", "Range": "ignored"}
+
+    dash_builder.fetch_init_and_index_ranges("https://x", "mp4_dash", session=session, headers=headers)
+
+    assert session.requested_headers == [{"User-Agent": "UA", "Referer": "https://site/", "Range": "bytes=0-1023"}]
+    # The caller's dict is left untouched
+    assert headers["Range"] == "ignored"
+
+
+def test_find_format_ranges_uses_format_http_headers(monkeypatch):
+    calls = []
+
+    def fake_find(url, container, headers=None):
+        calls.append((url, container, headers))
+        return (0, 1), (2, 3)
+
+    monkeypatch.setattr(dash_builder, "find_init_and_index_ranges", fake_find)
+
+    dash_builder._find_format_ranges(
+        {"url": "https://x/v", "container": "mp4_dash", "http_headers": {"Cookie": "a=b"}}
+    )
 
-    assert payload == b"manifest-v2"
+    assert calls == [("https://x/v", "mp4_dash", {"Cookie": "a=b"})]
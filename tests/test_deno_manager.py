@@ -1,4 +1,5 @@
 import pytest
+import hashlib
 import io
 import os
 import sys
@@ -258,6 +259,7 @@ def test_download_deno_extracts_binary_and_sets_executable(monkeypatch, tmp_path
 
     monkeypatch.setattr(deno_manager, "_detect_platform", lambda: ("linux", "x86_64"))
     monkeypatch.setattr(deno_manager.urllib.request, "urlopen", lambda *_args, **_kwargs: FakeResponse(zip_data))
+    monkeypatch.setattr(deno_manager, "fetch_published_sha256", lambda *_args: hashlib.sha256(zip_data).hexdigest())
     monkeypatch.setattr(deno_manager.platform, "system", lambda: "Linux")
     monkeypatch.setattr(deno_manager, "_deno_binary_name", lambda: "deno")
     monkeypatch.setattr(deno_manager, "_addon_data_dir", lambda: str(tmp_path))
@@ -270,7 +272,8 @@ def test_download_deno_extracts_binary_and_sets_executable(monkeypatch, tmp_path
     dest = deno_manager._download_deno(show_progress=False, version="v-test")
 
     assert os.path.isfile(dest)
-    assert open(dest, "rb").read() == b"binary-content"
+    with open(dest, "rb") as f:
+        assert f.read() == b"binary-content"
     assert "/versions/v-test/" in dest
     assert set_version == ["v-test"]
     assert any("Downloading Deno" in msg for msg, _ in logs)
@@ -302,6 +305,7 @@ def test_download_deno_raises_if_binary_missing(monkeypatch, tmp_path):
 
     monkeypatch.setattr(deno_manager, "_detect_platform", lambda: ("linux", "x86_64"))
     monkeypatch.setattr(deno_manager.urllib.request, "urlopen", lambda *_args, **_kwargs: FakeResponse(zip_data))
+    monkeypatch.setattr(deno_manager, "fetch_published_sha256", lambda *_args: hashlib.sha256(zip_data).hexdigest())
     monkeypatch.setattr(deno_manager, "_deno_binary_name", lambda: "deno")
     monkeypatch.setattr(deno_manager, "_addon_data_dir", lambda: str(tmp_path))
 
@@ -522,3 +526,57 @@ def test_resolve_latest_version_handles_429_with_retry_after(monkeypatch, tmp_pa
     assert state["consecutive_failures"] == 1
     assert state["cooldown_until"] == 1120
     assert state["next_check_at"] == 1120
+
+
+def test_download_deno_streams_archive_under_memory_ceiling(monkeypatch, tmp_path, record_property):
+    import threading
+    import tracemalloc
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    binary_bytes = 24 * 1024 * 1024
+    served_dir = tmp_path / "served"
+    served_dir.mkdir()
+    archive = served_dir / "deno-x86_64-unknown-linux-gnu.zip"
+    with zipfile.ZipFile(str(archive), "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        with zf.open("deno", "w") as member:
+            for _ in range(binary_bytes // (1024 * 1024)):
+                member.write(os.urandom(1024 * 1024))
+
+    with open(str(archive), "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    (served_dir / (archive.name + ".sha256sum")).write_text("{}  {}\n".format(digest, archive.name))
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, _format, *_args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(served_dir)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+    monkeypatch.setattr(deno_manager, "_RELEASE_URL", base_url + "/{filename}")
+    monkeypatch.setattr(deno_manager, "_detect_platform", lambda: ("linux", "x86_64"))
+    monkeypatch.setattr(deno_manager.platform, "system", lambda: "Linux")
+    monkeypatch.setattr(deno_manager, "_deno_binary_name", lambda: "deno")
+    monkeypatch.setattr(deno_manager, "_addon_data_dir", lambda: str(tmp_path / "deno"))
+    try:
+        tracemalloc.start()
+        try:
+            dest = deno_manager._download_deno(show_progress=False, version="v-big")
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    record_property("deno_install_archive_bytes", os.path.getsize(str(archive)))
+    record_property("deno_install_peak_traced_bytes", peak)
+
+    assert os.path.getsize(dest) == binary_bytes
+    assert os.access(dest, os.X_OK)
+    # Only the installed runtime remains in the versions dir, no archive or partial download
+    assert os.listdir(str(tmp_path / "deno" / "versions")) == ["v-big"]
+    # Buffering the zip and the binary peaked at more than twice the binary size
+    assert peak < 2 * 1024 * 1024
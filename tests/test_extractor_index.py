@@ -0,0 +1,303 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from core import extractor_index, ytdlp_manager
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+STAND_IN_MODULE_COUNT = 400
+
+
+class BaseFakeIE:
+    _VALID_URL = None
+
+    @classmethod
+    def suitable(cls, url):
+        import re
+        return cls._VALID_URL is not None and re.match(cls._VALID_URL, url) is not None
+
+
+class YoutubeIE(BaseFakeIE):
+    _VALID_URL = r'https?://(?:(?:www|m|music)\.)?(?:youtube\.com/watch\?v=|youtu\.be/)(?P<id>[\w-]{11})'
+
+
+class YoutubeTabIE(BaseFakeIE):
+    _VALID_URL = r'https?://(?:www\.)?youtube\.com/(?:playlist|channel)'
+
+
+class VimeoIE(BaseFakeIE):
+    _VALID_URL = r'https?://(?:[^/]+\.)?vimeo\.com/(?P<id>\d+)'
+
+
+class ExampleIE(BaseFakeIE):
+    _VALID_URL = (r'https?://(?:www\.)?example\.org/v/', r'https?://videos\.example\.net/')
+
+
+class GenericIE(BaseFakeIE):
+    _VALID_URL = r'.*'
+
+
+ALL_EXTRACTORS = [YoutubeIE, YoutubeTabIE, VimeoIE, ExampleIE, GenericIE]
+
+
+class FakeYoutubeDL:
+    def __init__(self, params, auto_init=True):
+        self.params = params
+        self.auto_init = auto_init
+        self.default_extractors = False
+        self.extractors = []
+
+    def add_default_info_extractors(self):
+        self.default_extractors = True
+
+    def add_info_extractor(self, extractor):
+        self.extractors.append(extractor)
+
+
+@pytest.fixture(autouse=True)
+def reset_loaded_indexes():
+    extractor_index._LOADED_INDEXES.clear()
+    yield
+    extractor_index._LOADED_INDEXES.clear()
+
+
+def test_valid_url_hosts_extracts_literal_host_names():
+    assert extractor_index.valid_url_hosts(YoutubeIE._VALID_URL) == {"youtube.com", "youtu.be"}
+    assert extractor_index.valid_url_hosts(VimeoIE._VALID_URL) == {"vimeo.com"}
+    assert extractor_index.valid_url_hosts(ExampleIE._VALID_URL) == {"example.org", "videos.example.net"}
+    assert extractor_index.valid_url_hosts(GenericIE._VALID_URL) == set()
+    assert extractor_index.valid_url_hosts(None) == set()
+
+
+def test_route_extractor_classes_keeps_yt_dlp_order_and_appends_generic():
+    index = extractor_index.build_extractor_index(ALL_EXTRACTORS, "2025.01.01")
+
+    assert index["hosts"]["youtube.com"] == [0, 1]
+    assert extractor_index.route_extractor_classes(index, "https://m.youtube.com/watch?v=aaaaaaaaaaa") == [
+        YoutubeIE,
+        YoutubeTabIE,
+        GenericIE,
+    ]
+    assert extractor_index.route_extractor_classes(index, "https://player.vimeo.com/123") == [VimeoIE, GenericIE]
+
+
+def test_route_extractor_classes_gives_up_on_unknown_or_unsuitable_urls():
+    index = extractor_index.build_extractor_index(ALL_EXTRACTORS, "2025.01.01")
+
+    assert extractor_index.route_extractor_classes(index, "https://unknown.example/video") is None
+    assert extractor_index.route_extractor_classes(index, "https://youtube.com/about") is None
+
+
+def test_create_youtube_dl_registers_only_routed_extractors(tmp_path):
+    path = str(tmp_path / "extractor_index.json")
+    assert extractor_index.save_extractor_index(path, extractor_index.build_extractor_index(ALL_EXTRACTORS, "v"))
+    extractor_index._LOADED_INDEXES.clear()
+
+    ydl, targeted = extractor_index.create_youtube_dl(
+        FakeYoutubeDL, {"format": "best"}, "https://youtu.be/aaaaaaaaaaa", index_path=path
+    )
+
+    assert targeted is True
+    assert ydl.auto_init is False
+    assert ydl.default_extractors is False
+    assert ydl.extractors == [YoutubeIE, GenericIE]
+
+
+def test_create_youtube_dl_falls_back_to_defaults_and_builds_the_missing_index(monkeypatch, tmp_path):
+    path = str(tmp_path / "extractor_index.json")
+    monkeypatch.setitem(sys.modules, "yt_dlp.version", SimpleNamespace(__version__="2025.01.01"))
+    monkeypatch.setitem(sys.modules, "yt_dlp.extractor", SimpleNamespace(gen_extractor_classes=lambda: ALL_EXTRACTORS))
+
+    ydl, targeted = extractor_index.create_youtube_dl(
+        FakeYoutubeDL, {}, "https://youtu.be/aaaaaaaaaaa", index_path=path
+    )
+
+    assert targeted is False
+    assert ydl.default_extractors is True
+    with open(path) as f:
+        assert json.load(f)["version"] == "2025.01.01"
+
+    ydl, targeted = extractor_index.create_youtube_dl(
+        FakeYoutubeDL, {}, "https://youtu.be/aaaaaaaaaaa", index_path=path
+    )
+    assert targeted is True
+
+
+def test_create_youtube_dl_uses_defaults_when_yt_dlp_is_not_loaded(monkeypatch):
+    monkeypatch.delitem(sys.modules, "yt_dlp.version", raising=False)
+
+    ydl, targeted = extractor_index.create_youtube_dl(FakeYoutubeDL, {}, "https://youtu.be/aaaaaaaaaaa")
+
+    assert targeted is False
+    assert ydl.default_extractors is True
+
+
+def test_extractor_index_path_lives_next_to_the_installed_runtime(monkeypatch, tmp_path):
+    monkeypatch.setattr(ytdlp_manager, "_addon_data_dir", lambda: str(tmp_path))
+    os.makedirs(os.path.join(str(tmp_path), "versions", "2025.01.01", "yt_dlp"))
+
+    assert ytdlp_manager.extractor_index_path("2025.01.01") == os.path.join(
+        str(tmp_path), "versions", "2025.01.01", "extractor_index.json"
+    )
+    assert ytdlp_manager.extractor_index_path("2024.01.01") is None
+
+
+def _write_stand_in_yt_dlp(root):
+    package = root / "yt_dlp"
+    extractor_package = package / "extractor"
+    extractor_package.mkdir(parents=True)
+    (package / "__init__.py").write_text("from .YoutubeDL import YoutubeDL\n")
+    (package / "version.py").write_text("__version__ = '2099.01.01'\n")
+    (package / "YoutubeDL.py").write_text(textwrap.dedent("""
+        from . import version
+
+
+        class YoutubeDL:
+            def __init__(self, params=None, auto_init=True):
+                self.params = params or {}
+                self._ies = {}
+                if auto_init:
+                    self.add_default_info_extractors()
+
+            def add_info_extractor(self, ie):
+                self._ies[ie.__name__] = ie
+
+            def add_default_info_extractors(self):
+                from .extractor import gen_extractor_classes
+                for ie in gen_extractor_classes():
+                    self.add_info_extractor(ie)
+
+            def extract_info(self, url, download=True):
+                for ie in self._ies.values():
+                    if ie.suitable(url):
+                        return ie().extract(url)
+                raise ValueError('Unsupported URL: ' + url)
+    """))
+    (extractor_package / "__init__.py").write_text(textwrap.dedent("""
+        def gen_extractor_classes():
+            from .extractors import ALL_CLASSES
+            return ALL_CLASSES
+    """))
+    (extractor_package / "common.py").write_text(textwrap.dedent("""
+        import re
+
+
+        class InfoExtractor:
+            _VALID_URL = None
+
+            @classmethod
+            def suitable(cls, url):
+                return re.match(cls._VALID_URL, url) is not None
+
+            def extract(self, url):
+                return {'id': re.match(self._VALID_URL, url).group('id'), 'extractor': type(self).__name__}
+    """))
+    names = []
+    for i in range(STAND_IN_MODULE_COUNT):
+        classes = []
+        for kind in ("", "Playlist", "Channel"):
+            name = "Site{}{}IE".format(i, kind)
+            names.append(("site{}".format(i), name))
+            classes.append(textwrap.dedent("""
+                class {name}(InfoExtractor):
+                    _VALID_URL = r'https?://(?:www\\.)?site{i}\\.example/{kind}(?P<id>[0-9a-z]+)'
+                    _TESTS = [{{'url': 'https://site{i}.example/{kind}abc', 'info_dict': {{'id': 'abc'}}}}]
+                    _FORMATS = {{str(n): {{'height': n, 'ext': 'mp4'}} for n in range(60)}}
+
+                    def _real_extract(self, url):
+                        return self.extract(url)
+
+                    def _parse_formats(self, data):
+                        return [dict(f, format_id=k) for k, f in data.items() if f.get('height')]
+            """).format(name=name, i=i, kind=kind.lower()))
+        (extractor_package / "site{}.py".format(i)).write_text(
+            "from .common import InfoExtractor\n" + "".join(classes)
+        )
+    (extractor_package / "youtube.py").write_text(textwrap.dedent("""
+        from .common import InfoExtractor
+
+
+        class YoutubeIE(InfoExtractor):
+            _VALID_URL = r'https?://(?:(?:www|m)\\.)?(?:youtube\\.com/watch\\?v=|youtu\\.be/)(?P<id>[\\w-]{11})'
+    """))
+    (extractor_package / "generic.py").write_text(textwrap.dedent("""
+        from .common import InfoExtractor
+
+
+        class GenericIE(InfoExtractor):
+            _VALID_URL = r'(?P<id>.*)'
+    """))
+    names = [("youtube", "YoutubeIE")] + names + [("generic", "GenericIE")]
+    (extractor_package / "extractors.py").write_text(
+        "".join("from .{} import {}\n".format(module, name) for module, name in names)
+        + "ALL_CLASSES = [{}]\n".format(", ".join(name for _module, name in names))
+    )
+
+
+_BENCHMARK_SCRIPT = textwrap.dedent("""
+    import json, sys, time, tracemalloc
+    mode, index_path = sys.argv[1], sys.argv[2]
+    tracemalloc.start()
+    started = time.perf_counter()
+    from core import extractor_index
+    YoutubeDL = __import__('yt_dlp').YoutubeDL
+    url = 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'
+    if mode == 'default':
+        ydl = YoutubeDL({})
+        targeted = False
+    else:
+        ydl, targeted = extractor_index.create_youtube_dl(YoutubeDL, {}, url, index_path=index_path)
+    result = ydl.extract_info(url, download=False)
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({'seconds': elapsed, 'peak_bytes': peak, 'targeted': targeted,
+                      'extractor': result['extractor'], 'modules': len(sys.modules),
+                      'registered': sorted(ydl._ies)}))
+""")
+
+
+def _run_benchmark(stand_in_root, mode, index_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(stand_in_root), str(PROJECT_ROOT)]))
+    output = subprocess.run(
+        [sys.executable, "-c", _BENCHMARK_SCRIPT, mode, index_path],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=env,
+        timeout=60,
+    ).stdout
+    return json.loads(output)
+
+
+def test_indexed_startup_registers_only_routed_extractors(tmp_path, record_property):
+    _write_stand_in_yt_dlp(tmp_path)
+    index_path = str(tmp_path / "extractor_index.json")
+
+    # First run builds the index (and the bytecode cache, like an installed runtime)
+    first = _run_benchmark(tmp_path, "indexed", index_path)
+    assert first["targeted"] is False
+    assert os.path.exists(index_path)
+
+    runs = 3
+    default = [_run_benchmark(tmp_path, "default", index_path) for _ in range(runs)]
+    indexed = [_run_benchmark(tmp_path, "indexed", index_path) for _ in range(runs)]
+
+    default_seconds = sorted(run["seconds"] for run in default)[runs // 2]
+    indexed_seconds = sorted(run["seconds"] for run in indexed)[runs // 2]
+    record_property("startup_default_ms", round(default_seconds * 1000, 3))
+    record_property("startup_indexed_ms", round(indexed_seconds * 1000, 3))
+    record_property("startup_default_peak_kib", default[0]["peak_bytes"] // 1024)
+    record_property("startup_indexed_peak_kib", indexed[0]["peak_bytes"] // 1024)
+
+    assert all(run["targeted"] for run in indexed)
+    assert {run["extractor"] for run in default + indexed} == {"YoutubeIE"}
+    assert all(run["registered"] == ["GenericIE", "YoutubeIE"] for run in indexed)
+    assert len(default[0]["registered"]) == 3 * STAND_IN_MODULE_COUNT + 2
+    assert indexed[0]["modules"] < default[0]["modules"]
+    assert indexed[0]["peak_bytes"] < default[0]["peak_bytes"]
@@ -0,0 +1,117 @@
+from core.format_ranking import (
+    build_format_scorers,
+    codec_family,
+    filter_decodable,
+    format_bitrate,
+    is_decodable,
+    parse_decode_profile,
+    rank_formats,
+    score_width,
+)
+
+
+def _fmt(name, vcodec="avc1.640028", width=1920, **extra):
+    return dict({"format": name, "vcodec": vcodec, "width": width}, **extra)
+
+
+def test_codec_family_normalizes_yt_dlp_codec_strings():
+    assert codec_family("avc1.64001F") == "avc1"
+    assert codec_family("vp09.00.50.08") == "vp9"
+    assert codec_family("vp9") == "vp9"
+    assert codec_family("av01.0.08M.08") == "av01"
+    assert codec_family("hvc1.2.4.L153") == "hevc"
+    assert codec_family("none") is None
+    assert codec_family(None) is None
+
+
+def test_format_bitrate_prefers_total_bitrate():
+    assert format_bitrate({"tbr": 2500, "vbr": 2000}) == 2500
+    assert format_bitrate({"vbr": 2000, "abr": 128}) == 2128
+    assert format_bitrate({}) is None
+
+
+def test_default_ranking_orders_by_width_and_keeps_input_order_for_ties():
+    formats = [_fmt("a", width=1280), _fmt("b", width=None), _fmt("c", width=1920), _fmt("d", width=1920)]
+
+    ranked = rank_formats(formats)
+
+    assert [f["format"] for f in ranked] == ["c", "d", "a", "b"]
+    assert build_format_scorers() == [score_width]
+
+
+def test_codec_preference_outranks_resolution():
+    formats = [
+        _fmt("av1-2160", vcodec="av01.0.12M.08", width=3840),
+        _fmt("vp9-1440", vcodec="vp09.00.50.08", width=2560),
+        _fmt("avc-1080", vcodec="avc1.640028", width=1920),
+        _fmt("avc-720", vcodec="avc1.4d401f", width=1280),
+    ]
+
+    ranked = rank_formats(formats, build_format_scorers({'codec_preference': ('avc1', 'vp9')}))
+
+    assert [f["format"] for f in ranked] == ["avc-1080", "avc-720", "vp9-1440", "av1-2160"]
+
+
+def test_bitrate_cap_demotes_formats_above_it_without_dropping_them():
+    formats = [_fmt("1080", tbr=6000), _fmt("720", width=1280, tbr=2500), _fmt("480", width=854)]
+
+    ranked = rank_formats(formats, build_format_scorers({'max_bitrate': 3000}))
+
+    assert [f["format"] for f in ranked] == ["720", "480", "1080"]
+
+
+def test_fps_hdr_and_container_break_ties_between_equal_widths():
+    formats = [
+        _fmt("hdr-60-webm", fps=60, dynamic_range="HDR10", container="webm_dash"),
+        _fmt("sdr-30-mp4", fps=30, dynamic_range="SDR", container="mp4_dash"),
+        _fmt("sdr-60-mp4", fps=60, dynamic_range="SDR", container="mp4_dash"),
+        _fmt("sdr-60-webm", fps=60, dynamic_range="SDR", container="webm_dash"),
+    ]
+
+    scorers = build_format_scorers({
+        'prefer_high_fps': True,
+        'prefer_hdr': False,
+        'container_preference': ('mp4',),
+    })
+    ranked = rank_formats(formats, scorers)
+
+    assert [f["format"] for f in ranked] == ["sdr-60-mp4", "sdr-60-webm", "hdr-60-webm", "sdr-30-mp4"]
+
+
+def test_rank_formats_accepts_custom_scorers_and_key():
+    candidates = [("low", _fmt("low", width=640)), ("high", _fmt("high", width=1920))]
+
+    ranked = rank_formats(candidates, [lambda f: -f["width"]], key=lambda item: item[1])
+
+    assert [name for name, _fmt_info in ranked] == ["low", "high"]
+
+
+def test_parse_decode_profile_reads_codec_width_and_fps_limits():
+    profile = parse_decode_profile("vp9:1920@30, av1:0, avc1@60, hevc, bogus entry, :720")
+
+    assert profile == {
+        "vp9": {"max_width": 1920, "max_fps": 30},
+        "av01": {"max_width": 0, "max_fps": None},
+        "avc1": {"max_width": None, "max_fps": 60},
+        "hevc": {"max_width": None, "max_fps": None},
+    }
+    assert parse_decode_profile("") == {}
+    assert parse_decode_profile(None) == {}
+
+
+def test_is_decodable_applies_the_codec_limits():
+    profile = parse_decode_profile("vp9:1920@30,av01:0")
+
+    assert is_decodable(_fmt("vp9-1080p30", vcodec="vp09.00.40.08", fps=30), profile)
+    assert not is_decodable(_fmt("vp9-1080p60", vcodec="vp09.00.40.08", fps=60), profile)
+    assert not is_decodable(_fmt("vp9-2160", vcodec="vp9", width=3840), profile)
+    assert not is_decodable(_fmt("av1-480", vcodec="av01.0.04M.08", width=854), profile)
+    assert is_decodable(_fmt("avc-2160p60", width=3840, fps=60), profile)
+    assert is_decodable({"format": "audio", "vcodec": "none", "acodec": "opus"}, profile)
+
+
+def test_filter_decodable_keeps_order_and_passes_everything_without_profile():
+    formats = [_fmt("av1", vcodec="av01.0.08M.08"), _fmt("avc"), _fmt("vp9", vcodec="vp9")]
+
+    assert [f["format"] for f in filter_decodable(formats, parse_decode_profile("av01:0"))] == ["avc", "vp9"]
+    assert filter_decodable(formats, {}) == formats
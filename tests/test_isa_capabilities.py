@@ -0,0 +1,61 @@
+from core import isa_capabilities
+from core.persistent_cache import PersistentLRUCache
+
+
+def _cache(tmp_path):
+    return PersistentLRUCache(str(tmp_path / "isa.json"), max_entries=10, ttl_seconds=60)
+
+
+def _counting_check(supported_types):
+    calls = []
+
+    def check_inputstream(stream):
+        calls.append(stream)
+        return stream in supported_types
+
+    return check_inputstream, calls
+
+
+def test_isa_supports_checks_each_manifest_type_once_per_session(tmp_path):
+    isa_capabilities.reset_isa_capability_stats()
+    check, calls = _counting_check({"mpd", "hls"})
+    isa_supports = isa_capabilities.create_isa_supports(check, lambda: "21.4.0", cache=_cache(tmp_path))
+
+    answers = [isa_supports(stream) for stream in ["mpd", "hls", "ism", "mpd", "mpd", "hls", "ism"]]
+
+    assert answers == [True, True, False, True, True, True, False]
+    assert calls == ["mpd", "hls", "ism"]
+    assert isa_capabilities.get_isa_capability_stats() == {'checks': 3, 'hits': 4}
+    assert isa_supports(None) is False
+    assert isa_supports("") is False
+
+
+def test_isa_capabilities_persist_until_inputstream_adaptive_changes(tmp_path):
+    isa_capabilities.reset_isa_capability_stats()
+    check, calls = _counting_check({"mpd"})
+    isa_capabilities.create_isa_supports(check, lambda: "21.4.0", cache=_cache(tmp_path))("mpd")
+
+    # A later plugin invocation reads the persisted result
+    isa_supports = isa_capabilities.create_isa_supports(check, lambda: "21.4.0", cache=_cache(tmp_path))
+    assert isa_supports("mpd") is True
+    assert calls == ["mpd"]
+
+    # Updating (or installing) inputstream.adaptive invalidates it
+    isa_supports = isa_capabilities.create_isa_supports(check, lambda: "21.5.0", cache=_cache(tmp_path))
+    assert isa_supports("mpd") is True
+    assert calls == ["mpd", "mpd"]
+    assert isa_capabilities.get_isa_capability_stats() == {'checks': 2, 'hits': 1}
+
+
+def test_isa_version_is_only_queried_once(tmp_path):
+    versions = []
+
+    def get_isa_version():
+        versions.append(1)
+        return None
+
+    isa_supports = isa_capabilities.create_isa_supports(lambda _stream: False, get_isa_version, cache=_cache(tmp_path))
+    for stream in ["mpd", "hls", "mpd"]:
+        isa_supports(stream)
+
+    assert versions == [1]
@@ -0,0 +1,127 @@
+import struct
+import time
+import tracemalloc
+
+from core import media_boxes
+
+
+def _ebml_element(element_id, payload):
+    # 8-byte size vint so every element has the same header layout
+    return element_id + bytes([0x01]) + len(payload).to_bytes(7, "big") + payload
+
+
+def _synthetic_webm(void_elements):
+    voids = b"".join(_ebml_element(b"\xec", b"\x00" * 4) for _ in range(void_elements))
+    segment = bytes.fromhex("18538067") + bytes([0x01, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
+    cues = _ebml_element(bytes.fromhex("1C53BB6B"), b"\x00" * 16)
+    return bytes.fromhex("1A45DFA3") + b"\x80" + segment + voids + cues
+
+
+def _synthetic_mp4(free_boxes):
+    ftyp = struct.pack(">I", 16) + b"ftyp" + b"isom0000"
+    frees = b"".join(struct.pack(">I", 12) + b"free" + b"\x00" * 4 for _ in range(free_boxes))
+    sidx = struct.pack(">I", 24) + b"sidx" + b"\x00" * 16
+    return ftyp + frees + sidx
+
+
+def _reference_slicing_mp4_walk(data):
+    # The pre-memoryview implementation: slices and unpacks fresh bytes per box.
+    offset = 0
+    while offset < len(data) - 8:
+        box_size = max(struct.unpack(">I", data[offset:offset + 4])[0], 8)
+        box_type = struct.unpack("4s", data[offset + 4:offset + 8])[0]
+        if box_type == b"sidx":
+            return offset
+        offset += box_size
+    return None
+
+
+def test_ebml_vint_length_prefix_lengths():
+    assert media_boxes.ebml_vint_length(0b10000000) == 1
+    assert media_boxes.ebml_vint_length(0b01000001) == 2
+    assert media_boxes.ebml_vint_length(0b00100010) == 3
+    assert media_boxes.ebml_vint_length(0b00010011) == 4
+    assert media_boxes.ebml_vint_length(0b00001000) == 5
+    assert media_boxes.ebml_vint_length(0b00000100) == 6
+    assert media_boxes.ebml_vint_length(0b00000010) == 7
+    assert media_boxes.ebml_vint_length(0b00000001) == 8
+    assert media_boxes.ebml_vint_length(0b00000000) == 0
+
+
+def test_iter_ebml_elements_decodes_ids_sizes_and_descends_into_segment():
+    data = memoryview(_synthetic_webm(2))
+
+    elements = list(media_boxes.iter_ebml_elements(data, 5))
+
+    assert elements[0] == (media_boxes.EBML_SEGMENT_ID, 5, 12, 0x00FFFFFFFFFFFFFF)
+    assert elements[1] == (0xEC, 17, 9, 4)
+    assert elements[2] == (0xEC, 30, 9, 4)
+    assert elements[3] == (media_boxes.EBML_CUES_ID, 43, 12, 16)
+
+
+def test_iter_ebml_elements_stops_at_truncated_header():
+    data = memoryview(bytes.fromhex("1C53BB") + b"")
+
+    assert list(media_boxes.iter_ebml_elements(data)) == []
+
+
+def test_iter_iso_boxes_supports_largesize_and_size_zero():
+    large = struct.pack(">I", 1) + b"moov" + struct.pack(">Q", 24) + b"\x00" * 8
+    to_end = struct.pack(">I", 0) + b"mdat" + b"\x00" * 4
+    data = memoryview(large + to_end)
+
+    boxes = list(media_boxes.iter_iso_boxes(data))
+
+    assert boxes == [
+        (media_boxes.read_uint32(b"moov", 0), 0, 16, 24),
+        (media_boxes.BOX_MDAT, 24, 8, 0),
+    ]
+
+
+def test_iter_iso_boxes_stops_on_invalid_size():
+    data = memoryview(struct.pack(">I", 4) + b"free" + b"\x00" * 8)
+
+    assert list(media_boxes.iter_iso_boxes(data)) == []
+
+
+def test_walkers_benchmark_thousands_of_elements_without_copies(record_property):
+    element_count = 5000
+    webm = _synthetic_webm(element_count)
+    mp4 = _synthetic_mp4(element_count)
+
+    # Results must match the slicing implementation the walkers replaced.
+    with memoryview(mp4) as view:
+        sidx_offset = [
+            offset for box_type, offset, _h, _s in media_boxes.iter_iso_boxes(view)
+            if box_type == media_boxes.BOX_SIDX
+        ][0]
+    assert sidx_offset == _reference_slicing_mp4_walk(mp4)
+
+    def walk_all():
+        with memoryview(webm) as webm_view, memoryview(mp4) as mp4_view:
+            webm_count = sum(1 for _ in media_boxes.iter_ebml_elements(webm_view, 5))
+            mp4_count = sum(1 for _ in media_boxes.iter_iso_boxes(mp4_view))
+        return webm_count, mp4_count
+
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        counts = walk_all()
+        walker_seconds = time.perf_counter() - started
+        _current, walker_peak = tracemalloc.get_traced_memory()
+
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        _reference_slicing_mp4_walk(mp4)
+        reference_seconds = time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+
+    record_property("walker_seconds", walker_seconds)
+    record_property("reference_mp4_seconds", reference_seconds)
+    record_property("walker_peak_bytes", walker_peak)
+
+    assert counts == (element_count + 2, element_count + 2)
+    # The walk never copies the input (~130 KiB here); only constant-size
+    # bookkeeping is allocated regardless of how many elements are visited.
+    assert walker_peak < 8 * 1024
@@ -0,0 +1,129 @@
+import json
+import sys
+from types import SimpleNamespace
+
+from core import persistent_cache
+
+
+class FakeClock:
+    def __init__(self, now=1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_addon_data_path_uses_xbmcvfs_when_available(monkeypatch):
+    fake_xbmcvfs = SimpleNamespace(translatePath=lambda _p: "/kodi/addon_data/")
+    monkeypatch.setitem(sys.modules, "xbmcvfs", fake_xbmcvfs)
+
+    assert persistent_cache.addon_data_path("cache.json") == "/kodi/addon_data/cache.json"
+
+
+def test_cache_round_trips_values_through_flush(tmp_path):
+    path = str(tmp_path / "cache.json")
+    clock = FakeClock()
+    cache = persistent_cache.PersistentLRUCache(path, max_entries=10, ttl_seconds=60, clock=clock)
+
+    cache.put("a", [1, 2])
+    assert cache.flush() is True
+
+    reloaded = persistent_cache.PersistentLRUCache(path, max_entries=10, ttl_seconds=60, clock=clock)
+    assert reloaded.get("a") == [1, 2]
+
+
+def test_cache_expires_entries_after_ttl(tmp_path):
+    clock = FakeClock()
+    cache = persistent_cache.PersistentLRUCache(str(tmp_path / "c.json"), max_entries=10, ttl_seconds=60, clock=clock)
+
+    cache.put("short", 1, ttl_seconds=5)
+    cache.put("default", 2)
+    clock.now += 10
+
+    assert cache.get("short") is None
+    assert cache.get("default") == 2
+    clock.now += 60
+    assert cache.get("default") is None
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    clock = FakeClock()
+    cache = persistent_cache.PersistentLRUCache(str(tmp_path / "c.json"), max_entries=2, ttl_seconds=60, clock=clock)
+
+    cache.put("a", 1)
+    clock.now += 1
+    cache.put("b", 2)
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_cache_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text("{not json")
+
+    cache = persistent_cache.PersistentLRUCache(str(path), max_entries=2, ttl_seconds=60)
+
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.flush() is True
+    assert json.loads(path.read_text())["entries"]["a"]["value"] == 1
+
+
+def test_cache_flush_reports_write_errors(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("x")
+    cache = persistent_cache.PersistentLRUCache(str(blocker / "cache.json"), max_entries=2, ttl_seconds=60)
+
+    cache.put("a", 1)
+
+    assert cache.flush() is False
+
+
+def test_flush_merges_entries_written_by_another_process(tmp_path):
+    path = str(tmp_path / "cache.json")
+    clock = FakeClock()
+    # Both loaded the (empty) file before either flushed, like a prefetch
+    # worker and the next plugin invocation
+    plugin = persistent_cache.PersistentLRUCache(path, max_entries=10, ttl_seconds=60, clock=clock)
+    prefetch = persistent_cache.PersistentLRUCache(path, max_entries=10, ttl_seconds=60, clock=clock)
+    assert plugin.get("missing") is None and prefetch.get("missing") is None
+
+    prefetch.put("next", 1)
+    assert prefetch.flush() is True
+    plugin.put("current", 2)
+    assert plugin.flush() is True
+
+    reloaded = persistent_cache.PersistentLRUCache(path, max_entries=10, ttl_seconds=60, clock=clock)
+    assert reloaded.get("next") == 1
+    assert reloaded.get("current") == 2
+    # The flushing instance picks up the other process's entries too
+    assert plugin.get("next") == 1
+
+
+def test_concurrent_flushes_from_separate_caches_lose_no_entries(tmp_path):
+    import threading
+
+    path = str(tmp_path / "cache.json")
+    clock = FakeClock()
+
+    def writer(name):
+        cache = persistent_cache.PersistentLRUCache(path, max_entries=100, ttl_seconds=60, clock=clock)
+        for index in range(10):
+            cache.put("{}-{}".format(name, index), index)
+            assert cache.flush() is True
+
+    threads = [threading.Thread(target=writer, args=(name,)) for name in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    with open(path) as f:
+        assert len(json.load(f)["entries"]) == 40
@@ -1,5 +1,11 @@
+import time
+
+from core import playback_selection
+from core.format_ranking import build_format_scorers, parse_decode_profile
 from core.playback_selection import (
     analyze_formats,
+    build_format_index,
+    infer_stream_kind,
     collect_subtitle_urls,
     encode_inputstream_headers,
     find_playlist_start_index,
@@ -9,6 +15,7 @@ from core.playback_selection import (
     should_allow_native_hls_without_isa,
     add_dash_formats_to_builder,
     build_dash_manifest_candidate,
+    call_once,
     resolve_filtered_fallback_candidate,
     resolve_effective_headers,
     resolve_manifest_candidate,
@@ -16,6 +23,7 @@ from core.playback_selection import (
     resolve_start_index,
     selection_log_messages,
     select_playback_source,
+    pick_best_dash_video_format,
     should_filter_by_max_width,
     should_skip_manifest_candidate,
     should_skip_non_adaptive_candidate,
@@ -1099,3 +1107,454 @@ def test_resolve_starting_entry_returns_entry_when_url_missing():
     entry = {"id": "local", "title": "already resolved"}
 
     assert resolve_starting_entry(entry, lambda *_args, **_kwargs: {"should": "not-run"}) == entry
+
+
+def test_add_dash_formats_to_builder_prefetches_all_ranges_before_adding():
+    class PrefetchingBuilder(DummyDashBuilder):
+        def __init__(self):
+            super().__init__()
+            self.prefetched = None
+
+        def prefetch_ranges(self, formats):
+            assert self.video_added == [] and self.audio_added == []
+            self.prefetched = [format_info["format"] for format_info in formats]
+
+    builder = PrefetchingBuilder()
+
+    result = add_dash_formats_to_builder(
+        builder,
+        dash_video=[{"format": "v1"}, {"format": "v2"}],
+        dash_audio=[{"format": "a1"}],
+        have_video=True,
+        have_audio=True,
+    )
+
+    assert builder.prefetched == ["v1", "v2", "a1"]
+    assert builder.video_added == ["v1", "v2"]
+    assert [event["type"] for event in result["events"]] == ["video_added", "video_added", "audio_added"]
+
+
+def test_build_dash_manifest_candidate_passes_media_id_to_manifest_factory():
+    created = []
+
+    def manifest_factory(duration, media_id=None):
+        created.append((duration, media_id))
+        return DummyDashBuilder()
+
+    captured_refresh = {}
+
+    def start_httpd(manifest, refresh_manifest=None):
+        captured_refresh["callback"] = refresh_manifest
+        return "http://localhost/mpd"
+
+    build_dash_manifest_candidate(
+        duration="12",
+        dash_video=[{"format": "v1"}],
+        dash_audio=[{"format": "a1"}],
+        have_video=True,
+        have_audio=True,
+        manifest_factory=manifest_factory,
+        start_httpd=start_httpd,
+        resolve_fresh_result=lambda: {"id": "fresh-id", "duration": "20", "formats": []},
+        media_id="video-id",
+    )
+    captured_refresh["callback"]()
+
+    assert created == [("12", "video-id"), ("20", "fresh-id")]
+
+
+class ForbiddenError(Exception):
+    def __init__(self):
+        super().__init__("403 Client Error: Forbidden")
+        self.response = type("Response", (), {"status_code": 403})()
+
+
+class HeaderRecordingBuilder(DummyDashBuilder):
+    def __init__(self, forbidden_urls=()):
+        super().__init__()
+        self.forbidden_urls = set(forbidden_urls)
+        self.seen = []
+
+    def add_video_format(self, format_info):
+        self.seen.append((format_info["url"], format_info.get("http_headers")))
+        if format_info["url"] in self.forbidden_urls:
+            raise ForbiddenError()
+        super().add_video_format(format_info)
+
+    def add_audio_format(self, format_info):
+        self.seen.append((format_info["url"], format_info.get("http_headers")))
+        if format_info["url"] in self.forbidden_urls:
+            raise ForbiddenError()
+        super().add_audio_format(format_info)
+
+
+def test_add_dash_formats_to_builder_falls_back_to_result_http_headers():
+    builder = HeaderRecordingBuilder()
+    video = {"format": "v1", "url": "https://x/v", "http_headers": {"User-Agent": "format-ua"}}
+    audio = {"format": "a1", "url": "https://x/a"}
+
+    add_dash_formats_to_builder(
+        builder,
+        dash_video=[video],
+        dash_audio=[audio],
+        have_video=True,
+        have_audio=True,
+        http_headers={"User-Agent": "result-ua"},
+    )
+
+    assert builder.seen == [
+        ("https://x/v", {"User-Agent": "format-ua"}),
+        ("https://x/a", {"User-Agent": "result-ua"}),
+    ]
+    assert "http_headers" not in audio
+
+
+def test_add_dash_formats_to_builder_records_http_status_of_failures():
+    builder = HeaderRecordingBuilder(forbidden_urls={"https://x/v"})
+
+    result = add_dash_formats_to_builder(
+        builder,
+        dash_video=[{"format": "v1", "url": "https://x/v"}],
+        dash_audio=[],
+        have_video=True,
+        have_audio=False,
+    )
+
+    assert result["events"][0]["type"] == "video_failed"
+    assert result["events"][0]["status"] == 403
+
+
+def _fresh_dash_result():
+    return {
+        "id": "media",
+        "http_headers": {"Cookie": "fresh"},
+        "formats": [
+            {"format": "v1", "format_id": "137", "url": "https://x/v-new", "vcodec": "avc1", "acodec": "none", "container": "mp4_dash"},
+            {"format": "v2", "format_id": "248", "url": "https://x/v2-new", "vcodec": "vp9", "acodec": "none", "container": "webm_dash"},
+            {"format": "a1", "format_id": "140", "url": "https://x/a-new", "vcodec": "none", "acodec": "mp4a", "container": "m4a_dash"},
+        ],
+    }
+
+
+def test_build_dash_manifest_candidate_retries_once_with_fresh_formats_on_403():
+    builders = []
+
+    def manifest_factory(_duration, media_id=None):
+        builder = HeaderRecordingBuilder(forbidden_urls={"https://x/v-old", "https://x/a-old"})
+        builders.append(builder)
+        return builder
+
+    resolves = []
+
+    def resolve_fresh_result():
+        resolves.append(1)
+        return _fresh_dash_result()
+
+    result = build_dash_manifest_candidate(
+        duration="12",
+        dash_video=[{"format": "v1", "format_id": "137", "url": "https://x/v-old"}],
+        dash_audio=[{"format": "a1", "format_id": "140", "url": "https://x/a-old"}],
+        have_video=True,
+        have_audio=True,
+        manifest_factory=manifest_factory,
+        start_httpd=lambda manifest, refresh_manifest=None: "http://localhost/mpd",
+        resolve_fresh_result=resolve_fresh_result,
+        media_id="media",
+        http_headers={"Cookie": "stale"},
+    )
+
+    assert result["url"] == "http://localhost/mpd"
+    assert resolves == [1]
+    # Only the originally requested video format is rebuilt, with fresh headers
+    assert builders[1].seen == [
+        ("https://x/v-new", {"Cookie": "fresh"}),
+        ("https://x/a-new", {"Cookie": "fresh"}),
+    ]
+    assert [event["type"] for event in result["events"]] == [
+        "video_failed",
+        "audio_failed",
+        "retried_fresh_formats",
+        "video_added",
+        "audio_added",
+    ]
+    assert "Retrying DASH manifest with freshly resolved formats after HTTP 403" in selection_log_messages(
+        dict(result, source="dash_manifest")
+    )
+
+
+def test_build_dash_manifest_candidate_does_not_retry_other_failures():
+    resolves = []
+
+    result = build_dash_manifest_candidate(
+        duration="12",
+        dash_video=[{"format": "v1"}],
+        dash_audio=[{"format": "a1"}],
+        have_video=True,
+        have_audio=True,
+        manifest_factory=lambda _duration: DummyDashBuilder(failing_audio={"a1"}),
+        start_httpd=lambda _manifest: "http://localhost/should-not-happen",
+        resolve_fresh_result=lambda: resolves.append(1),
+    )
+
+    assert "url" not in result
+    assert resolves == []
+
+
+def test_call_once_memoizes_result():
+    calls = []
+
+    def resolve():
+        calls.append(1)
+        return {"id": "x"}
+
+    once = call_once(resolve)
+
+    assert once() == {"id": "x"}
+    assert once() == {"id": "x"}
+    assert calls == [1]
+    assert call_once(None) is None
+
+
+def test_build_format_index_classifies_each_format_once():
+    formats = [
+        {"url": "https://a/master.m3u8", "protocol": "m3u8_native", "vcodec": "avc1", "acodec": "mp4a", "width": 1280},
+        {"url": "https://a/v.mp4", "vcodec": "avc1", "acodec": "none", "container": "mp4_dash", "width": 1920},
+        {"url": "https://a/a.m4a", "vcodec": "unknown", "acodec": "mp4a", "container": "m4a_dash"},
+        {"manifest_url": "https://a/manifest.mpd", "vcodec": "avc1", "acodec": "none"},
+    ]
+
+    index = build_format_index(formats)
+
+    assert [entry["manifest_type"] for entry in index["entries"]] == ["hls", None, None, None]
+    assert index["entries"][3]["manifest_url_type"] == "mpd"
+    assert [entry["kind"] for entry in index["entries"]] == ["video", "video", "audio", "video"]
+    assert [entry["dash_video"] for entry in index["entries"]] == [False, True, False, False]
+    assert index["dash_anchor"] is formats[1]
+    assert index["by_url"]["https://a/a.m4a"]["format"] is formats[2]
+    assert analyze_formats(formats) == (index["have_video"], index["have_audio"], index["dash_video"], index["dash_audio"])
+
+
+def test_infer_stream_kind_uses_last_format_with_the_url():
+    formats = [
+        {"url": "https://a/same", "vcodec": "avc1", "acodec": "mp4a"},
+        {"url": "https://a/same", "vcodec": "none", "acodec": "opus"},
+    ]
+    index = build_format_index(formats)
+
+    assert infer_stream_kind(index, "https://a/same") == "audio"
+    assert infer_stream_kind(index, "https://a/unknown") == "video"
+
+
+def _synthetic_formats(count):
+    formats = []
+    for i in range(count):
+        height = 144 + (i % 12) * 90
+        if i % 3 == 0:
+            formats.append({
+                "format": "hls-{}".format(i),
+                "url": "https://cdn.example/hls/{}/index.m3u8?token=abc".format(i),
+                "manifest_url": "https://cdn.example/master.m3u8",
+                "protocol": "m3u8_native",
+                "vcodec": "avc1.64001f",
+                "acodec": "mp4a.40.2",
+                "width": height * 16 // 9,
+                "height": height,
+            })
+        elif i % 3 == 1:
+            formats.append({
+                "format": "dash-video-{}".format(i),
+                "url": "https://cdn.example/dash/{}/video.mp4?expire=1&sig=abc".format(i),
+                "manifest_url": "https://cdn.example/manifest.mpd",
+                "protocol": "http_dash_segments",
+                "vcodec": "avc1.640028",
+                "acodec": "none",
+                "container": "mp4_dash",
+                "width": height * 16 // 9,
+                "height": height,
+            })
+        else:
+            formats.append({
+                "format": "dash-audio-{}".format(i),
+                "url": "https://cdn.example/dash/{}/audio.m4a?expire=1&sig=abc".format(i),
+                "protocol": "https",
+                "vcodec": "none",
+                "acodec": "mp4a.40.2",
+                "container": "m4a_dash",
+            })
+    return formats
+
+
+def test_select_playback_source_scans_hundreds_of_formats_once(monkeypatch, record_property):
+    formats = _synthetic_formats(600)
+    guess_calls = []
+    isa_calls = []
+    original_guess = playback_selection.guess_manifest_type
+    monkeypatch.setattr(
+        playback_selection,
+        "guess_manifest_type",
+        lambda format_info, url: guess_calls.append(url) or original_guess(format_info, url),
+    )
+
+    def isa_supports(manifest_type):
+        # inputstreamhelper.Helper(...).check_inputstream() is far from free
+        isa_calls.append(manifest_type)
+        time.sleep(0.0005)
+        return manifest_type in ("hls", "mpd")
+
+    runs = 20
+    started = time.perf_counter()
+    for _ in range(runs):
+        del guess_calls[:]
+        del isa_calls[:]
+        selected = select_playback_source(
+            result={"formats": formats},
+            usemanifest=True,
+            usedashbuilder=False,
+            maxwidth=1280,
+            isa_supports=isa_supports,
+            disable_opus_for_audio_only_hls_native=True,
+            strict_max_resolution=True,
+        )
+    elapsed = (time.perf_counter() - started) / runs
+    record_property("select_playback_source_600_formats_ms", round(elapsed * 1000, 3))
+
+    assert selected["source"] == "raw_format"
+    assert selected["url"].endswith("index.m3u8?token=abc")
+    # Every URL is classified at most once and ISA is asked once per manifest type
+    assert len(guess_calls) <= len(formats) + sum(1 for f in formats if "manifest_url" in f)
+    assert len(isa_calls) == len(set(isa_calls))
+    assert len(isa_calls) <= 3
+
+
+def test_select_playback_source_ranks_raw_formats_with_scorers():
+    result = {
+        "formats": [
+            {"format": "avc-720", "url": "https://example.com/avc720.mp4", "vcodec": "avc1.4d401f", "acodec": "aac", "width": 1280},
+            {"format": "vp9-1080", "url": "https://example.com/vp91080.webm", "vcodec": "vp9", "acodec": "opus", "width": 1920},
+            {"format": "av1-1080", "url": "https://example.com/av11080.mp4", "vcodec": "av01.0.08M.08", "acodec": "aac", "width": 1920},
+        ]
+    }
+
+    def select(profile):
+        return select_playback_source(
+            result=result,
+            usemanifest=False,
+            usedashbuilder=False,
+            maxwidth=1920,
+            isa_supports=lambda _stream: False,
+            format_scorers=build_format_scorers(profile),
+        )
+
+    selected = select({'codec_preference': ('avc1',)})
+    assert selected["source"] == "raw_format"
+    assert selected["url"] == "https://example.com/avc720.mp4"
+    assert select({'codec_preference': ('vp9',)})["url"] == "https://example.com/vp91080.webm"
+
+
+def test_pick_best_dash_video_format_applies_scorers_within_width_limit():
+    dash_video = [
+        {"format": "avc-1080", "vcodec": "avc1.640028", "width": 1920},
+        {"format": "vp9-1080", "vcodec": "vp09.00.40.08", "width": 1920},
+        {"format": "vp9-2160", "vcodec": "vp09.00.50.08", "width": 3840},
+    ]
+
+    assert pick_best_dash_video_format(dash_video, 1920)["format"] == "avc-1080"
+    scorers = build_format_scorers({'codec_preference': ('vp9',)})
+    assert pick_best_dash_video_format(dash_video, 1920, scorers)["format"] == "vp9-1080"
+    assert pick_best_dash_video_format(dash_video, 640, scorers)["format"] == "vp9-2160"
+
+
+def _decode_profile_result():
+    return {
+        "duration": "10",
+        "formats": [
+            {"format": "avc-1080", "format_id": "137", "url": "https://example.com/avc1080", "vcodec": "avc1.640028",
+             "acodec": "none", "container": "mp4_dash", "width": 1920, "fps": 30},
+            {"format": "vp9-1080p60", "format_id": "303", "url": "https://example.com/vp91080", "vcodec": "vp9",
+             "acodec": "none", "container": "webm_dash", "width": 1920, "fps": 60},
+            {"format": "av1-2160", "format_id": "401", "url": "https://example.com/av12160", "vcodec": "av01.0.12M.08",
+             "acodec": "none", "container": "mp4_dash", "width": 3840, "fps": 30},
+            {"format": "a1", "url": "https://example.com/a1", "vcodec": "none", "acodec": "aac", "container": "m4a_dash"},
+        ],
+    }
+
+
+class _RecordingDashModule:
+    manifests = []
+
+    class Manifest:
+        def __init__(self, _duration, media_id=None):
+            self.video_formats = []
+            _RecordingDashModule.manifests.append(self)
+
+        def add_video_format(self, format_info):
+            self.video_formats.append(format_info.get("format"))
+
+        def add_audio_format(self, _format_info):
+            pass
+
+        def emit(self):
+            return ",".join(self.video_formats)
+
+    @staticmethod
+    def start_httpd(manifest, refresh_manifest=None):
+        _RecordingDashModule.refresh_manifest = refresh_manifest
+        return "http://dummy.local/" + manifest
+
+
+def test_select_playback_source_writes_only_decodable_representations_into_mpd():
+    _RecordingDashModule.manifests = []
+    result = _decode_profile_result()
+    result["resolve_fresh_result"] = _decode_profile_result
+
+    selected = select_playback_source(
+        result=result,
+        usemanifest=False,
+        usedashbuilder=True,
+        maxwidth=7680,
+        isa_supports=lambda stream: stream == "mpd",
+        dashbuilder=_RecordingDashModule,
+        strict_max_resolution=False,
+        decode_profile=parse_decode_profile("vp9:1920@30,av01:1920"),
+    )
+
+    assert selected["source"] == "dash_manifest"
+    assert selected["url"] == "http://dummy.local/avc-1080"
+    # Manifest refreshes rebuild from fresh formats with the same limits
+    assert _RecordingDashModule.refresh_manifest() == "avc-1080"
+
+
+def test_select_playback_source_strict_dash_pick_respects_decode_profile():
+    _RecordingDashModule.manifests = []
+
+    selected = select_playback_source(
+        result=_decode_profile_result(),
+        usemanifest=False,
+        usedashbuilder=True,
+        maxwidth=3840,
+        isa_supports=lambda stream: stream == "mpd",
+        dashbuilder=_RecordingDashModule,
+        decode_profile=parse_decode_profile("av01:0"),
+    )
+
+    assert selected["url"] == "http://dummy.local/avc-1080"
+
+
+def test_select_playback_source_skips_undecodable_raw_formats():
+    result = {
+        "formats": [
+            {"format": "avc-720", "url": "https://example.com/avc720.mp4", "vcodec": "avc1", "acodec": "aac", "width": 1280},
+            {"format": "av1-1080", "url": "https://example.com/av11080.mp4", "vcodec": "av01.0.08M.08", "acodec": "aac", "width": 1920},
+        ]
+    }
+
+    selected = select_playback_source(
+        result=result,
+        usemanifest=False,
+        usedashbuilder=False,
+        maxwidth=1920,
+        isa_supports=lambda _stream: False,
+        decode_profile=parse_decode_profile("av01:0"),
+    )
+
+    assert selected["url"] == "https://example.com/avc720.mp4"
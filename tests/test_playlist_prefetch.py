@@ -0,0 +1,97 @@
+import threading
+
+from core import playlist_prefetch, ydl_pool
+
+
+class FakeYoutubeDL:
+    created = []
+
+    def __init__(self, opts, auto_init=True):
+        self.opts = opts
+        self.extractors_added = False
+        FakeYoutubeDL.created.append(self)
+
+    def add_default_info_extractors(self):
+        self.extractors_added = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        return False
+
+    def extract_info(self, url, download=False):
+        assert download is False
+        if url.endswith("broken"):
+            raise RuntimeError("extraction failed")
+        return {'id': url, 'formats': [{'url': url + '/stream'}]}
+
+
+def _install_fake_cache(monkeypatch, cached=()):
+    stored = {}
+    monkeypatch.setattr(
+        playlist_prefetch.result_cache,
+        "get_cached_result",
+        lambda url, _opts: {'id': url} if url in cached else None,
+    )
+
+    def store_result(url, opts, result):
+        stored[url] = (opts, result)
+        return True
+
+    monkeypatch.setattr(playlist_prefetch.result_cache, "store_result", store_result)
+    return stored
+
+
+def test_next_playlist_entries_returns_entries_queued_after_the_starting_item():
+    entries = [{'url': 'a'}, {'url': 'b'}, {'title': 'no url'}, {'url': 'c'}, {'url': 'd'}]
+
+    assert playlist_prefetch.next_playlist_entries(entries, 1, 2) == [{'url': 'b'}, {'url': 'c'}]
+    assert playlist_prefetch.next_playlist_entries(entries, None, 1) == [{'url': 'a'}]
+    assert playlist_prefetch.next_playlist_entries(entries, 1, 0) == []
+
+
+def test_prefetch_playlist_entries_stores_results_in_the_result_cache(monkeypatch):
+    ydl_pool.clear_ydl_pool()
+    FakeYoutubeDL.created = []
+    stored = _install_fake_cache(monkeypatch, cached=("https://a/cached",))
+    messages = []
+    opts = {'extract_flat': 'in_playlist'}
+
+    futures = playlist_prefetch.prefetch_playlist_entries(
+        [{'url': 'https://a/1'}, {'url': 'https://a/cached'}, {'url': 'https://a/broken'}],
+        opts,
+        FakeYoutubeDL,
+        messages.append,
+    )
+
+    assert [future.result(timeout=5) for future in futures] == [True, False, False]
+    assert stored == {'https://a/1': (opts, {'id': 'https://a/1', 'formats': [{'url': 'https://a/1/stream'}]})}
+    # Cached entries are not extracted again; workers reuse warm pooled instances
+    assert 1 <= len(FakeYoutubeDL.created) <= 2
+    assert all(ydl.extractors_added for ydl in FakeYoutubeDL.created)
+    ydl_pool.clear_ydl_pool()
+    assert any("https://a/broken" in message for message in messages)
+
+
+def test_prefetch_playlist_entries_runs_in_background_threads(monkeypatch):
+    _install_fake_cache(monkeypatch)
+    release = threading.Event()
+    threads = []
+
+    class BlockingYoutubeDL(FakeYoutubeDL):
+        def extract_info(self, url, download=False):
+            threads.append(threading.current_thread())
+            assert release.wait(5)
+            return super().extract_info(url, download)
+
+    futures = playlist_prefetch.prefetch_playlist_entries(
+        [{'url': 'https://a/1'}, {'url': 'https://a/2'}], {}, BlockingYoutubeDL, lambda _msg: None
+    )
+
+    assert not any(future.done() for future in futures)
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == [True, True]
+    ydl_pool.clear_ydl_pool()
+    assert threading.current_thread() not in threads
+    assert playlist_prefetch.prefetch_playlist_entries([], {}, BlockingYoutubeDL, lambda _msg: None) == []
@@ -0,0 +1,234 @@
+import json
+import socket
+
+import pytest
+
+from core import resolver_daemon, ydl_pool
+
+STAND_IN_EXTRACTOR_COUNT = 1500
+
+
+def _stand_in_module_source(extractor_count):
+    # Mimics yt-dlp's layout: many extractor classes with _VALID_URL patterns
+    # compiled when the default extractors are registered.
+    lines = ["import re", "EXTRACTORS = []"]
+    for i in range(extractor_count):
+        lines.extend([
+            "class Site{0}IE:".format(i),
+            "    _VALID_URL = r'https?://(?:www\\.)?site{0}\\.example/(?:watch/)?(?P<id>[0-9A-Za-z_-]+)'".format(i),
+            "    IE_NAME = 'site{0}'".format(i),
+            "EXTRACTORS.append(Site{0}IE)".format(i),
+        ])
+    lines.extend([
+        "class YoutubeDL:",
+        "    def __init__(self, params=None):",
+        "        self.params = params or {}",
+        "        self._ies = []",
+        "    def add_default_info_extractors(self):",
+        "        self._ies = [(ie, re.compile(ie._VALID_URL)) for ie in EXTRACTORS]",
+        "    def extract_info(self, url, download=True):",
+        "        for ie, pattern in self._ies:",
+        "            match = pattern.match(url)",
+        "            if match:",
+        "                video_id = match.group('id')",
+        "                return {'id': video_id, 'extractor': ie.IE_NAME,",
+        "                        'formats': [{'format_id': '18', 'url': 'https://cdn.example/' + video_id}]}",
+        "        raise ValueError('Unsupported URL: ' + url)",
+        "    def __enter__(self):",
+        "        return self",
+        "    def __exit__(self, *args):",
+        "        return False",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def _load_stand_in_youtube_dl(code):
+    namespace = {}
+    exec(code, namespace)
+    return namespace["YoutubeDL"]
+
+
+@pytest.fixture
+def stand_in_code():
+    return compile(_stand_in_module_source(STAND_IN_EXTRACTOR_COUNT), "stand_in_yt_dlp.py", "exec")
+
+
+@pytest.fixture
+def daemon(tmp_path, stand_in_code):
+    ydl_pool.clear_ydl_pool()
+    youtube_dl_cls = _load_stand_in_youtube_dl(stand_in_code)
+    httpd = resolver_daemon.start_daemon(youtube_dl_cls, path=str(tmp_path / "resolver_daemon.json"))
+    try:
+        yield httpd
+    finally:
+        resolver_daemon.stop_daemon(httpd)
+        ydl_pool.clear_ydl_pool()
+
+
+def _unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_daemon_publishes_endpoint_and_resolves_with_a_warm_instance(daemon):
+    endpoint = resolver_daemon.read_endpoint(daemon.endpoint_path)
+    assert endpoint["port"] == daemon.server_address[1]
+
+    results = [
+        resolver_daemon.resolve_remote("https://site42.example/watch/abc{}".format(i), {}, endpoint=endpoint)
+        for i in range(3)
+    ]
+
+    assert [result["id"] for result in results] == ["abc0", "abc1", "abc2"]
+    assert results[0]["extractor"] == "site42"
+    assert ydl_pool.get_ydl_pool_stats() == {'option_sets': 1, 'idle_instances': 1}
+
+
+def test_daemon_reports_extraction_errors(daemon):
+    endpoint = resolver_daemon.read_endpoint(daemon.endpoint_path)
+
+    with pytest.raises(resolver_daemon.ResolverDaemonError, match="Unsupported URL"):
+        resolver_daemon.resolve_remote("https://unknown.example/x", {}, endpoint=endpoint)
+
+
+def test_resolve_remote_returns_none_without_a_usable_daemon(daemon, tmp_path):
+    endpoint = resolver_daemon.read_endpoint(daemon.endpoint_path)
+    url = "https://site1.example/abc"
+
+    assert resolver_daemon.resolve_remote(url, {}, endpoint=dict(endpoint, token="wrong")) is None
+    assert resolver_daemon.resolve_remote(url, {}, endpoint={'port': _unused_port(), 'token': 'x'}) is None
+    assert resolver_daemon.resolve_remote(url, {'hook': object()}, endpoint=endpoint) is None
+    assert resolver_daemon.read_endpoint(str(tmp_path / "missing.json")) is None
+
+
+def test_stop_daemon_removes_only_its_own_endpoint(tmp_path, stand_in_code):
+    path = str(tmp_path / "resolver_daemon.json")
+    youtube_dl_cls = _load_stand_in_youtube_dl(stand_in_code)
+    first = resolver_daemon.start_daemon(youtube_dl_cls, path=path)
+    second = resolver_daemon.start_daemon(youtube_dl_cls, path=path)
+
+    resolver_daemon.stop_daemon(first)
+    assert resolver_daemon.read_endpoint(path)["token"] == second.token
+
+    resolver_daemon.stop_daemon(second)
+    assert resolver_daemon.read_endpoint(path) is None
+    ydl_pool.clear_ydl_pool()
+
+
+def test_remote_youtube_dl_falls_back_to_a_local_instance(monkeypatch):
+    calls = []
+
+    class LocalYoutubeDL:
+        def __init__(self, params, auto_init=True):
+            assert auto_init is False
+            self.params = params
+            self.extractors_added = False
+
+        def add_default_info_extractors(self):
+            self.extractors_added = True
+
+        def extract_info(self, url, download=True):
+            calls.append((url, download, self.extractors_added))
+            return {'id': 'local'}
+
+    monkeypatch.setattr(resolver_daemon, "read_endpoint", lambda path=None: None)
+    remote = resolver_daemon.RemoteYoutubeDL(lambda: LocalYoutubeDL, {'format': 'best'})
+    remote.add_default_info_extractors()
+
+    with remote:
+        assert remote.extract_info("https://a/1", download=False) == {'id': 'local'}
+        assert remote.extract_info("https://a/2", download=True) == {'id': 'local'}
+
+    assert calls == [("https://a/1", False, True), ("https://a/2", True, True)]
+
+
+def test_remote_youtube_dl_does_not_load_yt_dlp_when_the_daemon_answers(daemon):
+    def load_youtube_dl_cls():
+        raise AssertionError("yt-dlp must not be imported")
+
+    remote = resolver_daemon.RemoteYoutubeDL(
+        load_youtube_dl_cls,
+        {},
+        endpoint=resolver_daemon.read_endpoint(daemon.endpoint_path),
+    )
+
+    assert remote.extract_info("https://site7.example/xyz", download=False)["id"] == "xyz"
+
+
+@pytest.fixture
+def counting_daemon(tmp_path, stand_in_code):
+    ydl_pool.clear_ydl_pool()
+    created = []
+
+    class CountingYoutubeDL(_load_stand_in_youtube_dl(stand_in_code)):
+        def __init__(self, params=None):
+            super().__init__(params)
+            created.append(self)
+
+    httpd = resolver_daemon.start_daemon(CountingYoutubeDL, path=str(tmp_path / "resolver_daemon.json"))
+    try:
+        yield CountingYoutubeDL, httpd, created
+    finally:
+        resolver_daemon.stop_daemon(httpd)
+        ydl_pool.clear_ydl_pool()
+
+
+def test_warm_daemon_serves_requests_from_the_warmed_up_instance(counting_daemon):
+    youtube_dl_cls, httpd, created = counting_daemon
+    endpoint = resolver_daemon.read_endpoint(httpd.endpoint_path)
+    url = "https://site{}.example/watch/benchmark".format(STAND_IN_EXTRACTOR_COUNT - 1)
+
+    # The service warms the daemon up once when it starts
+    resolver_daemon.warm_up(youtube_dl_cls, {})
+    results = [resolver_daemon.resolve_remote(url, {}, endpoint=endpoint) for _ in range(3)]
+
+    assert [result["id"] for result in results] == ["benchmark"] * 3
+    assert len(created) == 1
+
+
+def _js_runtime_ydl_opts(monkeypatch, runtime_mode):
+    from core import deno_manager
+    from core.addon_params import build_ydl_opts, resolve_js_runtime_opts
+
+    monkeypatch.setattr(deno_manager, "_find_in_addon_data", lambda: "/addon/deno")
+    monkeypatch.setattr(deno_manager, "_get_installed_version", lambda: "v-test")
+    monkeypatch.setattr(deno_manager, "_find_in_path", lambda: None)
+    settings = {"js_runtime_mode": runtime_mode, "quickjs_path": "/usr/bin/qjs", "deno_autodownload": "false"}
+    js_runtime_opts = resolve_js_runtime_opts(
+        None,
+        lambda _handle, name: settings.get(name, ""),
+        deno_manager.get_ydl_opts,
+        path_exists=lambda _path: True,
+        is_executable=lambda _path, _flag: True,
+    )
+    return build_ydl_opts({}, js_runtime_opts)
+
+
+@pytest.mark.parametrize("runtime_mode", ["deno", "quickjs"])
+def test_daemon_resolves_with_js_runtime_opts(counting_daemon, monkeypatch, runtime_mode):
+    youtube_dl_cls, httpd, created = counting_daemon
+    endpoint = resolver_daemon.read_endpoint(httpd.endpoint_path)
+    ydl_opts = _js_runtime_ydl_opts(monkeypatch, runtime_mode)
+    assert ydl_opts["remote_components"] == {"ejs:github"}
+
+    resolver_daemon.warm_up(youtube_dl_cls, ydl_opts)
+    result = resolver_daemon.resolve_remote("https://site3.example/abc", ydl_opts, endpoint=endpoint)
+
+    assert result["id"] == "abc"
+    assert len(created) == 1
+    assert created[0].params["remote_components"] == {"ejs:github"}
+    assert created[0].params["js_runtimes"] == ydl_opts["js_runtimes"]
+
+
+def test_ydl_opts_encoding_round_trips_sets():
+    ydl_opts = {"remote_components": {"ejs:github", "ejs:npm"}, "nested": [{"a": frozenset()}], "n": 1}
+
+    encoded = resolver_daemon.encode_ydl_opts(ydl_opts)
+
+    assert encoded["remote_components"] == {"__set__": ["ejs:github", "ejs:npm"]}
+    assert resolver_daemon.decode_ydl_opts(json.loads(json.dumps(encoded))) == {
+        "remote_components": {"ejs:github", "ejs:npm"},
+        "nested": [{"a": set()}],
+        "n": 1,
+    }
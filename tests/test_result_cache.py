@@ -0,0 +1,170 @@
+from decimal import Decimal
+
+from core import result_cache
+from core.persistent_cache import PersistentLRUCache
+
+
+class FakeClock:
+    def __init__(self, now=1000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _result(expire=None, **extra):
+    query = "?expire={}".format(expire) if expire is not None else ""
+    result = {
+        'id': 'abc',
+        'title': 'Video',
+        'duration': 60,
+        'formats': [
+            {
+                'format_id': '137',
+                'url': 'https://cdn.example/video' + query,
+                'vcodec': 'avc1',
+                'acodec': 'none',
+                'height': 1080,
+                'fragments': [{'url': 'x'}] * 3,
+                'downloader_options': {'http_chunk_size': 1},
+            },
+        ],
+        'automatic_captions': {'en': [{'url': 'https://cdn.example/captions'}]},
+        'heatmap': [{'start_time': 0}],
+    }
+    result.update(extra)
+    return result
+
+
+def _cache(tmp_path, clock):
+    return PersistentLRUCache(str(tmp_path / "results.json"), max_entries=5, ttl_seconds=60, clock=clock)
+
+
+def test_normalize_url_ignores_case_fragment_default_port_and_query_order():
+    assert result_cache.normalize_url(" HTTPS://WWW.Example.com:443/watch?v=1&a=2#t=10 ") == (
+        "https://www.example.com/watch?a=2&v=1"
+    )
+    assert result_cache.normalize_url("https://example.com") == "https://example.com/"
+
+
+def test_cache_key_depends_on_effective_ydl_opts():
+    base = {'format': 'best', 'noplaylist': True}
+
+    assert result_cache.result_cache_key("https://a/b", base) == result_cache.result_cache_key(
+        "https://a/b", {'noplaylist': True, 'format': 'best'}
+    )
+    assert result_cache.result_cache_key("https://a/b", base) != result_cache.result_cache_key(
+        "https://a/b", dict(base, format='worst')
+    )
+    # Sets count by their contents, other non JSON values by their repr
+    assert result_cache.ydl_opts_fingerprint({'c': {'a', 'b'}}) == result_cache.ydl_opts_fingerprint(
+        {'c': {'b', 'a'}}
+    )
+    assert result_cache.ydl_opts_fingerprint({'c': {'a'}}) != result_cache.ydl_opts_fingerprint({'c': {'b'}})
+    assert result_cache.ydl_opts_fingerprint({'c': Decimal('1')}) != result_cache.ydl_opts_fingerprint(
+        {'c': Decimal('2')}
+    )
+
+
+def test_compact_result_keeps_only_playback_fields():
+    compact = result_cache.compact_result(_result())
+
+    assert 'automatic_captions' not in compact
+    assert 'heatmap' not in compact
+    assert compact['formats'] == [
+        {
+            'format_id': '137',
+            'url': 'https://cdn.example/video',
+            'vcodec': 'avc1',
+            'acodec': 'none',
+            'height': 1080,
+        },
+    ]
+
+
+def test_result_ttl_ends_before_earliest_signed_url_expiry():
+    margin = result_cache.RESULT_CACHE_EXPIRY_MARGIN_SECONDS
+    result = _result(expire=1000 + margin + 300)
+    result['formats'].append({'format_id': '140', 'url': 'https://cdn.example/expire/9999999999/audio'})
+
+    assert result_cache.result_ttl_seconds(result, now=1000) == 300
+    assert result_cache.result_ttl_seconds(_result(expire=1000 + margin), now=1000) == 0
+    assert result_cache.result_ttl_seconds(_result(expire=10 ** 10), now=1000) == (
+        result_cache.RESULT_CACHE_MAX_TTL_SECONDS
+    )
+    assert result_cache.result_ttl_seconds(_result(), now=1000) == result_cache.RESULT_CACHE_DEFAULT_TTL_SECONDS
+
+
+def test_store_result_skips_playlists_live_streams_downloads_and_expiring_urls(tmp_path):
+    clock = FakeClock()
+    cache = _cache(tmp_path, clock)
+
+    assert result_cache.store_result("https://a/1", {}, {'entries': []}, cache=cache, now=clock.now) is False
+    assert result_cache.store_result("https://a/2", {}, _result(is_live=True), cache=cache, now=clock.now) is False
+    assert result_cache.store_result(
+        "https://a/3", {}, _result(_filename='/tmp/video.mp4'), cache=cache, now=clock.now
+    ) is False
+    assert result_cache.store_result("https://a/4", {}, _result(expire=1001), cache=cache, now=clock.now) is False
+    assert len(cache) == 0
+
+
+def test_cached_result_round_trips_until_ttl(tmp_path):
+    clock = FakeClock()
+    opts = {'format': 'best'}
+    expire = clock.now + result_cache.RESULT_CACHE_EXPIRY_MARGIN_SECONDS + 120
+
+    assert result_cache.store_result(
+        "https://example.com/watch?v=1", opts, _result(expire=expire), cache=_cache(tmp_path, clock), now=clock.now
+    ) is True
+
+    reloaded = _cache(tmp_path, clock)
+    cached = result_cache.get_cached_result("https://EXAMPLE.com/watch?v=1#t=3", opts, cache=reloaded)
+    assert cached['title'] == 'Video'
+    assert cached['formats'][0]['format_id'] == '137'
+    assert result_cache.get_cached_result("https://example.com/watch?v=1", {'format': 'worst'}, cache=reloaded) is None
+
+    clock.now += 121
+    assert result_cache.get_cached_result("https://example.com/watch?v=1", opts, cache=reloaded) is None
+
+
+def test_cached_result_selects_the_same_format_as_a_fresh_one(tmp_path):
+    from core.format_ranking import build_format_scorers, filter_decodable, parse_decode_profile, rank_formats
+    from core.playback_selection import pick_best_dash_video_format
+
+    def video(format_id, vcodec, width, fps, dynamic_range, tbr, ext):
+        return {
+            'format_id': format_id,
+            'url': 'https://cdn.example/' + format_id,
+            'vcodec': vcodec,
+            'acodec': 'none',
+            'width': width,
+            'height': width * 9 // 16,
+            'fps': fps,
+            'dynamic_range': dynamic_range,
+            'tbr': tbr,
+            'ext': ext,
+            'fragments': [{'url': 'x'}],
+        }
+
+    fresh = _result(formats=[
+        video('sdr', 'vp09.00.40.08', 1920, 30, 'SDR', 3000, 'webm'),
+        video('hdr', 'vp09.02.40.10', 1920, 30, 'HDR10', 3000, 'webm'),
+        video('avc', 'avc1.640028', 1920, 60, 'SDR', 4000, 'mp4'),
+        video('av1', 'av01.0.08M.08', 3840, 30, 'SDR', 9000, 'mp4'),
+    ])
+    cache = _cache(tmp_path, FakeClock())
+    assert result_cache.store_result("https://a/b", {}, fresh, cache=cache)
+    cached = result_cache.get_cached_result("https://a/b", {}, cache=cache)
+
+    scorers = build_format_scorers({
+        'codec_preference': ('vp9', 'avc1'),
+        'max_bitrate': 8000,
+        'prefer_high_fps': False,
+        'prefer_hdr': True,
+        'container_preference': ('webm',),
+    })
+    decode_profile = parse_decode_profile('av01:0')
+    for result in (fresh, cached):
+        formats = filter_decodable(result['formats'], decode_profile)
+        assert [f['format_id'] for f in rank_formats(formats, scorers)] == ['hdr', 'sdr', 'avc']
+        assert pick_best_dash_video_format(formats, 1920, scorers)['format_id'] == 'hdr'
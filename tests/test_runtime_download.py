@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core import runtime_download
+
+
+class FlakyReleaseServer(ThreadingHTTPServer):
+    """Serves one payload with Range/If-Range support and can cut transfers short."""
+
+    def __init__(self, payload, drop_after=None, drops=0, etag='"v1"'):
+        self.payload = payload
+        self.drop_after = drop_after
+        self.drops = drops
+        self.etag = etag
+        self.requests = []
+        super().__init__(("127.0.0.1", 0), FlakyHandler)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/deno.zip".format(self.server_address[1])
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    def log_message(self, _format, *_args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        server.requests.append({"range": range_header, "if_range": if_range})
+
+        start = 0
+        if range_header and (if_range is None or if_range == server.etag):
+            start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            if start >= len(server.payload):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        body = server.payload[start:]
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        if start:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(server.payload) - 1, len(server.payload)))
+        self.end_headers()
+
+        if server.drops > 0 and server.drop_after is not None:
+            server.drops -= 1
+            self.wfile.write(body[:server.drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    monkeypatch.setattr(runtime_download, "RUNTIME_DOWNLOAD_RETRY_DELAY_SECONDS", 0)
+    servers = []
+
+    def start(payload, **kwargs):
+        server = FlakyReleaseServer(payload, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_download_file_resumes_after_dropped_connections(serve, tmp_path):
+    payload = os.urandom(1024 * 1024)
+    server = serve(payload, drop_after=300 * 1024, drops=3)
+    dest = str(tmp_path / "deno.zip")
+    progress = []
+
+    runtime_download.download_file(
+        server.url,
+        dest,
+        expected_sha256=hashlib.sha256(payload).hexdigest(),
+        on_progress=lambda downloaded, total: progress.append((downloaded, total)),
+    )
+
+    with open(dest, "rb") as f:
+        assert f.read() == payload
+    assert [request["range"] for request in server.requests] == [
+        None,
+        "bytes=307200-",
+        "bytes=614400-",
+        "bytes=921600-",
+    ]
+    assert all(request["if_range"] == '"v1"' for request in server.requests[1:])
+    assert progress[-1] == (len(payload), len(payload))
+    assert not os.path.exists(dest + ".part")
+    assert not os.path.exists(dest + ".part.json")
+
+
+def test_download_file_keeps_partial_for_next_install_attempt(serve, tmp_path):
+    payload = os.urandom(256 * 1024)
+    server = serve(payload, drop_after=100 * 1024, drops=1)
+    dest = str(tmp_path / "deno.zip")
+
+    with pytest.raises(runtime_download.IncompleteDownloadError):
+        runtime_download.download_file(server.url, dest, max_attempts=1)
+    assert os.path.getsize(dest + ".part") == 100 * 1024
+
+    runtime_download.download_file(server.url, dest, expected_sha256=hashlib.sha256(payload).hexdigest())
+
+    assert server.requests[-1]["range"] == "bytes=102400-"
+    with open(dest, "rb") as f:
+        assert f.read() == payload
+
+
+def test_download_file_restarts_when_the_release_changed(serve, tmp_path):
+    old_payload = os.urandom(64 * 1024)
+    dest = str(tmp_path / "deno.zip")
+    server = serve(old_payload, drop_after=10 * 1024, drops=1)
+    with pytest.raises(runtime_download.IncompleteDownloadError):
+        runtime_download.download_file(server.url, dest, max_attempts=1)
+
+    # The asset was replaced: If-Range no longer matches, so the server sends it whole
+    new_payload = os.urandom(64 * 1024)
+    server.payload = new_payload
+    server.etag = '"v2"'
+    runtime_download.download_file(server.url, dest, expected_sha256=hashlib.sha256(new_payload).hexdigest())
+
+    assert server.requests[-1] == {"range": "bytes=10240-", "if_range": '"v1"'}
+    with open(dest, "rb") as f:
+        assert f.read() == new_payload
+
+
+def test_download_file_rejects_checksum_mismatch_and_discards_data(serve, tmp_path):
+    server = serve(b"tampered")
+    dest = str(tmp_path / "deno.zip")
+
+    with pytest.raises(runtime_download.ChecksumMismatchError):
+        runtime_download.download_file(server.url, dest, expected_sha256="0" * 64)
+
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_download_file_does_not_retry_client_errors(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_urlopen(request, timeout=None):
+        calls.append(request.full_url)
+        raise urllib.error.HTTPError(request.full_url, 404, "Not Found", {}, None)
+
+    monkeypatch.setattr(runtime_download.urllib.request, "urlopen", fake_urlopen)
+
+    with pytest.raises(urllib.error.HTTPError):
+        runtime_download.download_file("https://example.com/missing.zip", str(tmp_path / "missing.zip"))
+    assert len(calls) == 1
+
+
+def test_parse_sha256sums_handles_release_checksum_formats():
+    digest_a = "a" * 64
+    digest_b = "B" * 64
+    sums = "{}  yt-dlp\n{} *yt-dlp.tar.gz\n".format(digest_a, digest_b)
+
+    assert runtime_download.parse_sha256sums(sums, "yt-dlp.tar.gz") == "b" * 64
+    assert runtime_download.parse_sha256sums(sums, "yt-dlp.exe") is None
+    # Deno's per-asset file carries a single hash, sometimes without a name
+    assert runtime_download.parse_sha256sums(digest_a + "\n", "deno-x86_64-unknown-linux-gnu.zip") == digest_a
@@ -0,0 +1,192 @@
+import threading
+
+import pytest
+
+from core import ydl_pool
+
+
+class FakeYoutubeDL:
+    created = []
+
+    def __init__(self, opts, auto_init=True):
+        self.opts = opts
+        self.extractors_added = False
+        self.closed = False
+        FakeYoutubeDL.created.append(self)
+
+    def add_default_info_extractors(self):
+        self.extractors_added = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_pooled_youtube_dl_reuses_instances_per_option_set():
+    ydl_pool.clear_ydl_pool()
+    FakeYoutubeDL.created = []
+
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'format': 'best'}) as first:
+        assert first.extractors_added
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'format': 'best'}) as second:
+        pass
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'format': 'worst'}) as other:
+        pass
+
+    assert second is first
+    assert other is not first
+    assert ydl_pool.get_ydl_pool_stats() == {'option_sets': 2, 'idle_instances': 2}
+    ydl_pool.clear_ydl_pool()
+    assert first.closed and other.closed
+
+
+def test_pooled_youtube_dl_hands_out_an_instance_to_one_caller_at_a_time():
+    ydl_pool.clear_ydl_pool()
+
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {}) as outer:
+        with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {}) as inner:
+            assert inner is not outer
+
+    assert ydl_pool.get_ydl_pool_stats()['idle_instances'] == 2
+    ydl_pool.clear_ydl_pool()
+
+
+def test_pool_is_bounded_and_closes_discarded_instances(monkeypatch):
+    ydl_pool.clear_ydl_pool()
+    monkeypatch.setattr(ydl_pool, "YDL_POOL_MAX_OPTION_SETS", 2)
+    monkeypatch.setattr(ydl_pool, "YDL_POOL_MAX_IDLE_PER_OPTION_SET", 1)
+    FakeYoutubeDL.created = []
+
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'a': 1}):
+        with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'a': 1}):
+            pass
+    for opts in ({'b': 1}, {'c': 1}):
+        with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, opts):
+            pass
+
+    assert ydl_pool.get_ydl_pool_stats() == {'option_sets': 2, 'idle_instances': 2}
+    # One surplus instance for {'a': 1} plus the evicted {'a': 1} option set
+    assert [ydl.closed for ydl in FakeYoutubeDL.created] == [True, True, False, False]
+    ydl_pool.clear_ydl_pool()
+
+
+def test_url_pools_route_extractors_per_host_and_reuse_adopted_instances(monkeypatch):
+    ydl_pool.clear_ydl_pool()
+    created_for = []
+
+    def create_youtube_dl(youtube_dl_cls, ydl_opts, url):
+        created_for.append(url)
+        return youtube_dl_cls(ydl_opts, auto_init=False), True
+
+    monkeypatch.setattr(ydl_pool, "create_youtube_dl", create_youtube_dl)
+    live = FakeYoutubeDL({'format': 'best'})
+    ydl_pool.adopt_youtube_dl(FakeYoutubeDL, {'format': 'best'}, "https://www.youtube.com/watch?v=1", live)
+
+    # A refresh of the same host reuses the instance that resolved the video
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'format': 'best'}, "https://www.youtube.com/watch?v=2") as ydl:
+        assert ydl is live
+    with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {'format': 'best'}, "https://vimeo.com/1") as other:
+        assert other is not live
+
+    assert created_for == ["https://vimeo.com/1"]
+    ydl_pool.clear_ydl_pool()
+
+
+def test_concurrent_refreshes_never_share_an_instance():
+    ydl_pool.clear_ydl_pool()
+    url = "https://www.youtube.com/watch?v=1"
+    barrier = threading.Barrier(4)
+    in_use = []
+    lock = threading.Lock()
+    overlaps = []
+
+    def refresh():
+        with ydl_pool.pooled_youtube_dl(FakeYoutubeDL, {}, url) as ydl:
+            with lock:
+                overlaps.append(ydl in in_use)
+                in_use.append(ydl)
+            barrier.wait(5)
+            with lock:
+                in_use.remove(ydl)
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert overlaps == [False] * 4
+    # Only YDL_POOL_MAX_IDLE_PER_OPTION_SET instances stay warm afterwards
+    assert ydl_pool.get_ydl_pool_stats()['idle_instances'] == ydl_pool.YDL_POOL_MAX_IDLE_PER_OPTION_SET
+    ydl_pool.clear_ydl_pool()
+
+
+def test_pooled_extract_info_retries_with_all_extractors_when_routing_fails(monkeypatch):
+    ydl_pool.clear_ydl_pool()
+
+    class HandOffYoutubeDL(FakeYoutubeDL):
+        def extract_info(self, url, download=True):
+            # The routed extractor hands off to a site only the full set covers
+            if not self.extractors_added:
+                raise ValueError("Unsupported URL: https://player.other.example/1")
+            return {'id': url.rsplit('/', 1)[-1]}
+
+    monkeypatch.setattr(
+        ydl_pool,
+        "create_youtube_dl",
+        lambda youtube_dl_cls, ydl_opts, url: (youtube_dl_cls(ydl_opts, auto_init=False), True),
+    )
+
+    assert ydl_pool.pooled_extract_info(HandOffYoutubeDL, {}, "https://embed.example/1") == {'id': '1'}
+    assert ydl_pool.pooled_extract_info(HandOffYoutubeDL, {}, "https://embed.example/2") == {'id': '2'}
+    # The routed and the all-extractors instance both stay warm
+    assert ydl_pool.get_ydl_pool_stats() == {'option_sets': 2, 'idle_instances': 2}
+    ydl_pool.clear_ydl_pool()
+
+
+def test_pooled_extract_info_does_not_retry_when_all_extractors_were_loaded(monkeypatch):
+    ydl_pool.clear_ydl_pool()
+    calls = []
+
+    class FailingYoutubeDL(FakeYoutubeDL):
+        def extract_info(self, url, download=True):
+            calls.append(url)
+            raise ValueError("Video unavailable")
+
+    # No route in the extractor index: the instance has every extractor
+    monkeypatch.setattr(
+        ydl_pool,
+        "create_youtube_dl",
+        lambda youtube_dl_cls, ydl_opts, url: (youtube_dl_cls(ydl_opts), False),
+    )
+
+    with pytest.raises(ValueError, match="Video unavailable"):
+        ydl_pool.pooled_extract_info(FailingYoutubeDL, {}, "https://unrouted.example/1")
+    assert calls == ["https://unrouted.example/1"]
+    ydl_pool.clear_ydl_pool()
+
+
+def test_refresh_reuses_an_instance_adopted_under_the_refresh_url(monkeypatch):
+    ydl_pool.clear_ydl_pool()
+    created_for = []
+
+    class ResolvingYoutubeDL(FakeYoutubeDL):
+        def extract_info(self, url, download=True):
+            return {'id': url.rsplit('=', 1)[-1]}
+
+    def create_youtube_dl(youtube_dl_cls, ydl_opts, url):
+        created_for.append(url)
+        return youtube_dl_cls(ydl_opts, auto_init=False), True
+
+    monkeypatch.setattr(ydl_pool, "create_youtube_dl", create_youtube_dl)
+    # The plugin resolved https://youtu.be/1 with an instance that has every
+    # extractor and adopts it under the result's webpage_url
+    live = ResolvingYoutubeDL({})
+    live.add_default_info_extractors()
+    ydl_pool.adopt_youtube_dl(ResolvingYoutubeDL, {}, "https://www.youtube.com/watch?v=1", live, targeted=False)
+
+    assert ydl_pool.pooled_extract_info(ResolvingYoutubeDL, {}, "https://www.youtube.com/watch?v=1") == {'id': '1'}
+    assert created_for == []
+    with ydl_pool.pooled_youtube_dl(ResolvingYoutubeDL, {}, "https://www.youtube.com/watch?v=1") as ydl:
+        assert ydl is live
+    ydl_pool.clear_ydl_pool()
+    assert live.closed
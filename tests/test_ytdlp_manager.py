@@ -1,3 +1,4 @@
+import hashlib
 import io
 import os
 import sys
@@ -398,3 +399,276 @@ def test_resolve_latest_version_handles_429_with_retry_after(monkeypatch, tmp_pa
     assert state["consecutive_failures"] == 1
     assert state["cooldown_until"] == 1120
     assert state["next_check_at"] == 1120
+
+
+def _write_large_tarball(path, payload_bytes, root_name="yt-dlp-big"):
+    # Incompressible payload so the archive on the wire is as large as the files
+    with tarfile.open(str(path), mode="w:gz", compresslevel=1) as tf:
+        init_data = b"__version__ = 'big'\n"
+        info = tarfile.TarInfo(name=root_name + "/yt_dlp/__init__.py")
+        info.size = len(init_data)
+        tf.addfile(info, io.BytesIO(init_data))
+
+        chunk_size = 4 * 1024 * 1024
+        for index in range(payload_bytes // chunk_size):
+            data = os.urandom(chunk_size)
+            info = tarfile.TarInfo(name="{}/yt_dlp/extractor/blob_{}.bin".format(root_name, index))
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+        readme = b"not part of the package\n"
+        info = tarfile.TarInfo(name=root_name + "/README.md")
+        info.size = len(readme)
+        tf.addfile(info, io.BytesIO(readme))
+
+
+def _serve_file(path):
+    import threading
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, _format, *_args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(path.parent)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}/{}".format(server.server_address[1], path.name)
+
+
+def test_download_and_install_streams_large_tarball_under_memory_ceiling(monkeypatch, tmp_path, record_property):
+    import tracemalloc
+
+    payload_bytes = 32 * 1024 * 1024
+    archive = tmp_path / "served" / "big.tar.gz"
+    archive.parent.mkdir()
+    _write_large_tarball(archive, payload_bytes)
+
+    with open(str(archive), "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    (archive.parent / "SHA2-256SUMS").write_text("{}  {}\n".format(digest, ytdlp_manager._TARBALL_NAME))
+
+    server, url = _serve_file(archive)
+    monkeypatch.setattr(ytdlp_manager, "_TARBALL_URL", url)
+    monkeypatch.setattr(ytdlp_manager, "_CHECKSUMS_URL", url.rsplit("/", 1)[0] + "/SHA2-256SUMS")
+    monkeypatch.setattr(ytdlp_manager, "_addon_data_dir", lambda: str(tmp_path / "ytdlp"))
+    try:
+        tracemalloc.start()
+        try:
+            runtime_path = ytdlp_manager._download_and_install("2026.01.01")
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    record_property("ytdlp_install_archive_bytes", os.path.getsize(str(archive)))
+    record_property("ytdlp_install_peak_traced_bytes", peak)
+
+    assert os.path.isfile(os.path.join(runtime_path, "yt_dlp", "__init__.py"))
+    assert os.path.getsize(os.path.join(runtime_path, "yt_dlp", "extractor", "blob_7.bin")) == 4 * 1024 * 1024
+    assert not os.path.exists(os.path.join(runtime_path, "README.md"))
+    assert not os.path.exists(runtime_path + ".tmp")
+    assert os.listdir(os.path.dirname(runtime_path)) == ["2026.01.01"]
+    assert ytdlp_manager._read_installed_version() == "2026.01.01"
+    # The whole-archive approach peaked at roughly three times the archive size
+    assert peak < 2 * 1024 * 1024
+
+
+def test_extract_yt_dlp_from_tarball_skips_links_and_cleans_up_on_error(tmp_path):
+    buff = io.BytesIO()
+    with tarfile.open(fileobj=buff, mode="w:gz") as tf:
+        link = tarfile.TarInfo(name="yt-dlp-x/yt_dlp/evil")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        tf.addfile(link)
+    destination = tmp_path / "versions" / "x"
+
+    with pytest.raises(RuntimeError):
+        ytdlp_manager._extract_yt_dlp_from_tarball(buff.getvalue(), str(destination))
+
+    assert not os.path.exists(str(destination) + ".tmp")
+    assert not os.path.exists(str(destination))
+
+
+def _write_standin_runtime(runtime_path, module_count=300):
+    # A yt_dlp stand-in whose import, like yt-dlp's, pulls in hundreds of modules
+    package = runtime_path / "yt_dlp"
+    extractor = package / "extractor"
+    extractor.mkdir(parents=True)
+    body = "".join(
+        "def helper_{0}(value):\n    return [value * {0} + i for i in range(10) if i % 2]\n\n".format(i)
+        for i in range(40)
+    )
+    for index in range(module_count):
+        (extractor / "site_{}.py".format(index)).write_text(
+            "class Site{0}IE(object):\n    _VALID_URL = r'https?://site{0}\\.example/'\n\n{1}".format(index, body)
+        )
+    (extractor / "__init__.py").write_text(
+        "".join("from .site_{0} import Site{0}IE\n".format(index) for index in range(module_count))
+    )
+    (package / "__init__.py").write_text("from . import extractor\n__version__ = 'standin'\n")
+
+
+def test_compiled_runtime_imports_from_bytecode(tmp_path, record_property):
+    import importlib.util
+
+    runtime_path = tmp_path / "versions" / "standin"
+    _write_standin_runtime(runtime_path)
+
+    source = _import_profile(runtime_path)
+    assert not list(runtime_path.rglob("*.pyc"))
+
+    assert ytdlp_manager.compile_runtime_bytecode(str(runtime_path)) is True
+    compiled = _import_profile(runtime_path)
+
+    record_property("ytdlp_first_import_source_ms", round(source["seconds"] * 1000, 1))
+    record_property("ytdlp_first_import_compiled_ms", round(compiled["seconds"] * 1000, 1))
+    assert ytdlp_manager.runtime_bytecode_is_current(str(runtime_path))
+    for module_path in runtime_path.rglob("*.py"):
+        assert os.path.isfile(importlib.util.cache_from_source(str(module_path)))
+    # Every module is compiled on import without bytecode, none with it
+    assert source["compiles"] == 302
+    assert compiled["compiles"] == 0
+
+
+def test_ensure_runtime_bytecode_recompiles_after_python_change(tmp_path):
+    runtime_path = tmp_path / "versions" / "standin"
+    _write_standin_runtime(runtime_path, module_count=3)
+
+    assert ytdlp_manager.ensure_runtime_bytecode(str(runtime_path)) is True
+    assert ytdlp_manager.ensure_runtime_bytecode(str(runtime_path)) is None
+
+    # A marker from another interpreter (e.g. before a Kodi upgrade) is stale
+    (runtime_path / "bytecode.json").write_text(json.dumps({"cache_tag": "cpython-00"}))
+    assert not ytdlp_manager.runtime_bytecode_is_current(str(runtime_path))
+
+    assert ytdlp_manager.ensure_runtime_bytecode(str(runtime_path)) is True
+    assert ytdlp_manager.runtime_bytecode_is_current(str(runtime_path))
+
+
+def test_compile_runtime_bytecode_ignores_missing_runtime(tmp_path):
+    assert ytdlp_manager.compile_runtime_bytecode(str(tmp_path / "missing")) is False
+    assert not (tmp_path / "missing").exists()
+
+
+def _import_profile(import_path):
+    import subprocess
+
+    # Counts opens, distinct files opened and source compiles (audit hook) and
+    # read()/write() syscalls (Linux /proc/self/io) during the import
+    code = (
+        "import sys, time, json\n"
+        "opens = []\n"
+        "compiles = [0]\n"
+        "def hook(event, args):\n"
+        "    if event == 'open' and not str(args[0]).startswith('/proc/'):\n"
+        "        opens.append(str(args[0]))\n"
+        "    elif event == 'compile':\n"
+        "        compiles[0] += 1\n"
+        "def syscalls():\n"
+        "    try:\n"
+        "        with open('/proc/self/io') as f:\n"
+        "            fields = dict(line.split(': ') for line in f.read().splitlines())\n"
+        "        return int(fields['syscr']) + int(fields['syscw'])\n"
+        "    except Exception:\n"
+        "        return None\n"
+        "sys.path.insert(0, {!r})\n"
+        "before = syscalls()\n"
+        "sys.addaudithook(hook)\n"
+        "started = time.perf_counter()\n"
+        "import yt_dlp\n"
+        "seconds = time.perf_counter() - started\n"
+        "after = syscalls()\n"
+        "print(json.dumps({{'seconds': seconds, 'opens': len(opens), 'files': len(set(opens)),\n"
+        "    'compiles': compiles[0], 'loader': type(yt_dlp.__loader__).__name__,\n"
+        "    'file': yt_dlp.__file__,\n"
+        "    'syscalls': None if before is None else after - before}}))\n"
+    ).format(str(import_path))
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    samples = [
+        json.loads(subprocess.check_output([sys.executable, "-c", code], env=env).decode())
+        for _ in range(3)
+    ]
+    return min(samples, key=lambda sample: sample["seconds"])
+
+
+def test_zip_runtime_benchmark_against_directory_layout(tmp_path, record_property):
+    runtime_path = tmp_path / "versions" / "standin"
+    _write_standin_runtime(runtime_path)
+    source = _import_profile(runtime_path)
+    assert ytdlp_manager.compile_runtime_bytecode(str(runtime_path)) is True
+    assert ytdlp_manager.pack_runtime_zip(str(runtime_path)) is True
+    zip_path = ytdlp_manager.runtime_zip_path(str(runtime_path))
+
+    compiled = _import_profile(runtime_path)
+    packed = _import_profile(zip_path)
+
+    for layout, profile in (("source", source), ("directory", compiled), ("zip", packed)):
+        record_property("ytdlp_import_{}_ms".format(layout), round(profile["seconds"] * 1000, 1))
+        record_property("ytdlp_import_{}_opens".format(layout), profile["opens"])
+        record_property("ytdlp_import_{}_files".format(layout), profile["files"])
+        record_property("ytdlp_import_{}_syscalls".format(layout), profile["syscalls"])
+    assert packed["file"].startswith(zip_path)
+    assert packed["loader"] == "zipimporter"
+    assert compiled["loader"] == "SourceFileLoader"
+    # zipimport reopens the archive per module, but never touches another file
+    assert packed["files"] == 1
+    assert compiled["files"] > 300
+    # The packed bytecode is used; nothing is compiled from source
+    assert packed["compiles"] == 0
+
+
+def test_pack_runtime_zip_replaces_zip_of_other_interpreter(tmp_path):
+    runtime_path = tmp_path / "versions" / "standin"
+    _write_standin_runtime(runtime_path, module_count=3)
+    (runtime_path / "yt_dlp" / "options.json").write_text("{}")
+    stale_zip = runtime_path / "yt_dlp-cpython-00.zip"
+    stale_zip.write_bytes(b"")
+
+    assert ytdlp_manager.pack_runtime_zip(str(runtime_path)) is True
+
+    zip_path = ytdlp_manager.runtime_zip_path(str(runtime_path))
+    assert sorted(path.name for path in runtime_path.glob("*.zip")) == [os.path.basename(zip_path)]
+    assert not list(runtime_path.glob("*.tmp"))
+    import zipfile
+
+    with zipfile.ZipFile(zip_path) as archive:
+        names = set(archive.namelist())
+    assert {"yt_dlp/__init__.py", "yt_dlp/__init__.pyc", "yt_dlp/options.json"} <= names
+    assert "yt_dlp/extractor/site_2.pyc" in names
+
+
+def test_activate_runtime_uses_zip_when_packed(tmp_path, monkeypatch):
+    runtime_path = tmp_path / "versions" / "standin"
+    _write_standin_runtime(runtime_path, module_count=3)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+
+    # Not packed yet: this run imports from the directory and packs nothing
+    ytdlp_manager.activate_runtime(str(runtime_path), zip_runtime=True)
+    assert sys.path[0] == str(runtime_path)
+    assert not list(runtime_path.glob("*.zip"))
+
+    assert ytdlp_manager.ensure_runtime_zip(str(runtime_path)) is True
+    assert ytdlp_manager.ensure_runtime_zip(str(runtime_path)) is None
+    ytdlp_manager.activate_runtime(str(runtime_path), zip_runtime=True)
+    assert sys.path[0] == ytdlp_manager.runtime_zip_path(str(runtime_path))
+
+
+def test_activate_runtime_ignores_a_truncated_zip(tmp_path, monkeypatch):
+    runtime_path = tmp_path / "versions" / "standin"
+    _write_standin_runtime(runtime_path, module_count=3)
+    assert ytdlp_manager.pack_runtime_zip(str(runtime_path)) is True
+    zip_path = ytdlp_manager.runtime_zip_path(str(runtime_path))
+    with open(zip_path, "rb") as f:
+        data = f.read()
+    with open(zip_path, "wb") as f:
+        f.write(data[: len(data) // 2])
+    monkeypatch.setattr(sys, "path", list(sys.path))
+
+    ytdlp_manager.activate_runtime(str(runtime_path), zip_runtime=True)
+
+    assert sys.path[0] == str(runtime_path)
+    assert ytdlp_manager.ensure_runtime_zip(str(runtime_path)) is True
+    assert ytdlp_manager.runtime_zip_is_current(str(runtime_path))